@@ -46,6 +46,7 @@ MIDDLEWARE = [
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    'ExamGeneratorApp.middleware.RenderBusyMiddleware',
 ]
 
 X_FRAME_OPTIONS = 'SAMEORIGIN'
@@ -128,4 +129,127 @@ MEDIA_ROOT = os.path.join(BASE_DIR, 'ExamGenerator/media')
 
 MEDIA_URL = '/media/'
 
+# Media files are sent by Django after the permission check unless this is set. With 'x-accel-redirect' nginx sends
+# them from an internal location, e.g.
+#     location /protected-media/ { internal; alias /path/to/MEDIA_ROOT/; }
+# with 'x-sendfile' Apache with mod_xsendfile or lighttpd send them
+MEDIA_SENDFILE = None
+
+MEDIA_SENDFILE_PREFIX = '/protected-media/'
+
 LOGIN_REDIRECT_URL = 'index'
+
+# Compiler documents are rendered with unless their header selects one: 'pdflatex', 'lualatex', 'xelatex', 'latexmk'
+# or 'fake'. The fake compiler writes a tiny pdf without running TeX, taking RENDER_FAKE_DELAY seconds per pass.
+# RENDER_FAKE_FAILURE makes it fail with 'error' or 'timeout'
+RENDER_COMPILER = 'pdflatex'
+
+RENDER_FAKE_DELAY = 0
+
+RENDER_FAKE_FAILURE = None
+
+# Render cache. Finished pdflatex renders are stored here, keyed by the document and its dependencies
+RENDER_CACHE_DIR = os.path.join(BASE_DIR, 'render_cache')
+
+RENDER_CACHE_MAX_SIZE = 512 * 1024 * 1024
+
+# Render jobs. If RENDER_ASYNC is True, renders are run by a pool of RENDER_WORKERS workers and pages poll the job
+# status instead of waiting for pdflatex inside the request. Every web process has a pool of its own, so up to
+# RENDER_WORKERS times the number of web processes renders are in progress, of which RENDER_MAX_CONCURRENT compile at
+# a time. Jobs are lost when their process restarts, jobs still unfinished after RENDER_JOB_LOST_AFTER seconds are
+# marked as failed when their page polls them
+RENDER_ASYNC = False
+
+RENDER_WORKERS = os.cpu_count() or 2
+
+RENDER_JOB_LOST_AFTER = 15 * 60
+
+# Changes of a user's exam render it in the background this many seconds after the last change, so the pdf is ready
+# when the exam screen is opened. The last change is recorded in RENDER_SLOT_DIR, so changes arriving at different web
+# processes render once as well. None disables pre-rendering
+RENDER_PRERENDER_DELAY = 2
+
+# Render the exam with and without solutions at the same time on the download page
+DOWNLOAD_PARALLEL_RENDER = True
+
+# Every render gets a directory of its own in here. Finished files are published to the user's temp folder
+RENDER_WORK_DIR = os.path.join(BASE_DIR, 'render_work')
+
+# Precompiled formats of header preambles. They are built when a header is saved and used by every render with that
+# header. Building needs the mylatexformat package
+RENDER_FORMATS = True
+
+RENDER_FORMAT_DIR = os.path.join(BASE_DIR, 'render_formats')
+
+RENDER_FORMAT_MAX_COUNT = 50
+
+RENDER_FORMAT_TIMEOUT = 60
+
+# a preamble whose format could not be built is rendered without format for this many seconds, then building it is
+# tried again
+RENDER_FORMAT_RETRY_AFTER = 24 * 60 * 60
+
+# pdflatex is rerun until the auxiliary files stop changing, at most this often. The auxiliary files of every user's
+# documents are kept in RENDER_AUX_DIR, so the next render of a document starts with them
+RENDER_MAX_PASSES = 4
+
+RENDER_AUX_DIR = os.path.join(BASE_DIR, 'render_aux')
+
+# Admission control. At most RENDER_MAX_CONCURRENT pdflatex processes run on this machine, RENDER_MAX_WAITING more
+# renders wait up to RENDER_QUEUE_TIMEOUT seconds for a slot. Other renders are answered with 503 and Retry-After
+# The directory also records the newest render of every user's exam, download and previews, so a newer render stops
+# an older one in any process of this machine, see cancellation.py. It has to be shared by all web processes
+RENDER_SLOT_DIR = os.path.join(BASE_DIR, 'render_slots')
+
+RENDER_MAX_CONCURRENT = os.cpu_count() or 2
+
+RENDER_MAX_WAITING = 2 * RENDER_MAX_CONCURRENT
+
+RENDER_QUEUE_TIMEOUT = 15
+
+RENDER_RETRY_AFTER = 10
+
+# Render server, see the render_server command. If RENDER_SERVER_SOCKET is set, documents are compiled by the server
+# listening on it instead of the web process. RENDER_SERVER_WORKERS processes compile, each one is replaced after
+# RENDER_SERVER_MAX_JOBS documents. Only the user running the server can connect to the socket, so the web processes
+# have to run as the same user
+RENDER_SERVER_SOCKET = None
+
+RENDER_SERVER_WORKERS = RENDER_MAX_CONCURRENT
+
+RENDER_SERVER_MAX_JOBS = 100
+
+# Limits of every pdflatex process: CPU time in seconds and address space in bytes. None disables a limit
+RENDER_CPU_LIMIT = 30
+
+RENDER_MEMORY_LIMIT = 1024 * 1024 * 1024
+
+# The render log page shows the summary of the log and at most this many bytes of the log itself
+RENDER_LOG_DISPLAY_SIZE = 256 * 1024
+
+# Exercise lists show the first page of every exercise as a png of this width, made by pdftoppm within the timeout
+RENDER_THUMBNAIL_WIDTH = 800
+
+RENDER_THUMBNAIL_TIMEOUT = 10
+
+# Every render writes one JSON line with the time spent in each phase to the ExamGeneratorApp.metrics logger. The
+# same numbers are summed up for prometheus at /metrics. The lines are only printed to the console if
+# RENDER_METRICS_LOG is set, by default with the environment variable of the same name
+RENDER_METRICS_LOG = bool(os.environ.get('RENDER_METRICS_LOG'))
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'handlers': {
+        'console': {
+            'class': 'logging.StreamHandler',
+        },
+    },
+    'loggers': {
+        'ExamGeneratorApp.metrics': {
+            'handlers': ['console'] if RENDER_METRICS_LOG else [],
+            'level': 'INFO',
+            'propagate': False,
+        },
+    },
+}
@@ -1,6 +1,7 @@
 from django.contrib import admin
 
-from .models import Exercise, Exam, Header, ExerciseSolution, ExerciseText, Content, Topic, FileDependency
+from .models import Exercise, Exam, Header, ExerciseSolution, ExerciseText, Content, Topic, FileDependency, RenderJob, \
+    DependencyLink
 
 admin.site.register(Exercise)
 admin.site.register(Exam)
@@ -10,6 +11,8 @@ admin.site.register(ExerciseSolution)
 admin.site.register(Content)
 admin.site.register(Topic)
 admin.site.register(FileDependency)
+admin.site.register(RenderJob)
+admin.site.register(DependencyLink)
 
 #
 # class ExerciseTextAdmin(admin.modelAdmin):
@@ -0,0 +1,146 @@
+import contextlib
+import fcntl
+import os
+import subprocess
+import time
+
+from django.conf import settings
+
+from . import cancellation
+
+# how often a waiting render checks for a free slot, in seconds
+POLL_INTERVAL = 0.05
+
+# how often a running compiler checks whether a render in another process superseded it, in seconds
+CANCEL_POLL_INTERVAL = 0.25
+
+
+class RenderBusy(Exception):
+    """
+    Raised if all render slots are taken and the wait queue is full, or a render waited too long for a slot. Turned
+    into a 503 response by RenderBusyMiddleware.
+    """
+    pass
+
+
+def try_lock_slot(kind, count):
+    """
+    Takes the first free slot of a kind. Slots are files locked with flock, so they are shared by all processes
+    rendering on this machine and released by the kernel if a process dies.
+    :param kind: 'run' or 'wait'
+    :param count: number of slots of this kind
+    :return: the open slot file, which holds the lock until it is closed, or None if all slots are taken
+    """
+    os.makedirs(settings.RENDER_SLOT_DIR, exist_ok=True)
+    for index in range(count):
+        slot_file = open(os.path.join(settings.RENDER_SLOT_DIR, '%s-%d.lock' % (kind, index)), 'w')
+        try:
+            fcntl.flock(slot_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            return slot_file
+        except OSError:
+            slot_file.close()
+    return None
+
+
+@contextlib.contextmanager
+def render_slot():
+    """
+    Admission control for pdflatex. At most RENDER_MAX_CONCURRENT renders run at the same time, up to
+    RENDER_MAX_WAITING more wait for a slot at most RENDER_QUEUE_TIMEOUT seconds. Everything beyond that is refused
+    right away with RenderBusy instead of slowing down all renders.
+
+        with render_slot():
+            subprocess.run(...)
+    """
+    slot = try_lock_slot('run', settings.RENDER_MAX_CONCURRENT)
+    if slot is None:
+        waiting = try_lock_slot('wait', settings.RENDER_MAX_WAITING)
+        if waiting is None:
+            raise RenderBusy('Too many renders are waiting')
+        try:
+            deadline = time.monotonic() + settings.RENDER_QUEUE_TIMEOUT
+            while slot is None:
+                if time.monotonic() > deadline:
+                    raise RenderBusy('Waited too long for a render slot')
+                time.sleep(POLL_INTERVAL)
+                slot = try_lock_slot('run', settings.RENDER_MAX_CONCURRENT)
+        finally:
+            waiting.close()
+    try:
+        yield
+    finally:
+        slot.close()
+
+
+def limited_command(command):
+    """
+    Wraps a pdflatex command in a shell that applies the CPU time and address space limits and then replaces itself
+    with the command, so the limits hold from the first instruction of pdflatex on. The kernel kills it once it used
+    RENDER_CPU_LIMIT seconds of CPU, and allocations beyond RENDER_MEMORY_LIMIT bytes fail.
+    :param command: the command line
+    :return: the command line running it with the limits
+    """
+    limits = []
+    if settings.RENDER_CPU_LIMIT:
+        limits.append('ulimit -t %d' % settings.RENDER_CPU_LIMIT)
+    if settings.RENDER_MEMORY_LIMIT:
+        # ulimit counts the address space in KiB
+        limits.append('ulimit -v %d' % (settings.RENDER_MEMORY_LIMIT // 1024))
+    if not limits:
+        return list(command)
+    return ['sh', '-c', '; '.join(limits) + '; exec "$@"', 'sh'] + list(command)
+
+
+def communicate(process, timeout, ticket):
+    """
+    Waits for a process like Popen.communicate. A render with a ticket checks every CANCEL_POLL_INTERVAL seconds
+    whether a render in another process superseded it, and stops its process then.
+    :raises subprocess.TimeoutExpired: if the process didn't finish in time
+    """
+    if ticket is None:
+        return process.communicate(timeout=timeout)
+    deadline = time.monotonic() + timeout
+    while True:
+        remaining = deadline - time.monotonic()
+        try:
+            return process.communicate(timeout=max(min(remaining, CANCEL_POLL_INTERVAL), 0))
+        except subprocess.TimeoutExpired:
+            if remaining <= CANCEL_POLL_INTERVAL:
+                raise
+            if ticket.is_superseded():
+                # stops the process, communicate returns right away then
+                process.terminate()
+
+
+def run_limited(command, cwd, timeout):
+    """
+    Runs a pdflatex command like subprocess.run with captured output, with the resource limits applied. The limits are
+    set by a shell exec-ing the command, see limited_command, instead of in preexec_fn, which is not safe in the
+    threads renders run in.
+    :param command: the command line
+    :param cwd: the directory to run in
+    :param timeout: wall clock timeout in seconds
+    :return: the CompletedProcess
+    :raises subprocess.TimeoutExpired: if the process didn't finish in time, it is killed then
+    :raises cancellation.RenderCancelled: if a newer render of the same target stopped the process
+    """
+    ticket = cancellation.current()
+    with subprocess.Popen(limited_command(command), cwd=cwd, stdout=subprocess.PIPE,
+                          stderr=subprocess.PIPE) as process:
+        if ticket is not None:
+            try:
+                ticket.add_process(process)
+            except cancellation.RenderCancelled:
+                process.kill()
+                raise
+        try:
+            stdout, stderr = communicate(process, timeout, ticket)
+        except subprocess.TimeoutExpired:
+            process.kill()
+            stdout, stderr = process.communicate()
+            raise subprocess.TimeoutExpired(command, timeout, output=stdout, stderr=stderr)
+        finally:
+            if ticket is not None:
+                ticket.remove_process(process)
+    cancellation.check()
+    return subprocess.CompletedProcess(command, process.returncode, stdout, stderr)
@@ -0,0 +1,162 @@
+import hashlib
+import os
+import tempfile
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.db.models import Q
+
+from .models import DependencyLink, FileDependency
+
+# directory in MEDIA_ROOT holding the content of all file dependencies, named by their SHA-256
+BLOB_DIR = 'blobs'
+
+CHUNK_SIZE = 64 * 1024
+
+
+def blob_name(digest):
+    return '%s/%s/%s' % (BLOB_DIR, digest[:2], digest)
+
+
+def legacy_dir(exercise=None, header=None):
+    """
+    The directory dependencies were copied to before they were stored by content.
+    """
+    if exercise is not None:
+        return os.path.join(settings.MEDIA_ROOT, 'exercises', 'exercise%d' % exercise.id, 'file_dependencies')
+    return os.path.join(settings.MEDIA_ROOT, 'headers', 'header%d' % header.id)
+
+
+def read_chunks(source):
+    if hasattr(source, 'chunks'):
+        yield from source.chunks()
+        return
+    with open(source, 'rb') as f:
+        yield from iter(lambda: f.read(CHUNK_SIZE), b'')
+
+
+def store(source):
+    """
+    Stores the content of a file unless the same content is stored already. Stored files are read only, they are
+    staged into work directories by hard link.
+    :param source: path of a file or an uploaded file
+    :return: the FileDependency holding the content
+    """
+    blob_root = os.path.join(settings.MEDIA_ROOT, BLOB_DIR)
+    os.makedirs(blob_root, exist_ok=True)
+    handle, temp_path = tempfile.mkstemp(prefix='.store-', dir=blob_root)
+    try:
+        digest = hashlib.sha256()
+        size = 0
+        with os.fdopen(handle, 'wb') as f:
+            for chunk in read_chunks(source):
+                digest.update(chunk)
+                size += len(chunk)
+                f.write(chunk)
+        name = blob_name(digest.hexdigest())
+        dependency, _ = FileDependency.objects.get_or_create(sha256=digest.hexdigest(),
+                                                             defaults={'file': name, 'size': size})
+        path = dependency.path()
+        if not os.path.exists(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            os.chmod(temp_path, 0o444)
+            os.replace(temp_path, path)
+    finally:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+    return dependency
+
+
+def add(source, name, exercise=None, header=None):
+    """
+    Stores a file and makes it available to an exercise or a header, replacing a file of the same name.
+    :param source: path of a file or an uploaded file
+    :param name: the file name the latex code uses
+    :param exercise: the exercise depending on the file
+    :param header: the header depending on the file, if no exercise is given
+    :return: the DependencyLink
+    """
+    dependency = store(source)
+    previous = list(DependencyLink.objects.filter(exercise=exercise, header=header, name=name)
+                    .exclude(dependency=dependency))
+    for link in previous:
+        link.delete()
+    link, _ = DependencyLink.objects.get_or_create(exercise=exercise, header=header, name=name,
+                                                   dependency=dependency)
+    return link
+
+
+def copy_links(source_exercise, target_exercise):
+    """
+    Gives an exercise the dependencies of another one, e.g. of the version it is based on. No file is copied.
+    """
+    DependencyLink.objects.bulk_create(
+        DependencyLink(exercise=target_exercise, name=link.name, dependency_id=link.dependency_id)
+        for link in DependencyLink.objects.filter(exercise=source_exercise))
+
+
+def import_legacy_dir(exercise=None, header=None):
+    """
+    Stores the files of an exercise or header that were copied to its own directory before dependencies were stored
+    by content. The directory is left as it is. Renders running at the same time, e.g. the two exam variants of the
+    download page, may import the same directory, the links of the one that finishes first are used then. Every
+    exercise and header is only looked at once, its legacy_imported flag is set afterwards.
+    :return: list of the DependencyLinks
+    """
+    owner = exercise if exercise is not None else header
+    if owner.legacy_imported:
+        return []
+    links = []
+    directory = legacy_dir(exercise, header)
+    if os.path.isdir(directory):
+        links = import_files(directory, exercise, header)
+    type(owner).objects.filter(pk=owner.pk).update(legacy_imported=True)
+    owner.legacy_imported = True
+    return links
+
+
+def import_files(directory, exercise, header):
+    names = sorted(os.listdir(directory))
+    for attempt in range(2):
+        try:
+            with transaction.atomic():
+                return [add(os.path.join(directory, name), name, exercise=exercise, header=header) for name in names]
+        except IntegrityError:
+            # imported by another render in the meantime
+            links = list(DependencyLink.objects.filter(exercise=exercise, header=header)
+                         .select_related('dependency').order_by('name'))
+            if links:
+                return links
+    raise IntegrityError('The dependencies in %s could not be imported' % directory)
+
+
+def linked_files(exercises=(), header=None):
+    """
+    Looks up the files exercises and a header depend on in the manifest, without listing any directory. Exercises and
+    headers without manifest entries get the files of their old dependency directory imported, once.
+    :param exercises: iterable of exercises
+    :param header: a header or None
+    :return: list of tuples (file name, path of the content, SHA-256 of the content). The header's files come last, so
+    they win over exercise files of the same name
+    """
+    exercises = list(exercises)
+    if not exercises and header is None:
+        return []
+    query = Q(exercise__in=exercises)
+    if header is not None:
+        query |= Q(header=header)
+    by_owner = {}
+    for link in DependencyLink.objects.filter(query).select_related('dependency').order_by('name'):
+        owner = ('exercise', link.exercise_id) if link.exercise_id else ('header', link.header_id)
+        by_owner.setdefault(owner, []).append(link)
+
+    files = []
+    owners = [(('exercise', exercise.id), {'exercise': exercise}) for exercise in exercises]
+    if header is not None:
+        owners.append((('header', header.id), {'header': header}))
+    for owner, kwargs in owners:
+        links = by_owner.get(owner)
+        if links is None:
+            links = import_legacy_dir(**kwargs)
+        files.extend((link.name, link.dependency.path(), link.dependency.sha256) for link in links)
+    return files
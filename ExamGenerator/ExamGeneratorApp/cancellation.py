@@ -0,0 +1,200 @@
+import contextlib
+import json
+import os
+import tempfile
+import threading
+import uuid
+
+from django.conf import settings
+
+_lock = threading.Lock()
+# (user pk, target) -> the ticket of the newest render of the target
+_active = {}
+_local = threading.local()
+
+# the document cancel_target records as the newest one of a target, no render claims it
+CANCELLED = 'cancelled'
+
+
+class RenderCancelled(Exception):
+    """
+    Raised in a render that was superseded by a newer render of the same target. Its output is discarded. Turned into
+    a 409 response by RenderBusyMiddleware.
+    """
+    pass
+
+
+class RenderTicket:
+    """
+    Tags the renders of one request with their owner and target, e.g. the exam of a user, and holds the compiler
+    processes they run, so a newer render of the same target can stop them.
+    """
+
+    def __init__(self, key, older, ticket_id=None):
+        self.key = key
+        # tells the renders of the target apart across processes, see publish
+        self.id = ticket_id or uuid.uuid4().hex
+        # the ticket this one replaced, it is cancelled once this render knows what it renders
+        self.older = older
+        # cache keys of the documents rendered under this ticket
+        self.documents = set()
+        self.cancelled = False
+        self.processes = set()
+        self.lock = threading.Lock()
+
+    def cancel(self):
+        with self.lock:
+            self.cancelled = True
+            processes = list(self.processes)
+        for process in processes:
+            try:
+                process.terminate()
+            except ProcessLookupError:
+                pass
+
+    def claim(self, document_key):
+        """
+        Records the document this render renders and cancels the older render of the target, unless it renders the
+        same document. Renders of the same document share their result, see render_cache.Flight.
+        """
+        with self.lock:
+            self.documents.add(document_key)
+        older = self.older
+        if older is not None and document_key not in older.documents:
+            older.cancel()
+        publish(self, document_key)
+
+    def is_superseded(self):
+        """
+        Whether this render was cancelled, or superseded by a render of the same target in another process. That one
+        can't stop the compiler processes of this one, they are stopped once the renders of this ticket notice it.
+        """
+        if self.cancelled:
+            return True
+        try:
+            with open(target_path(self.key), encoding='utf-8') as f:
+                newest = json.load(f)
+        except (FileNotFoundError, ValueError):
+            return False
+        if newest['ticket'] != self.id and newest['document'] is not None \
+                and newest['document'] not in self.documents:
+            self.cancel()
+        return self.cancelled
+
+    def state(self):
+        """
+        What another process needs to check whether this render was superseded, see restore.
+        """
+        return {'key': list(self.key), 'ticket': self.id, 'documents': sorted(self.documents)}
+
+    @classmethod
+    def restore(cls, state):
+        ticket = cls(tuple(state['key']), None, state['ticket'])
+        ticket.documents.update(state['documents'])
+        return ticket
+
+    def add_process(self, process):
+        with self.lock:
+            if self.cancelled:
+                raise RenderCancelled('The render was superseded')
+            self.processes.add(process)
+
+    def remove_process(self, process):
+        with self.lock:
+            self.processes.discard(process)
+
+
+def target_path(key):
+    return os.path.join(settings.RENDER_SLOT_DIR, 'targets', '%d-%s.json' % key)
+
+
+def publish(ticket, document_key):
+    """
+    Records a ticket as the newest render of its target for all processes rendering on this machine, along with the
+    document it claimed last. Older renders of the target in other processes find it with RenderTicket.is_superseded.
+    """
+    path = target_path(ticket.key)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    handle, temp_path = tempfile.mkstemp(prefix='.target-', dir=os.path.dirname(path))
+    with os.fdopen(handle, 'w', encoding='utf-8') as f:
+        json.dump({'ticket': ticket.id, 'document': document_key}, f)
+    os.replace(temp_path, path)
+
+
+def cancel_target(user, target):
+    """
+    Cancels the renders of a target that are running, in all processes rendering on this machine, e.g. because what
+    they render changed. Renders of the target started afterwards aren't affected.
+    :param user: the user the renders belong to
+    :param target: what is rendered, see render_target
+    :return: nothing
+    """
+    key = (user.pk, target)
+    with _lock:
+        ticket = _active.get(key)
+    # a ticket none of the running renders holds, with a document none of them claimed
+    publish(RenderTicket(key, None), CANCELLED)
+    while ticket is not None:
+        ticket.cancel()
+        ticket = ticket.older
+
+
+@contextlib.contextmanager
+def render_target(user, target):
+    """
+    Tags the renders run inside with their owner and target. Starting a newer render of the same target stops the
+    compiler processes of this one and makes it raise RenderCancelled. Renders in other processes of this machine,
+    including the render server, notice a newer render through the file written by publish, while waiting for their
+    compiler at the latest.
+
+        with cancellation.render_target(user, 'exam'):
+            render_pdf(...)
+    :param user: the user the render belongs to
+    :param target: what is rendered, e.g. 'exam', 'download' or 'exercise-12'
+    """
+    key = (user.pk, target)
+    with _lock:
+        older = _active.get(key)
+        ticket = RenderTicket(key, older)
+        _active[key] = ticket
+    publish(ticket, None)
+    try:
+        with attach(ticket):
+            yield ticket
+    finally:
+        with _lock:
+            if _active.get(key) is ticket:
+                del _active[key]
+        ticket.older = None
+
+
+@contextlib.contextmanager
+def attach(ticket):
+    """
+    Makes a ticket the current one in another thread, e.g. in the threads rendering the exam variants.
+    """
+    outer = current()
+    _local.ticket = ticket
+    try:
+        yield ticket
+    finally:
+        _local.ticket = outer
+
+
+def current():
+    return getattr(_local, 'ticket', None)
+
+
+def claim(document_key):
+    ticket = current()
+    if ticket is not None:
+        ticket.claim(document_key)
+
+
+def check():
+    """
+    Raises RenderCancelled if the current render was superseded.
+    """
+    ticket = current()
+    if ticket is not None and ticket.is_superseded():
+        raise RenderCancelled('The render was superseded')
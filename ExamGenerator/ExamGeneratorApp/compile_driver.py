@@ -0,0 +1,131 @@
+import os
+import shutil
+import subprocess
+import time
+import uuid
+
+from django.conf import settings
+
+from . import admission
+from . import cancellation
+from . import metrics
+from .render_cache import file_digest
+
+# files pdflatex reads back on the next pass. A document is finished once a pass leaves them unchanged
+AUXILIARY_EXTENSIONS = ('.aux', '.toc', '.out')
+
+
+def aux_store_dir(user, exercises, document_stem):
+    """
+    The directory the auxiliary files of a user's document are kept in between renders. Documents are told apart by
+    what they render: the target of the current cancellation.render_target, e.g. 'exam' or 'exercise-12', otherwise
+    the exercise if it is a single one, e.g. when an exercise pdf is stored. So renders of different documents don't
+    restore each other's auxiliary files.
+    :param user: the user the render belongs to
+    :param exercises: the exercises rendered, or None
+    :param document_stem: file name of the document without extension
+    :return: the path of the directory
+    """
+    ticket = cancellation.current()
+    if ticket is not None:
+        target = ticket.key[1]
+    elif exercises is not None and len(exercises) == 1:
+        target = 'exercise-%d' % exercises[0].pk
+    else:
+        target = 'other'
+    return os.path.join(settings.RENDER_AUX_DIR, user.username, target, document_stem)
+
+
+def auxiliary_digests(work_dir, document_stem):
+    digests = {}
+    for extension in AUXILIARY_EXTENSIONS:
+        path = os.path.join(work_dir, document_stem + extension)
+        if os.path.exists(path):
+            digests[extension] = file_digest(path)
+    return digests
+
+
+def restore_auxiliary_files(store_dir, work_dir, document_stem):
+    """
+    Copies the auxiliary files of the last render of the document into the work directory. References, page totals
+    and the table of contents are then right after the first pass, unless the document changed them.
+    :return: nothing
+    """
+    if not os.path.isdir(store_dir):
+        return
+    for extension in AUXILIARY_EXTENSIONS:
+        stored_file = os.path.join(store_dir, 'document' + extension)
+        try:
+            shutil.copy(stored_file, os.path.join(work_dir, document_stem + extension))
+        except FileNotFoundError:
+            continue
+
+
+def save_auxiliary_files(store_dir, work_dir, document_stem):
+    """
+    Keeps the auxiliary files of a finished render for the next render of the same document. Every file is replaced
+    atomically, since renders of the same document may finish at the same time.
+    :return: nothing
+    """
+    os.makedirs(store_dir, exist_ok=True)
+    for extension in AUXILIARY_EXTENSIONS:
+        source = os.path.join(work_dir, document_stem + extension)
+        target = os.path.join(store_dir, 'document' + extension)
+        if not os.path.exists(source):
+            if os.path.exists(target):
+                os.remove(target)
+            continue
+        tmp_target = os.path.join(store_dir, '.tmp-%s' % uuid.uuid4().hex)
+        shutil.copy(source, tmp_target)
+        os.replace(tmp_target, target)
+
+
+def compile_document(compiler, work_dir, document_name, options=(), store_dir=None, timeout=25, max_passes=None):
+    """
+    Runs the compiler as often as the document needs it. After every pass the .aux, .toc and .out files are compared
+    to the ones the pass started with, and another pass is only run if one of them changed. Compilers that rerun
+    themselves, like latexmk, are run once.
+    :param compiler: the Compiler, see compilers.get_compiler
+    :param work_dir: the directory the document is rendered in
+    :param document_name: file name of the document
+    :param options: additional command line options for the compiler
+    :param store_dir: directory to keep the auxiliary files in between renders, see aux_store_dir. Nothing is kept if
+    None
+    :param timeout: timeout for all passes together
+    :param max_passes: upper limit of compiler runs, defaults to RENDER_MAX_PASSES
+    :return: the number of passes run
+    :raises subprocess.TimeoutExpired: if the passes took longer than timeout
+    :raises admission.RenderBusy: if no render slot became free
+    :raises cancellation.RenderCancelled: if a newer render of the same target superseded this one
+    """
+    if max_passes is None:
+        max_passes = settings.RENDER_MAX_PASSES
+    if compiler.runs_passes:
+        max_passes = 1
+    document_stem = os.path.splitext(document_name)[0]
+    if store_dir:
+        restore_auxiliary_files(store_dir, work_dir, document_stem)
+
+    passes = 0
+    digests = auxiliary_digests(work_dir, document_stem)
+    # all passes share one render slot, the time spent waiting for it doesn't count towards the timeout
+    queued = time.monotonic()
+    with admission.render_slot():
+        metrics.record('queue', time.monotonic() - queued)
+        deadline = time.monotonic() + timeout
+        while passes < max_passes:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                raise subprocess.TimeoutExpired(compiler.command(document_name, options), timeout, output=b'')
+            with metrics.phase('compile'):
+                compiler.run(work_dir, document_name, timeout=remaining, options=options)
+            cancellation.check()
+            passes += 1
+            new_digests = auxiliary_digests(work_dir, document_stem)
+            if new_digests == digests:
+                break
+            digests = new_digests
+
+    if store_dir:
+        save_auxiliary_files(store_dir, work_dir, document_stem)
+    return passes
@@ -0,0 +1,126 @@
+import os
+import subprocess
+import time
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+
+from . import admission
+
+
+def tiny_pdf():
+    """
+    A valid one page pdf with an empty page, built with the byte offsets its cross reference table needs.
+    """
+    objects = [b'<< /Type /Catalog /Pages 2 0 R >>',
+               b'<< /Type /Pages /Kids [3 0 R] /Count 1 >>',
+               b'<< /Type /Page /Parent 2 0 R /MediaBox [0 0 595 842] >>']
+    pdf = b'%PDF-1.4\n'
+    offsets = []
+    for number, content in enumerate(objects, 1):
+        offsets.append(len(pdf))
+        pdf += b'%d 0 obj\n%s\nendobj\n' % (number, content)
+    xref = len(pdf)
+    pdf += b'xref\n0 %d\n0000000000 65535 f \n' % (len(objects) + 1)
+    pdf += b''.join(b'%010d 00000 n \n' % offset for offset in offsets)
+    pdf += b'trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n' % (len(objects) + 1, xref)
+    return pdf
+
+
+class Compiler:
+    """
+    A TeX engine documents are compiled with. run does a single pass, compile_driver.compile_document decides how many
+    passes a document needs.
+    """
+    name = None
+    executable = None
+    # whether documents can be compiled against a header format built by latex_format, which uses pdflatex
+    supports_formats = False
+    # whether the engine reruns itself until references are resolved, it is run only once then
+    runs_passes = False
+
+    def command(self, document_name, options=()):
+        return [self.executable, '-interaction=nonstopmode'] + list(options) + [document_name]
+
+    def run(self, work_dir, document_name, timeout, options=()):
+        """
+        Compiles a document once. nonstopmode hits enter on every input request the engine has on the terminal.
+        :param work_dir: the directory the document is rendered in
+        :param document_name: file name of the document
+        :param timeout: timeout in seconds
+        :param options: additional command line options, e.g. the format to use
+        :return: the CompletedProcess
+        :raises subprocess.TimeoutExpired: if the engine didn't finish in time
+        """
+        return admission.run_limited(self.command(document_name, options), cwd=str(work_dir), timeout=timeout)
+
+
+class PdfLatex(Compiler):
+    name = 'pdflatex'
+    executable = 'pdflatex'
+    supports_formats = True
+
+
+class LuaLatex(Compiler):
+    name = 'lualatex'
+    executable = 'lualatex'
+
+
+class XeLatex(Compiler):
+    name = 'xelatex'
+    executable = 'xelatex'
+
+
+class Latexmk(Compiler):
+    name = 'latexmk'
+    executable = 'latexmk'
+    runs_passes = True
+
+    def command(self, document_name, options=()):
+        return [self.executable, '-pdf', '-interaction=nonstopmode'] + list(options) + [document_name]
+
+
+class FakeCompiler(Compiler):
+    """
+    Writes a tiny pdf and a log without running TeX, the same for every document, so views can be tested and load
+    tested without a TeX installation. Every pass takes RENDER_FAKE_DELAY seconds. RENDER_FAKE_FAILURE makes it fail:
+    'error' writes a log with an error and no pdf, 'timeout' runs into the timeout.
+    """
+    name = 'fake'
+
+    def run(self, work_dir, document_name, timeout, options=()):
+        command = self.command(document_name, options)
+        stem = os.path.splitext(document_name)[0]
+        if settings.RENDER_FAKE_FAILURE == 'timeout' or settings.RENDER_FAKE_DELAY > timeout:
+            time.sleep(min(settings.RENDER_FAKE_DELAY, timeout))
+            raise subprocess.TimeoutExpired(command, timeout, output=b'! Error: the fake compiler timed out.\n')
+        time.sleep(settings.RENDER_FAKE_DELAY)
+        with open(os.path.join(work_dir, document_name), 'rb') as f:
+            f.read()
+        if settings.RENDER_FAKE_FAILURE == 'error':
+            log = '! Undefined control sequence.\nl.1 \\fake\n'
+        else:
+            pdf = tiny_pdf()
+            with open(os.path.join(work_dir, stem + '.pdf'), 'wb') as f:
+                f.write(pdf)
+            log = 'This is the fake compiler.\nOutput written on %s.pdf (1 page, %d bytes).\n' % (stem, len(pdf))
+        with open(os.path.join(work_dir, stem + '.log'), 'w', encoding='utf-8') as f:
+            f.write(log)
+        return subprocess.CompletedProcess(command, 0, b'', b'')
+
+
+COMPILERS = {compiler.name: compiler for compiler in (PdfLatex(), LuaLatex(), XeLatex(), Latexmk(), FakeCompiler())}
+
+
+def get_compiler(header=None):
+    """
+    Returns the compiler a header selected, or the default one set by RENDER_COMPILER.
+    :param header: a header object or None
+    :return: the Compiler
+    """
+    name = getattr(header, 'compiler', '') or settings.RENDER_COMPILER
+    try:
+        return COMPILERS[name]
+    except KeyError:
+        raise ImproperlyConfigured('Unknown compiler %r, RENDER_COMPILER has to be one of %s'
+                                   % (name, ', '.join(COMPILERS)))
@@ -4,6 +4,7 @@ from django import forms
 from django.contrib.auth.forms import AuthenticationForm
 from django.forms import ModelForm
 
+from .header_variants import HeaderStructure
 from .models import Topic, Header, Exam
 
 
@@ -60,7 +61,7 @@ class TopicForm(forms.ModelForm):
 class HeaderForm(forms.ModelForm):
     class Meta:
         model = Header
-        fields = ['name', 'latex_code']
+        fields = ['name', 'latex_code', 'compiler']
 
     header_files = forms.FileField(required=False, widget=forms.ClearableFileInput(
         attrs={'multiple': True}))
@@ -74,6 +75,15 @@ class HeaderForm(forms.ModelForm):
             attrs={'class': 'form-control', 'placeholder': placeholder, 'rows': '8'})
         self.fields['name'].widget = forms.TextInput(
             attrs={'class': 'form-control', 'placeholder': 'Name'})
+        self.fields['compiler'].widget = forms.Select(
+            choices=Header.compilerChoices, attrs={'class': 'form-control'})
+
+    def clean_latex_code(self):
+        latex_code = self.cleaned_data['latex_code']
+        errors = HeaderStructure(latex_code).errors()
+        if errors:
+            raise forms.ValidationError(errors)
+        return latex_code
 
 
 class ExerciseDetailForm(forms.Form):
@@ -0,0 +1,101 @@
+from . import score_table
+
+# the ways a header is rendered, (include_solutions, include_disclaimer)
+VARIANTS = ((True, True), (True, False), (False, True), (False, False))
+
+# comment turned into a command to exclude the solutions
+SOLUTIONS_TOGGLE = '%\\withoutsolutions'
+# comment 'tags' around the disclaimer, which is left out unless it is included
+BEGIN_DISCLAIMER = '%begin_disclaimer'
+END_DISCLAIMER = '%end_disclaimer'
+EMPTY_DISCLAIMER = BEGIN_DISCLAIMER + '\n' + END_DISCLAIMER
+
+
+def variant_key(include_solutions, include_disclaimer):
+    return '%d%d' % (include_solutions, include_disclaimer)
+
+
+class HeaderStructure:
+    """
+    The parts of a header's latex code that differ between its variants: the solutions toggles, the disclaimer and
+    the score tabular. The code is searched once, the variants are put together from slices of it.
+    """
+
+    def __init__(self, latex_code, language=None):
+        """
+        :param latex_code: the latex code of the header
+        :param language: the language of the header, selects its score tabular, see score_table.SCORE_TABLES
+        """
+        self.latex_code = latex_code
+        self.language = language
+
+        # offsets of the toggles, the '%' is removed to exclude the solutions
+        self.toggles = []
+        index = latex_code.find(SOLUTIONS_TOGGLE)
+        while index >= 0:
+            self.toggles.append(index)
+            index = latex_code.find(SOLUTIONS_TOGGLE, index + len(SOLUTIONS_TOGGLE))
+
+        # (start, end) of the disclaimer from its first begin tag to its last end tag, tags included
+        self.disclaimer = None
+        begin = latex_code.find(BEGIN_DISCLAIMER)
+        end = latex_code.rfind(END_DISCLAIMER)
+        if begin >= 0 and end >= begin + len(BEGIN_DISCLAIMER):
+            self.disclaimer = (begin, end + len(END_DISCLAIMER))
+
+    def errors(self):
+        """
+        Checks the structure of the header.
+        :return: list of messages describing the problems, empty if there are none
+        """
+        errors = []
+        if self.disclaimer is None:
+            if BEGIN_DISCLAIMER in self.latex_code:
+                errors.append('%s has no %s after it, the disclaimer cannot be left out.'
+                              % (BEGIN_DISCLAIMER, END_DISCLAIMER))
+            elif END_DISCLAIMER in self.latex_code:
+                errors.append('%s has no %s before it, the disclaimer cannot be left out.'
+                              % (END_DISCLAIMER, BEGIN_DISCLAIMER))
+        return errors
+
+    def variant(self, include_solutions, include_disclaimer):
+        """
+        Puts together the latex code of a variant of the header.
+        :param include_solutions: whether or not the solutions are to be included
+        :param include_disclaimer: whether or not to include the disclaimer
+        :return: the latex code as string
+        """
+        # (start, end, replacement) of the parts that change, in order
+        changes = []
+        if not include_solutions:
+            changes.extend((index, index + 1, '') for index in self.toggles)
+        if not include_disclaimer and self.disclaimer is not None:
+            start, end = self.disclaimer
+            changes = [change for change in changes if not start <= change[0] < end]
+            changes.append((start, end, EMPTY_DISCLAIMER))
+            changes.sort()
+        if not changes:
+            return self.latex_code
+
+        pieces = []
+        position = 0
+        for start, end, replacement in changes:
+            pieces.append(self.latex_code[position:start])
+            pieces.append(replacement)
+            position = end
+        pieces.append(self.latex_code[position:])
+        return ''.join(pieces)
+
+    def variants(self):
+        """
+        Puts together all variants of the header along with the location of their score tabular.
+        :return: dictionary variant key -> {'latex_code': code, 'scoreTable': [start, end] or None}
+        """
+        variants = {}
+        for include_solutions, include_disclaimer in VARIANTS:
+            latex_code = self.variant(include_solutions, include_disclaimer)
+            location = score_table.locate(latex_code, self.language)
+            variants[variant_key(include_solutions, include_disclaimer)] = {
+                'latex_code': latex_code, 'scoreTable': location and list(location)}
+        return variants
+
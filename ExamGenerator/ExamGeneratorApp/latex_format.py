@@ -0,0 +1,227 @@
+import hashlib
+import os
+import shutil
+import subprocess
+import tempfile
+import threading
+import time
+
+from django.conf import settings
+
+from . import admission
+from . import staging
+from .render_jobs import get_executor
+
+# bump this whenever the way formats are built changes, so old formats are no longer used
+FORMAT_VERSION = 'pdflatex-mylatexformat-1'
+
+# name of the format inside a work directory, pdflatex is called with -fmt=FORMAT_NAME
+FORMAT_NAME = 'preamble'
+
+FORMAT_OPTION = '-fmt=' + FORMAT_NAME
+
+BEGIN_DOCUMENT = '\\begin{document}'
+
+# what pdflatex prints if mylatexformat is not installed
+MISSING_PACKAGE = b"File `mylatexformat.ltx' not found"
+
+# keys of the formats currently built in the background, so each is only built once at a time
+_building = set()
+_building_lock = threading.Lock()
+
+
+def split_preamble(document):
+    """
+    Returns the part of a latex document before \\begin{document}, which is what a format file contains.
+    :param document: the latex document or header as a string
+    :return: the preamble, or None if the document has no \\begin{document}
+    """
+    position = document.find(BEGIN_DOCUMENT)
+    if position == -1:
+        return None
+    return document[:position]
+
+
+def format_key(preamble, dependencies):
+    """
+    Computes the key of a format. It covers the preamble and every file the header depends on, since packages and
+    images loaded in the preamble end up in the format.
+    :param preamble: the preamble as returned by split_preamble
+    :param dependencies: the header's file dependencies as returned by blob_store.linked_files
+    :return: the key as hex string
+    """
+    digest = hashlib.sha256()
+    digest.update(FORMAT_VERSION.encode('utf-8'))
+    digest.update(b'\0')
+    digest.update(preamble.encode('utf-8'))
+    for name, _, content_digest in sorted(dependencies):
+        digest.update(b'\0')
+        digest.update(name.encode('utf-8'))
+        digest.update(b'\0')
+        digest.update(content_digest.encode('utf-8'))
+    return digest.hexdigest()
+
+
+def format_path(key):
+    return os.path.join(settings.RENDER_FORMAT_DIR, key + '.fmt')
+
+
+def failed_marker_path(key):
+    return os.path.join(settings.RENDER_FORMAT_DIR, key + '.failed')
+
+
+def has_failed(key):
+    """
+    Whether building a format failed less than RENDER_FORMAT_RETRY_AFTER seconds ago. Older failure markers are
+    removed, so the build is tried again, e.g. after the missing package was installed.
+    """
+    marker = failed_marker_path(key)
+    try:
+        if time.time() - os.path.getmtime(marker) < settings.RENDER_FORMAT_RETRY_AFTER:
+            return True
+        os.remove(marker)
+    except FileNotFoundError:
+        pass
+    return False
+
+
+def find(preamble, dependencies):
+    """
+    Looks up the format for a preamble.
+    :param preamble: the preamble as returned by split_preamble
+    :param dependencies: the header's file dependencies as returned by blob_store.linked_files
+    :return: path of the format file, or None if it was not built (yet)
+    """
+    path = format_path(format_key(preamble, dependencies))
+    if not os.path.exists(path):
+        return None
+    try:
+        # the modification time of a format is its last use, which is what eviction sorts by
+        os.utime(path)
+    except FileNotFoundError:
+        return None
+    return path
+
+
+def build(preamble, dependencies, timeout=None):
+    """
+    Dumps a preamble into a format file with pdflatex -ini and the mylatexformat package. Documents compiled with the
+    format skip their own preamble, so the packages are not loaded again on every render. Building is skipped if the
+    format exists or building it failed before.
+    :param preamble: the preamble as returned by split_preamble
+    :param dependencies: the header's file dependencies as returned by blob_store.linked_files
+    :param timeout: timeout for the pdflatex process, defaults to RENDER_FORMAT_TIMEOUT
+    :return: path of the format file, or None if it could not be built
+    :raises admission.RenderBusy: if no render slot became free
+    """
+    key = format_key(preamble, dependencies)
+    path = format_path(key)
+    if os.path.exists(path):
+        return path
+    if has_failed(key):
+        return None
+    os.makedirs(settings.RENDER_FORMAT_DIR, exist_ok=True)
+
+    build_dir = tempfile.mkdtemp(prefix='.build-', dir=settings.RENDER_FORMAT_DIR)
+    try:
+        for name, dependency_path, _ in dependencies:
+            staging.stage_file(dependency_path, build_dir, name)
+        with open(os.path.join(build_dir, FORMAT_NAME + '.tex'), 'w', encoding='utf-8') as f:
+            f.write(preamble + BEGIN_DOCUMENT + '\n\\end{document}\n')
+        try:
+            with admission.render_slot():
+                result = admission.run_limited(
+                    ['pdflatex', '-ini', '-interaction=nonstopmode', '-jobname=' + FORMAT_NAME, '&pdflatex',
+                     'mylatexformat.ltx', FORMAT_NAME + '.tex'],
+                    cwd=build_dir, timeout=timeout or settings.RENDER_FORMAT_TIMEOUT)
+        except OSError:
+            # pdflatex is not installed, try again once it is
+            return None
+        except subprocess.TimeoutExpired:
+            # probably a busy machine rather than the preamble, try again next time
+            return None
+        built_format = os.path.join(build_dir, FORMAT_NAME + '.fmt')
+        if not os.path.exists(built_format):
+            if result is not None and MISSING_PACKAGE in (result.stdout or b''):
+                # mylatexformat is not installed, try again once it is
+                return None
+            # some preambles can't be dumped, e.g. because a package writes files. Those are rendered without format
+            # until the marker expires
+            open(failed_marker_path(key), 'w').close()
+            return None
+        os.replace(built_format, path)
+    finally:
+        shutil.rmtree(build_dir, ignore_errors=True)
+    evict(settings.RENDER_FORMAT_MAX_COUNT)
+    return path
+
+
+def build_in_background(preamble, dependencies):
+    """
+    Builds a format in the render worker pool, for headers that were saved or whose format is missing, e.g. because
+    they were created before formats existed. The request goes on without waiting for it.
+    :param preamble: the preamble as returned by split_preamble
+    :param dependencies: the header's file dependencies as returned by blob_store.linked_files
+    :return: the Future of the build, None if it is built already or failed before
+    """
+    key = format_key(preamble, dependencies)
+    if has_failed(key):
+        return None
+    with _building_lock:
+        if key in _building:
+            return None
+        _building.add(key)
+
+    def run():
+        try:
+            build(preamble, dependencies)
+        finally:
+            with _building_lock:
+                _building.discard(key)
+
+    return get_executor().submit(run)
+
+
+def install(path, work_dir):
+    """
+    Makes a format available to pdflatex in a work directory.
+    :param path: path of the format file returned by find
+    :param work_dir: the directory the document is rendered in
+    :return: the pdflatex argument selecting the format
+    """
+    staging.stage_file(path, work_dir, FORMAT_NAME + '.fmt')
+    return FORMAT_OPTION
+
+
+def uninstall(work_dir):
+    target = os.path.join(work_dir, FORMAT_NAME + '.fmt')
+    if os.path.exists(target):
+        os.remove(target)
+
+
+def evict(max_count):
+    """
+    Deletes the least recently used formats until at most max_count are left. Formats of old header versions are never
+    used again and disappear this way. Expired failure markers are removed as well.
+    :param max_count: number of formats to keep
+    :return: nothing
+    """
+    format_dir = settings.RENDER_FORMAT_DIR
+    formats = []
+    for name in os.listdir(format_dir):
+        if name.endswith('.failed'):
+            # removes expired failure markers
+            has_failed(name[:-len('.failed')])
+            continue
+        if not name.endswith('.fmt'):
+            continue
+        try:
+            formats.append((os.path.getmtime(os.path.join(format_dir, name)), name))
+        except FileNotFoundError:
+            continue
+    formats.sort(reverse=True)
+    for _, name in formats[max_count:]:
+        try:
+            os.remove(os.path.join(format_dir, name))
+        except FileNotFoundError:
+            continue
@@ -0,0 +1,233 @@
+import json
+import os
+import re
+import uuid
+
+# pdflatex wraps log lines at this length, a line this long continues on the next one
+MAX_PRINT_LINE = 79
+
+# lines of an error message shown after its first line, up to the line number
+MAX_CONTEXT_LINES = 5
+
+# lines after an error that are searched for its line number
+MAX_ERROR_LINES = 12
+
+# the start of lines pdflatex prints after errors to explain what the user can do in interactive mode
+ERROR_HELP = ('See the ', 'Type  H <return>', ' ...', 'Enter file name:', 'You\'re in trouble here')
+
+# records of each severity kept in a summary. The counts cover all of them
+MAX_SUMMARY_RECORDS = 50
+
+# e.g. 'LaTeX Warning:', 'LaTeX Font Warning:', 'Package hyperref Warning:'
+WARNING_RE = re.compile(r'^(?:LaTeX(?: (\w+))?|Package (\S+)|Class (\S+)|pdfTeX) warning:? ?(.*)$', re.IGNORECASE)
+INPUT_LINE_RE = re.compile(r'on input line (\d+)')
+BAD_BOX_RE = re.compile(r'^(Overfull|Underfull) \\[hv]box .*?(?:at lines? (\d+)|$)')
+ERROR_LINE_RE = re.compile(r'^l\.(\d+)')
+MISSING_FILE_RE = re.compile(r"File `([^']+)' not found")
+# a file is opened with '(' followed by its path, e.g. '(./exam.tex' or '(/usr/share/texmf/tex/latex/base/size10.clo'
+OPEN_FILE_RE = re.compile(r'\((\.?/[^\s()]+|[\w.-]+\.(?:tex|sty|cls|clo|cfg|def|fd|aux|toc|out))')
+
+
+def unwrap_lines(log_file):
+    """
+    Joins the lines pdflatex wrapped at MAX_PRINT_LINE characters, reading the log one line at a time.
+    :param log_file: the open log file
+    :return: generator of logical lines without line breaks
+    """
+    pending = ''
+    for line in log_file:
+        line = line.rstrip('\r\n')
+        if len(line) == MAX_PRINT_LINE:
+            pending += line
+            continue
+        yield pending + line
+        pending = ''
+    if pending:
+        yield pending
+
+
+def track_files(line, file_stack):
+    """
+    Updates the stack of open files with the parentheses of a log line. Every '(' opens a file and every ')' closes
+    the innermost one, which is how pdflatex reports the input files.
+    :param line: a log line
+    :param file_stack: list of open files, innermost last. Parentheses that don't belong to a file push None
+    :return: nothing
+    """
+    position = 0
+    while True:
+        opening = line.find('(', position)
+        closing = line.find(')', position)
+        if opening == -1 and closing == -1:
+            return
+        if closing == -1 or (opening != -1 and opening < closing):
+            match = OPEN_FILE_RE.match(line, opening)
+            file_stack.append(match.group(1) if match else None)
+            position = opening + 1
+        else:
+            if file_stack:
+                file_stack.pop()
+            position = closing + 1
+
+
+def current_file(file_stack):
+    for name in reversed(file_stack):
+        if name is not None:
+            return name
+    return None
+
+
+def parse_log(log_file):
+    """
+    Parses a pdflatex log into records without reading it into memory at once. Every record is a dictionary with
+    the keys
+        severity: 'error', 'warning' or 'badbox'
+        message: the message, for errors followed by the context pdflatex printed
+        file: the input file that was being read, None if unknown
+        line: the line in that file, None if unknown
+        package: the package issuing a warning, or the package that is missing for a missing .sty file
+        missing_file: the file that was not found, if that caused the message
+    :param log_file: the open log file
+    :return: generator of records
+    """
+    file_stack = []
+    warning = None
+    continuation = None
+    error = None
+    for line in unwrap_lines(log_file):
+        if warning is not None:
+            # package warnings continue on lines starting with the package name in parentheses, e.g. LaTeX Font
+            # warnings with the kind of warning
+            if continuation and line.startswith(continuation):
+                warning['message'] += ' ' + line[len(continuation):].strip()
+                continue
+            yield finish_warning(warning)
+            warning = None
+
+        if error is not None:
+            # the line number follows after the help pdflatex prints, which isn't interesting
+            match = ERROR_LINE_RE.match(line)
+            if match:
+                error['line'] = int(match.group(1))
+                error['message'] += '\n' + line
+                yield error
+                error = None
+                continue
+            if not line.startswith('! ') and error_lines < MAX_ERROR_LINES:
+                error_lines += 1
+                if line.strip() and not line.startswith(ERROR_HELP) and context_lines < MAX_CONTEXT_LINES:
+                    error['message'] += '\n' + line
+                    context_lines += 1
+                continue
+            yield error
+            error = None
+
+        if line.startswith('! '):
+            error = {'severity': 'error', 'message': line[2:], 'file': current_file(file_stack), 'line': None,
+                     'package': None, 'missing_file': None}
+            error_lines = 0
+            context_lines = 0
+            missing = MISSING_FILE_RE.search(line)
+            if missing:
+                error['missing_file'] = missing.group(1)
+                if missing.group(1).endswith('.sty'):
+                    error['package'] = missing.group(1)[:-len('.sty')]
+            continue
+
+        match = WARNING_RE.match(line)
+        if match:
+            kind, package, class_name, message = match.groups()
+            warning = {'severity': 'warning', 'message': message, 'file': current_file(file_stack),
+                       'line': None, 'package': package or class_name, 'missing_file': None}
+            prefix = package or class_name or kind
+            continuation = '(%s)' % prefix if prefix else None
+            continue
+
+        match = BAD_BOX_RE.match(line)
+        if match:
+            yield {'severity': 'badbox', 'message': line, 'file': current_file(file_stack),
+                   'line': int(match.group(2)) if match.group(2) else None, 'package': None,
+                   'missing_file': None, 'overfull': match.group(1) == 'Overfull'}
+            continue
+
+        track_files(line, file_stack)
+    if warning is not None:
+        yield finish_warning(warning)
+    if error is not None:
+        yield error
+
+
+def finish_warning(warning):
+    input_line = INPUT_LINE_RE.search(warning['message'])
+    if input_line:
+        warning['line'] = int(input_line.group(1))
+    return warning
+
+
+def summarize(records):
+    """
+    Condenses parsed records into a summary small enough to be stored and put in a template context.
+    :param records: iterable of records from parse_log
+    :return: dictionary with error_count, warning_count, overfull_count, underfull_count, the lists errors and warnings
+    holding the first MAX_SUMMARY_RECORDS records and the list missing_files
+    """
+    summary = {'error_count': 0, 'warning_count': 0, 'overfull_count': 0, 'underfull_count': 0, 'errors': [],
+               'warnings': [], 'missing_files': []}
+    for record in records:
+        if record['severity'] == 'error':
+            summary['error_count'] += 1
+            if len(summary['errors']) < MAX_SUMMARY_RECORDS:
+                summary['errors'].append(record)
+        elif record['severity'] == 'warning':
+            summary['warning_count'] += 1
+            if len(summary['warnings']) < MAX_SUMMARY_RECORDS:
+                summary['warnings'].append(record)
+        elif record['overfull']:
+            summary['overfull_count'] += 1
+        else:
+            summary['underfull_count'] += 1
+        if record['missing_file'] and record['missing_file'] not in summary['missing_files']:
+            summary['missing_files'].append(record['missing_file'])
+    return summary
+
+
+def summary_path(log_path):
+    return log_path + '.json'
+
+
+def write_summary(log_path):
+    """
+    Parses a log and stores the summary next to it, as <name>.log.json.
+    :param log_path: path of the .log file
+    :return: the summary, None if there is no log
+    """
+    try:
+        with open(log_path, encoding='utf-8', errors='replace') as log_file:
+            summary = summarize(parse_log(log_file))
+    except FileNotFoundError:
+        return None
+    target = summary_path(log_path)
+    tmp_target = os.path.join(os.path.dirname(target), '.summary-%s' % uuid.uuid4().hex)
+    with open(tmp_target, 'w', encoding='utf-8') as f:
+        json.dump(summary, f)
+    os.replace(tmp_target, target)
+    return summary
+
+
+def load_summary(log_path):
+    """
+    Returns the stored summary of a log, parsing the log if the summary is missing or older than the log.
+    :param log_path: path of the .log file
+    :return: the summary, None if there is no log
+    """
+    try:
+        log_mtime = os.path.getmtime(log_path)
+    except FileNotFoundError:
+        return None
+    try:
+        if os.path.getmtime(summary_path(log_path)) >= log_mtime:
+            with open(summary_path(log_path), encoding='utf-8') as f:
+                return json.load(f)
+    except (FileNotFoundError, ValueError):
+        pass
+    return write_summary(log_path)
@@ -0,0 +1,309 @@
+import concurrent.futures
+import datetime
+import json
+import os
+import shutil
+import statistics
+import struct
+import subprocess
+import sys
+import tempfile
+import time
+import zlib
+
+from django.conf import settings
+from django.contrib.auth.models import Group, User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.test import override_settings
+from django.test.client import Client
+from django.urls import reverse
+
+from ... import blob_store
+from ... import compilers
+from ... import score_table
+from ... import staging
+from ...header_variants import HeaderStructure
+from ...models import Content, Exam, Exercise, ExerciseSolution, ExerciseText, Header, Topic
+from ...views import build_document, build_header_formats, render_pdf
+from ...workdirs import RenderWorkDir
+
+# bump this whenever the synthetic data or what is measured changes, results of different versions don't compare
+BENCHMARK_VERSION = 3
+
+HEADER = r'''\documentclass{article}
+\usepackage{graphicx}
+\usepackage{tikz}
+%\withoutsolutions
+\begin{document}
+%begin_disclaimer
+This exam is synthetic benchmark data.
+%end_disclaimer
+
+\begin{tabular}{|c||c| |c|}
+    \hline
+    \textbf{Aufgabe} & \textbf{1} & \textbf{Summe} \\
+    \hline
+    \textbf{Maximale Punkte} & 1 & 1 \\
+    \hline
+\end{tabular}
+'''
+
+PARAGRAPH = ('Lorem ipsum dolor sit amet, consectetur adipiscing elit, sed do eiusmod tempor incididunt ut labore et '
+             'dolore magna aliqua. Let $f(x) = \\sum_{i=0}^{n} a_i x^i$ be a polynomial of degree $n$.\n\n')
+
+# stand-in for the TeX engines on machines without TeX. It reads the document and writes what a successful run writes
+STAND_IN_COMPILER = '''#!%s
+import os
+import sys
+
+arguments = sys.argv[1:]
+jobname = None
+for argument in arguments:
+    if argument.startswith('-jobname='):
+        jobname = argument.partition('=')[2]
+document = arguments[-1]
+stem = jobname or os.path.splitext(os.path.basename(document))[0]
+if os.path.exists(document):
+    with open(document, 'rb') as f:
+        f.read()
+if '-ini' in arguments:
+    open(stem + '.fmt', 'w').close()
+else:
+    with open(stem + '.pdf', 'wb') as f:
+        f.write(b'%%PDF-1.4\\n%%%%EOF\\n')
+    open(stem + '.aux', 'w').close()
+with open(stem + '.log', 'w') as f:
+    f.write('This is a stand-in for TeX\\nOutput written on %%s.pdf\\n' %% stem)
+'''
+
+
+def synthetic_png(size):
+    """
+    A valid gray scale png of size x size pixels, so image dependencies have realistic sizes.
+    """
+    rows = b''.join(b'\0' + bytes((x * y) % 256 for x in range(size)) for y in range(size))
+
+    def chunk(kind, data):
+        return struct.pack('>I', len(data)) + kind + data + struct.pack('>I', zlib.crc32(kind + data))
+
+    return (b'\x89PNG\r\n\x1a\n' + chunk(b'IHDR', struct.pack('>IIBBBBB', size, size, 8, 0, 0, 0, 0)) +
+            chunk(b'IDAT', zlib.compress(rows)) + chunk(b'IEND', b''))
+
+
+def synthetic_exercise_tex(index):
+    """
+    Exercise text of varying length, every fourth exercise has a TikZ picture.
+    """
+    tex = '\\section*{Exercise %d}\n' % (index + 1) + PARAGRAPH * (1 + index % 8)
+    if index % 4 == 3:
+        tex += '\\begin{tikzpicture}\n'
+        tex += ''.join('\\draw (0,0) -- (%d,%d);\n' % (i, (i * index) % 5) for i in range(1 + index % 20))
+        tex += '\\end{tikzpicture}\n'
+    return tex
+
+
+def measure(function, repeat):
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        times.append(time.perf_counter() - start)
+    return times
+
+
+def result(benchmark, times, **parameters):
+    """
+    Summarizes the times of one benchmark, the parameters identify it when results are compared.
+    """
+    entry = {'benchmark': benchmark}
+    entry.update(parameters)
+    entry.update({'runs': len(times), 'min': min(times), 'median': statistics.median(times),
+                  'mean': statistics.mean(times), 'max': max(times), 'per_second': len(times) / sum(times)})
+    return entry
+
+
+def result_id(entry):
+    return tuple((key, entry[key]) for key in sorted(entry)
+                 if key not in ('runs', 'min', 'median', 'mean', 'max', 'per_second', 'bytes'))
+
+
+def current_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', 'HEAD'], cwd=settings.BASE_DIR, stdout=subprocess.PIPE,
+                              stderr=subprocess.DEVNULL, check=True).stdout.decode('ascii').strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+class Command(BaseCommand):
+    help = ('Benchmarks the render pipeline on synthetic exams: the header variants, the score tabular, '
+            'build_document, staging of file dependencies, render_pdf and the download page. All data is created in a '
+            'transaction that is rolled back and in a temporary directory, nothing of the installation is touched.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sizes', default='1,10,50,200',
+                            help='comma separated numbers of exercises of the synthetic exams')
+        parser.add_argument('--repeat', type=int, default=3, help='runs of every benchmark')
+        parser.add_argument('--output', default='render_benchmark.json', help='file the results are written to')
+        parser.add_argument('--baseline', help='results of an earlier run to compare with')
+        parser.add_argument('--compiler', choices=sorted(compilers.COMPILERS),
+                            help='compiler to benchmark, defaults to RENDER_COMPILER. The fake compiler measures the '
+                                 'Django side without any compile time')
+        parser.add_argument('--stand-in', action='store_true',
+                            help='use a stand-in instead of the compiler, the default if it is not installed')
+        parser.add_argument('--timeout', type=int, default=120, help='timeout for one render')
+
+    def handle(self, *args, **options):
+        try:
+            sizes = sorted(int(size) for size in options['sizes'].split(','))
+        except ValueError:
+            raise CommandError('--sizes has to be a comma separated list of numbers')
+        if not sizes or sizes[0] < 1 or options['repeat'] < 1:
+            raise CommandError('sizes and --repeat have to be at least 1')
+        baseline = None
+        if options['baseline']:
+            with open(options['baseline'], encoding='utf-8') as f:
+                baseline = json.load(f)
+
+        root = tempfile.mkdtemp(prefix='render-benchmark-')
+        path = os.environ.get('PATH', '')
+        compiler = compilers.COMPILERS[options['compiler'] or settings.RENDER_COMPILER]
+        stand_in = bool(compiler.executable) and (options['stand_in'] or shutil.which(compiler.executable) is None)
+        try:
+            if stand_in:
+                bin_dir = os.path.join(root, 'bin')
+                os.makedirs(bin_dir)
+                with open(os.path.join(bin_dir, compiler.executable), 'w') as f:
+                    f.write(STAND_IN_COMPILER % sys.executable)
+                os.chmod(os.path.join(bin_dir, compiler.executable), 0o755)
+                os.environ['PATH'] = bin_dir + os.pathsep + path
+            # renders run in this thread, so they see the data of the transaction
+            with override_settings(MEDIA_ROOT=os.path.join(root, 'media'),
+                                   RENDER_WORK_DIR=os.path.join(root, 'work'),
+                                   RENDER_CACHE_DIR=os.path.join(root, 'cache'),
+                                   RENDER_AUX_DIR=os.path.join(root, 'aux'),
+                                   RENDER_FORMAT_DIR=os.path.join(root, 'formats'),
+                                   RENDER_SLOT_DIR=os.path.join(root, 'slots'),
+                                   RENDER_COMPILER=compiler.name, RENDER_ASYNC=False, DOWNLOAD_PARALLEL_RENDER=False,
+                                   ALLOWED_HOSTS=settings.ALLOWED_HOSTS + ['testserver']):
+                with transaction.atomic():
+                    results = self.run_benchmarks(sizes, options['repeat'], options['timeout'])
+                    transaction.set_rollback(True)
+        finally:
+            os.environ['PATH'] = path
+            shutil.rmtree(root, ignore_errors=True)
+
+        report = {'version': BENCHMARK_VERSION, 'commit': current_commit(),
+                  'date': datetime.datetime.now().isoformat(timespec='seconds'),
+                  'compiler': compiler.name, 'stand_in': stand_in,
+                  'repeat': options['repeat'], 'results': results}
+        with open(options['output'], 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2)
+        self.print_results(report, baseline)
+
+    def run_benchmarks(self, sizes, repeat, timeout):
+        user = User.objects.create_user(username='render-benchmark-%d' % os.getpid())
+        user.groups.add(Group.objects.get_or_create(name='Employee')[0])
+        header = Header.objects.create(name='Render benchmark', author=user, latex_code=HEADER, language='German')
+        # the formats are used by the renders measured below
+        concurrent.futures.wait(build_header_formats(header))
+        exercises = self.create_exercises(user, header, sizes[-1])
+        client = Client()
+        client.force_login(user)
+
+        results = []
+        # put together when a header is saved, the renders use the stored variants
+        times = measure(lambda: HeaderStructure(header.latex_code, header.language).variants(), repeat * 10)
+        results.append(result('header_variants', times))
+        for size in sizes:
+            self.stderr.write('Exam with %d exercises' % size)
+            exam_exercises = exercises[:size]
+            Exam.objects.filter(author=user).delete()
+            exam = Exam.objects.create(author=user, documentHead=header)
+            Content.objects.bulk_create(Content(exam=exam, exercise=exercise, position=position)
+                                        for position, exercise in enumerate(exam_exercises, 1))
+
+            times = measure(lambda: ''.join(score_table.generate(header.language, exam_exercises)), repeat * 10)
+            results.append(result('score_table', times, exercises=size))
+            times = measure(lambda: build_document(exam_exercises, header=header, include_solutions=True),
+                            repeat * 10)
+            results.append(result('build_document', times, exercises=size))
+
+            staged_bytes = sum(os.path.getsize(path) for _, path, _ in
+                               blob_store.linked_files(exam_exercises, header))
+
+            def stage():
+                with RenderWorkDir.create(user) as work_dir:
+                    for name, path, _ in blob_store.linked_files(exam_exercises, header):
+                        staging.stage_file(path, work_dir, name)
+            times = measure(stage, repeat)
+            results.append(result('staging', times, exercises=size, bytes=staged_bytes))
+
+            for use_cache in (False, True):
+                def render():
+                    with RenderWorkDir.create(user) as work_dir:
+                        if not render_pdf(user, exam_exercises, header=header, include_solutions=True,
+                                          work_dir=work_dir, use_cache=use_cache, timeout=timeout):
+                            raise CommandError('Rendering %d exercises timed out' % size)
+                if use_cache:
+                    # the first render fills the cache
+                    render()
+                times = measure(render, repeat)
+                results.append(result('render_pdf', times, exercises=size, cache=use_cache))
+
+            def download():
+                if client.get(reverse('download page')).status_code != 200:
+                    raise CommandError('The download page failed for %d exercises' % size)
+            for use_cache in (False, True):
+                def run_download():
+                    if not use_cache:
+                        shutil.rmtree(settings.RENDER_CACHE_DIR, ignore_errors=True)
+                    download()
+                if use_cache:
+                    download()
+                times = measure(run_download, repeat)
+                results.append(result('download_page_view', times, exercises=size, cache=use_cache))
+        return results
+
+    def create_exercises(self, user, header, count):
+        """
+        Creates exercises of varying length. Every third exercise has an image of its own, every fourth a TikZ picture.
+        """
+        topic = Topic.objects.create(name='Render benchmark')
+        image_path = os.path.join(settings.MEDIA_ROOT, 'benchmark.png')
+        os.makedirs(settings.MEDIA_ROOT, exist_ok=True)
+        exercises = []
+        for index in range(count):
+            exercise_text = ExerciseText.objects.create(latex_code=synthetic_exercise_tex(index), author=user)
+            exercise_solution = ExerciseSolution.objects.create(latex_code=PARAGRAPH, author=user)
+            exercise = Exercise.objects.create(documentHead=header, modifiable=True, points=1 + index % 10,
+                                               topic=topic, exerciseText=exercise_text,
+                                               exerciseSolution=exercise_solution)
+            if index % 3 == 2:
+                name = 'exer-%d-figure.png' % exercise.pk
+                with open(image_path, 'wb') as f:
+                    f.write(synthetic_png(64 + 32 * (index % 15)))
+                blob_store.add(image_path, name, exercise=exercise)
+                exercise_text.latex_code += '\\includegraphics[width=3cm]{%s}\n' % name
+                exercise_text.save()
+            exercises.append(exercise)
+        return exercises
+
+    def print_results(self, report, baseline):
+        baseline_medians = {}
+        if baseline:
+            if baseline.get('version') != report['version']:
+                self.stderr.write('The baseline was made by another version of the benchmark, not comparing')
+            else:
+                baseline_medians = {result_id(entry): entry['median'] for entry in baseline['results']}
+        stand_in = ' (stand-in)' if report['stand_in'] else ''
+        self.stdout.write('Compiler: %s%s, commit: %s' % (report['compiler'], stand_in, report['commit']))
+        for entry in report['results']:
+            parameters = ', '.join('%s=%s' % (key, value) for key, value in result_id(entry) if key != 'benchmark')
+            line = '%-20s %-30s median %9.4fs  %8.2f/s' % (entry['benchmark'], parameters, entry['median'],
+                                                          entry['per_second'])
+            previous = baseline_medians.get(result_id(entry))
+            if previous:
+                line += '  %+.1f%%' % ((entry['median'] / previous - 1) * 100)
+            self.stdout.write(line)
@@ -0,0 +1,35 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from ...render_server import RenderServer
+
+
+class Command(BaseCommand):
+    help = 'Compiles the documents of the web processes on this machine with a pool of worker processes, listening ' \
+           'on a Unix socket. The web processes use it if RENDER_SERVER_SOCKET is set and compile in process while ' \
+           'it is not running.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--socket', default=settings.RENDER_SERVER_SOCKET,
+                            help='path of the Unix socket, defaults to RENDER_SERVER_SOCKET')
+        parser.add_argument('--workers', type=int, default=settings.RENDER_SERVER_WORKERS,
+                            help='number of worker processes, i.e. documents compiled at the same time')
+        parser.add_argument('--max-jobs', type=int, default=settings.RENDER_SERVER_MAX_JOBS,
+                            help='number of jobs after which a worker is replaced by a new one')
+
+    def handle(self, *args, **options):
+        if not options['socket']:
+            raise CommandError('Set RENDER_SERVER_SOCKET or give --socket')
+        if options['workers'] < 1 or options['max_jobs'] < 1:
+            raise CommandError('--workers and --max-jobs have to be at least 1')
+        try:
+            server = RenderServer(options['socket'], options['workers'], options['max_jobs'])
+        except OSError as e:
+            raise CommandError(str(e))
+        self.stdout.write('Render server listening on %s with %d workers' % (options['socket'], options['workers']))
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            server.server_close()
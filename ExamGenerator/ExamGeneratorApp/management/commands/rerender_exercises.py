@@ -0,0 +1,185 @@
+import json
+import os
+import shutil
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+
+from ... import blob_store
+from ... import compilers
+from ... import latex_format
+from ... import log_parser
+from ...models import Exercise
+from ...views import pdf_render_and_copy, prepare_header_tex
+from ...workdirs import RenderWorkDir
+
+# number of errors shown for every failed exercise in the summary
+EXCERPT_ERRORS = 3
+
+
+def log_excerpt(summary, count=EXCERPT_ERRORS):
+    """
+    Formats the first errors of a render log for the summary.
+    :param summary: the log summary, see log_parser.summarize
+    :param count: number of errors to include
+    :return: the excerpt as string, empty if there is no log
+    """
+    if not summary:
+        return ''
+    excerpt = []
+    for record in summary['errors'][:count]:
+        location = ', line %d' % record['line'] if record['line'] else ''
+        excerpt.append('%s%s: %s' % (record['file'] or 'document.tex', location, record['message']))
+    return '\n'.join(excerpt)
+
+
+def init_worker():
+    # forked workers inherit the database connections of the command, which can't be shared between processes
+    connections.close_all()
+
+
+def rerender_exercise(pk, username, use_cache, timeout):
+    """
+    Like render_exercise, but a broken exercise is reported as failed instead of stopping the whole run.
+    """
+    try:
+        return render_exercise(pk, username, use_cache, timeout)
+    except Exception as e:
+        return pk, 'failed', '%s: %s' % (type(e).__name__, e)
+
+
+def render_exercise(pk, username, use_cache, timeout):
+    """
+    Renders one exercise and copies the pdf to the exercise's directory. Runs in the worker processes.
+    :param pk: primary key of the exercise
+    :param username: name the work directory and the kept auxiliary files are filed under
+    :param use_cache: passed on to render_pdf
+    :param timeout: passed on to render_pdf
+    :return: tuple (pk, status, log excerpt). The status is 'ok', 'errors' if pdflatex reported errors or 'failed' if
+    no pdf was created
+    """
+    exercise = Exercise.objects.select_related('exerciseText', 'exerciseSolution', 'documentHead').get(pk=pk)
+    user = User(username=username)
+    with RenderWorkDir.create(user) as work_dir:
+        rendered = pdf_render_and_copy(user, exercise, work_dir, use_cache=use_cache, timeout=timeout)
+        if not rendered:
+            try:
+                with open(work_dir.file_path('err_log.txt'), encoding='utf-8') as f:
+                    return pk, 'failed', 'Timeout\n' + f.read()
+            except FileNotFoundError:
+                return pk, 'failed', 'Timeout'
+        summary = log_parser.load_summary(work_dir.file_path('document.log'))
+        if not work_dir.exists('document.pdf'):
+            return pk, 'failed', log_excerpt(summary)
+        if not summary or not summary['error_count']:
+            return pk, 'ok', ''
+        return pk, 'errors', log_excerpt(summary)
+
+
+class Command(BaseCommand):
+    help = 'Re-renders the pdf of every exercise, or of the given ones, e.g. after a TeX upgrade or a header change.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('exercise_ids', nargs='*', type=int, help='only render these exercises')
+        parser.add_argument('--topic', type=int, action='append', default=[],
+                            help='only render exercises of this topic, can be given more than once')
+        parser.add_argument('--header', type=int, action='append', default=[],
+                            help='only render exercises with this header, can be given more than once')
+        parser.add_argument('--jobs', type=int, default=os.cpu_count() or 1,
+                            help='number of exercises rendered in parallel')
+        parser.add_argument('--timeout', type=int, default=25, help='timeout for rendering one exercise')
+        parser.add_argument('--state-file', default='rerender_exercises.json',
+                            help='file recording the progress, used by --resume')
+        parser.add_argument('--resume', action='store_true',
+                            help='skip the exercises an interrupted earlier run already rendered')
+        parser.add_argument('--force', action='store_true',
+                            help='run pdflatex even if the render cache has the exercise')
+        parser.add_argument('--clear-formats', action='store_true',
+                            help='delete the precompiled header formats first, they have to be rebuilt after a TeX '
+                                 'upgrade')
+        parser.add_argument('--user', default='rerender',
+                            help='user name the renders are filed under in the work and aux directories')
+
+    def handle(self, *args, **options):
+        if options['jobs'] < 1:
+            raise CommandError('--jobs has to be at least 1')
+
+        exercises = Exercise.objects.select_related('documentHead').order_by('pk')
+        if options['exercise_ids']:
+            exercises = exercises.filter(pk__in=options['exercise_ids'])
+        if options['topic']:
+            exercises = exercises.filter(topic__in=options['topic'])
+        if options['header']:
+            exercises = exercises.filter(documentHead__in=options['header'])
+        exercises = list(exercises)
+
+        state = {'done': [], 'failed': {}}
+        if options['resume'] and os.path.exists(options['state_file']):
+            with open(options['state_file'], encoding='utf-8') as f:
+                state = json.load(f)
+        done = set(state['done'])
+        pending = [exercise for exercise in exercises if exercise.pk not in done]
+        self.stdout.write('%d exercises to render, %d already done' % (len(pending), len(exercises) - len(pending)))
+
+        if options['clear_formats'] and os.path.isdir(settings.RENDER_FORMAT_DIR):
+            shutil.rmtree(settings.RENDER_FORMAT_DIR)
+        self.build_formats(pending)
+
+        arguments = (options['user'], not options['force'], options['timeout'])
+        total = len(pending)
+        if options['jobs'] == 1:
+            results = (rerender_exercise(exercise.pk, *arguments) for exercise in pending)
+            self.collect(results, total, state, options['state_file'])
+        else:
+            connections.close_all()
+            with ProcessPoolExecutor(max_workers=options['jobs'], initializer=init_worker) as executor:
+                futures = [executor.submit(rerender_exercise, exercise.pk, *arguments) for exercise in pending]
+                self.collect((future.result() for future in as_completed(futures)), total, state,
+                             options['state_file'])
+
+        self.print_summary(state)
+
+    def build_formats(self, exercises):
+        """
+        Builds the header formats up front, instead of every worker noticing they are missing.
+        """
+        if not settings.RENDER_FORMATS:
+            return
+        headers = {exercise.documentHead.pk: exercise.documentHead for exercise in exercises}
+        for header in headers.values():
+            if not compilers.get_compiler(header).supports_formats:
+                continue
+            preamble = latex_format.split_preamble(prepare_header_tex(header, True, False))
+            if preamble is not None:
+                latex_format.build(preamble, blob_store.linked_files(header=header))
+
+    def collect(self, results, total, state, state_file):
+        """
+        Prints the progress and records every finished exercise in the state file. Only exercises that rendered
+        without problems count as done, the others are tried again by --resume.
+        """
+        for count, (pk, status, excerpt) in enumerate(results, 1):
+            if status == 'ok':
+                state['done'].append(pk)
+                state['failed'].pop(str(pk), None)
+            else:
+                state['failed'][str(pk)] = {'status': status, 'log': excerpt}
+            self.write_state(state, state_file)
+            self.stdout.write('[%d/%d] exercise %d: %s' % (count, total, pk, status))
+
+    def write_state(self, state, state_file):
+        tmp_file = state_file + '.tmp'
+        with open(tmp_file, 'w', encoding='utf-8') as f:
+            json.dump(state, f)
+        os.replace(tmp_file, state_file)
+
+    def print_summary(self, state):
+        failed = state['failed']
+        self.stdout.write('%d exercises rendered, %d with problems' % (len(state['done']), len(failed)))
+        for pk, failure in sorted(failed.items(), key=lambda item: int(item[0])):
+            self.stdout.write(self.style.ERROR('exercise %s: %s' % (pk, failure['status'])))
+            if failure['log']:
+                self.stdout.write(failure['log'])
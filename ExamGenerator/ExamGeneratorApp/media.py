@@ -0,0 +1,260 @@
+import mimetypes
+import os
+import posixpath
+import threading
+import uuid
+from urllib.parse import quote
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.http import FileResponse, Http404, HttpResponse, StreamingHttpResponse
+from django.utils._os import safe_join
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date, quote_etag
+from django.views.static import serve
+
+from .render_cache import file_digest
+
+# number of files whose ETag is remembered, see file_etag
+ETAG_CACHE_SIZE = 1024
+
+# length of the version in urls made by versioned_url
+VERSION_LENGTH = 16
+
+# how long browsers keep a file requested with its current version, see versioned_url
+VERSIONED_MAX_AGE = 365 * 24 * 60 * 60
+
+# requests for more ranges than this are answered with the whole file
+MAX_RANGES = 16
+
+# size of the chunks ranges are sent in
+RANGE_CHUNK_SIZE = 64 * 1024
+
+_etag_lock = threading.Lock()
+# path -> (modification time in ns, size, etag)
+_etags = {}
+
+
+def file_etag(path):
+    """
+    The ETag of a file, a digest of its content. Digests are remembered as long as the file's modification time and
+    size stay the same, so a file is only read again after it changed.
+    :param path: path of the file
+    :return: the ETag without quotes
+    """
+    stat = os.stat(path)
+    with _etag_lock:
+        cached = _etags.get(path)
+    if cached is not None and cached[:2] == (stat.st_mtime_ns, stat.st_size):
+        return cached[2]
+    etag = file_digest(path)[:32]
+    with _etag_lock:
+        if len(_etags) >= ETAG_CACHE_SIZE:
+            _etags.clear()
+        _etags[path] = (stat.st_mtime_ns, stat.st_size, etag)
+    return etag
+
+
+def versioned_url(name):
+    """
+    The url of a media file with its content version as query parameter. The url only changes when the content does,
+    so browsers reuse the file they have instead of downloading it on every page view.
+    :param name: path of the file relative to MEDIA_ROOT, e.g. 'temp/<user>/exam.pdf'
+    :return: the url, without version if the file doesn't exist
+    """
+    url = settings.MEDIA_URL + name
+    try:
+        return '%s?v=%s' % (url, file_etag(os.path.join(settings.MEDIA_ROOT, name))[:VERSION_LENGTH])
+    except FileNotFoundError:
+        return url
+
+
+def resolve(path, document_root):
+    """
+    The file a media url refers to, like django.views.static.serve resolves it.
+    :raises SuspiciousFileOperation: if the path leaves the document root, answered with 400
+    """
+    return safe_join(document_root, posixpath.normpath(path).lstrip('/'))
+
+
+def sendfile_response(full_path, document_root, content_type):
+    """
+    An empty response telling the proxy in front of Django to send the file, so no web worker is busy with the
+    transfer. MEDIA_SENDFILE selects the header: 'x-accel-redirect' for nginx, which serves MEDIA_SENDFILE_PREFIX from
+    an internal location pointing to the document root, or 'x-sendfile' for Apache with mod_xsendfile and lighttpd.
+    :param full_path: path of the file
+    :param document_root: the directory files are served from
+    :param content_type: content type of the file
+    :return: the response
+    :raises ImproperlyConfigured: if MEDIA_SENDFILE is none of the above
+    """
+    response = HttpResponse(content_type=content_type)
+    if settings.MEDIA_SENDFILE == 'x-accel-redirect':
+        relative_path = os.path.relpath(full_path, document_root).replace(os.sep, '/')
+        response['X-Accel-Redirect'] = settings.MEDIA_SENDFILE_PREFIX + quote(relative_path)
+    elif settings.MEDIA_SENDFILE == 'x-sendfile':
+        response['X-Sendfile'] = os.path.abspath(full_path)
+    else:
+        raise ImproperlyConfigured("MEDIA_SENDFILE has to be 'x-accel-redirect', 'x-sendfile' or None")
+    return response
+
+
+def parse_ranges(header, size):
+    """
+    Parses a Range header like 'bytes=0-1023, -500'.
+    :param header: value of the header
+    :param size: size of the file in bytes
+    :return: list of the satisfiable ranges as (first byte, last byte), empty if none is satisfiable, or None if the
+    header is invalid or asks for too many ranges, which means the whole file is sent
+    """
+    units, _, specs = header.partition('=')
+    if units.strip() != 'bytes':
+        return None
+    ranges = []
+    for spec in specs.split(','):
+        first, dash, last = spec.strip().partition('-')
+        if not dash or not (first or last) or not all(part.isdigit() for part in (first, last) if part):
+            return None
+        if not first:
+            # the last bytes of the file
+            if int(last) > 0 and size > 0:
+                ranges.append((max(size - int(last), 0), size - 1))
+            continue
+        first = int(first)
+        if last and int(last) < first:
+            return None
+        if first < size:
+            ranges.append((first, min(int(last), size - 1) if last else size - 1))
+    if len(ranges) > MAX_RANGES:
+        return None
+    return ranges
+
+
+def requested_ranges(request, etag, stat):
+    """
+    The ranges of the file a request asks for, see parse_ranges. An If-Range header that doesn't match the file any
+    more asks for the whole file.
+    :return: the ranges, or None if the whole file is sent
+    """
+    header = request.META.get('HTTP_RANGE')
+    if not header or request.method not in ('GET', 'HEAD'):
+        return None
+    if_range = request.META.get('HTTP_IF_RANGE')
+    if if_range and if_range not in (quote_etag(etag), http_date(stat.st_mtime)):
+        return None
+    return parse_ranges(header, stat.st_size)
+
+
+def file_chunks(file, parts):
+    """
+    Yields the parts of a multipart response and the ranges of a file. The ranges are read with pread at their
+    offsets, a file that is overwritten in the meantime ends the ranges early instead of failing.
+    :param file: the open file, closed once everything was yielded
+    :param parts: list of (bytes before the range, first byte, last byte, bytes after the range)
+    """
+    try:
+        for before, first, last, after in parts:
+            if before:
+                yield before
+            for offset in range(first, last + 1, RANGE_CHUNK_SIZE):
+                chunk = os.pread(file.fileno(), min(RANGE_CHUNK_SIZE, last + 1 - offset), offset)
+                if not chunk:
+                    # the file was truncated
+                    return
+                yield chunk
+            if after:
+                yield after
+    finally:
+        file.close()
+
+
+def range_response(full_path, size, content_type, ranges):
+    """
+    Answers a range request with 206 Partial Content, with the ranges read from the file. A single range is sent as it
+    is, several ones as multipart/byteranges. No satisfiable range is answered with 416.
+    :param full_path: path of the file
+    :param size: size of the file the ranges were checked against
+    :param content_type: content type of the file
+    :param ranges: list of (first byte, last byte), see parse_ranges
+    :return: the response, or None if the file changed in the meantime and is sent as a whole
+    """
+    if not ranges:
+        response = HttpResponse(status=416)
+        response['Content-Range'] = 'bytes */%d' % size
+        return response
+    file = open(full_path, 'rb')
+    if os.fstat(file.fileno()).st_size != size:
+        file.close()
+        return None
+
+    if len(ranges) == 1:
+        first, last = ranges[0]
+        response = StreamingHttpResponse(file_chunks(file, [(b'', first, last, b'')]), status=206,
+                                         content_type=content_type)
+        response['Content-Range'] = 'bytes %d-%d/%d' % (first, last, size)
+        response['Content-Length'] = last - first + 1
+        return response
+
+    boundary = uuid.uuid4().hex
+    parts = []
+    length = 0
+    for first, last in ranges:
+        before = ('--%s\r\nContent-Type: %s\r\nContent-Range: bytes %d-%d/%d\r\n\r\n'
+                  % (boundary, content_type, first, last, size)).encode('ascii')
+        parts.append((before, first, last, b'\r\n'))
+        length += len(before) + last - first + 1 + 2
+    closing = ('--%s--\r\n' % boundary).encode('ascii')
+    parts[-1] = parts[-1][:3] + (b'\r\n' + closing,)
+    length += len(closing)
+    response = StreamingHttpResponse(file_chunks(file, parts), status=206,
+                                     content_type='multipart/byteranges; boundary=%s' % boundary)
+    response['Content-Length'] = length
+    return response
+
+
+def serve_media(request, path, document_root=None, show_indexes=False):
+    """
+    Serves a media file like django.views.static.serve, with a content based ETag and Last-Modified. A request whose
+    If-None-Match or If-Modified-Since matches is answered with 304 Not Modified. Urls made by versioned_url are
+    cached by the browser for good as long as the version is the current one, other urls are revalidated on every use.
+    If MEDIA_SENDFILE is set, the file is sent by the proxy in front of Django, see sendfile_response. Otherwise byte
+    ranges are supported, so pdf viewers can show the first pages before the whole file arrived and downloads resume.
+    :param request: current request
+    :param path: path of the file relative to document_root
+    :param document_root: the directory files are served from
+    :param show_indexes: whether directories are listed, passed on to django.views.static.serve
+    :return: the response
+    """
+    full_path = resolve(path, document_root)
+    if os.path.isdir(full_path):
+        return serve(request, path, document_root, show_indexes)
+    try:
+        stat = os.stat(full_path)
+        etag = file_etag(full_path)
+    except FileNotFoundError:
+        raise Http404('"%s" does not exist' % path)
+
+    response = get_conditional_response(request, etag=quote_etag(etag), last_modified=int(stat.st_mtime))
+    if response is None:
+        content_type, encoding = mimetypes.guess_type(full_path)
+        content_type = content_type or 'application/octet-stream'
+        if settings.MEDIA_SENDFILE:
+            # the proxy answers range requests itself
+            response = sendfile_response(full_path, document_root, content_type)
+        else:
+            ranges = requested_ranges(request, etag, stat)
+            if ranges is not None:
+                response = range_response(full_path, stat.st_size, content_type, ranges)
+            if ranges is None or response is None:
+                response = FileResponse(open(full_path, 'rb'), content_type=content_type)
+                response['Content-Length'] = stat.st_size
+            response['Accept-Ranges'] = 'bytes'
+        if encoding:
+            response['Content-Encoding'] = encoding
+    response['ETag'] = quote_etag(etag)
+    response['Last-Modified'] = http_date(stat.st_mtime)
+    if request.GET.get('v') == etag[:VERSION_LENGTH]:
+        response['Cache-Control'] = 'private, max-age=%d, immutable' % VERSIONED_MAX_AGE
+    else:
+        response['Cache-Control'] = 'private, no-cache'
+    return response
@@ -0,0 +1,234 @@
+import contextlib
+import json
+import logging
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+# upper bounds in seconds of the histogram buckets durations are counted in
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 25, 60)
+
+# the metrics exposed, with their prometheus type and help text
+METRICS = {
+    'examgenerator_renders_total': ('counter', 'Finished renders by kind and outcome'),
+    'examgenerator_render_seconds': ('histogram', 'Wall clock time of renders'),
+    'examgenerator_render_phase_seconds': ('histogram', 'Time spent in each phase of a render'),
+    'examgenerator_render_cache_hits_total': ('counter', 'Documents restored from the render cache'),
+    'examgenerator_render_cache_misses_total': ('counter', 'Documents not found in the render cache'),
+    'examgenerator_render_coalesced_total': ('counter', 'Documents shared by an identical render running meanwhile'),
+    'examgenerator_render_staged_files_total': ('counter', 'File dependencies staged into work directories'),
+    'examgenerator_render_staged_bytes_total': ('counter', 'Size of the staged file dependencies'),
+    'examgenerator_render_passes_total': ('counter', 'Compiler passes run'),
+    'examgenerator_render_timeouts_total': ('counter', 'Renders that ran out of time'),
+    'examgenerator_render_zip_bytes_total': ('counter', 'Size of the streamed source archives'),
+    'examgenerator_render_busy_total': ('counter', 'Requests refused because all render slots were taken'),
+}
+
+_lock = threading.Lock()
+# (name, labels) -> value for counters, (name, labels) -> [count per bucket..., sum, count] for histograms
+_values = {}
+_local = threading.local()
+
+
+def labels_key(labels):
+    return tuple(sorted(labels.items()))
+
+
+def increment(name, amount=1, **labels):
+    key = (name, labels_key(labels))
+    with _lock:
+        _values[key] = _values.get(key, 0) + amount
+
+
+def observe(name, value, **labels):
+    key = (name, labels_key(labels))
+    with _lock:
+        histogram = _values.setdefault(key, [0] * (len(DURATION_BUCKETS) + 2))
+        for index, bound in enumerate(DURATION_BUCKETS):
+            if value <= bound:
+                histogram[index] += 1
+        histogram[-2] += value
+        histogram[-1] += 1
+
+
+def reset():
+    with _lock:
+        _values.clear()
+
+
+class RenderTrace:
+    """
+    Collects the time spent in each phase of one render and the counts of what it did, e.g. cache hits or bytes
+    staged. Phases of the same name add up, also if threads of the same render run them at the same time.
+    """
+
+    def __init__(self, kind):
+        self.kind = kind
+        self.outcome = 'ok'
+        self.phases = {}
+        self.counts = {}
+        # further facts about the render for the log line, e.g. the compiler
+        self.details = {}
+        self.start = time.monotonic()
+        self.lock = threading.Lock()
+
+    def record(self, phase, seconds):
+        with self.lock:
+            self.phases[phase] = self.phases.get(phase, 0) + seconds
+
+    def add(self, name, amount=1):
+        with self.lock:
+            self.counts[name] = self.counts.get(name, 0) + amount
+
+    @contextlib.contextmanager
+    def phase(self, name):
+        start = time.monotonic()
+        try:
+            yield
+        finally:
+            self.record(name, time.monotonic() - start)
+
+    def finish(self):
+        """
+        Adds the render to the metrics and writes one log line with everything recorded, as JSON.
+        """
+        duration = time.monotonic() - self.start
+        increment('examgenerator_renders_total', kind=self.kind, outcome=self.outcome)
+        observe('examgenerator_render_seconds', duration, kind=self.kind)
+        for phase, seconds in self.phases.items():
+            observe('examgenerator_render_phase_seconds', seconds, kind=self.kind, phase=phase)
+        for name, amount in self.counts.items():
+            increment('examgenerator_render_%s_total' % name, amount, kind=self.kind)
+        line = dict(self.details)
+        line.update({'event': 'render', 'kind': self.kind, 'outcome': self.outcome, 'seconds': round(duration, 4),
+                     'phases': {phase: round(seconds, 4) for phase, seconds in self.phases.items()},
+                     'counts': self.counts})
+        logger.info(json.dumps(line, sort_keys=True))
+
+
+def current():
+    return getattr(_local, 'trace', None)
+
+
+@contextlib.contextmanager
+def trace(kind):
+    """
+    Traces a render. Nested traces, e.g. the render_pdf call of pdf_render_and_copy, are part of the outer one.
+    An exception sets the outcome to 'error' unless the render set another one already.
+
+        with metrics.trace('exam') as render_trace:
+            ...
+            render_trace.outcome = 'timeout'
+    """
+    outer = current()
+    if outer is not None:
+        yield outer
+        return
+    render_trace = RenderTrace(kind)
+    _local.trace = render_trace
+    try:
+        yield render_trace
+    except BaseException:
+        if render_trace.outcome == 'ok':
+            render_trace.outcome = 'error'
+        raise
+    finally:
+        _local.trace = None
+        render_trace.finish()
+
+
+@contextlib.contextmanager
+def attach(render_trace):
+    """
+    Makes a trace the current one in another thread, e.g. in the threads rendering the exam variants.
+    """
+    outer = current()
+    _local.trace = render_trace
+    try:
+        yield render_trace
+    finally:
+        _local.trace = outer
+
+
+def phase(name):
+    """
+    Times a phase of the current render. Does nothing outside of a render.
+    """
+    render_trace = current()
+    if render_trace is None:
+        return contextlib.nullcontext()
+    return render_trace.phase(name)
+
+
+def record(phase_name, seconds):
+    render_trace = current()
+    if render_trace is not None:
+        render_trace.record(phase_name, seconds)
+
+
+def add(name, amount=1):
+    render_trace = current()
+    if render_trace is not None:
+        render_trace.add(name, amount)
+
+
+def traced_stream(kind, chunks):
+    """
+    Passes on the chunks of a streamed response, e.g. a zip archive built while it is sent, and traces producing them
+    in the phase 'zip'. Sending them is not part of the trace.
+    :param kind: kind of the trace
+    :param chunks: iterable of byte strings
+    :return: generator of the same byte strings
+    """
+    render_trace = RenderTrace(kind)
+    iterator = iter(chunks)
+    try:
+        while True:
+            with render_trace.phase('zip'):
+                chunk = next(iterator, None)
+            if chunk is None:
+                break
+            render_trace.add('zip_bytes', len(chunk))
+            yield chunk
+    except GeneratorExit:
+        # the client went away
+        render_trace.outcome = 'aborted'
+        raise
+    except BaseException:
+        render_trace.outcome = 'error'
+        raise
+    finally:
+        render_trace.finish()
+
+
+def format_labels(labels, **extra):
+    labels = list(labels) + sorted(extra.items())
+    if not labels:
+        return ''
+    return '{%s}' % ','.join('%s="%s"' % (name, str(value).replace('\\', '\\\\').replace('"', '\\"'))
+                             for name, value in labels)
+
+
+def exposition():
+    """
+    The metrics of this process in the prometheus text format. Every process serving the app counts on its own.
+    """
+    with _lock:
+        values = {key: list(value) if isinstance(value, list) else value for key, value in _values.items()}
+    lines = []
+    for name, (metric_type, help_text) in METRICS.items():
+        lines.append('# HELP %s %s' % (name, help_text))
+        lines.append('# TYPE %s %s' % (name, metric_type))
+        for (metric_name, labels), value in sorted(values.items()):
+            if metric_name != name:
+                continue
+            if metric_type == 'counter':
+                lines.append('%s%s %s' % (name, format_labels(labels), value))
+                continue
+            for bound, bucket_count in zip(DURATION_BUCKETS, value):
+                lines.append('%s_bucket%s %d' % (name, format_labels(labels, le=bound), bucket_count))
+            lines.append('%s_bucket%s %d' % (name, format_labels(labels, le='+Inf'), value[-1]))
+            lines.append('%s_sum%s %s' % (name, format_labels(labels), round(value[-2], 6)))
+            lines.append('%s_count%s %d' % (name, format_labels(labels), value[-1]))
+    return '\n'.join(lines) + '\n'
@@ -0,0 +1,32 @@
+from django.conf import settings
+from django.http import HttpResponse
+
+from . import metrics
+from .admission import RenderBusy
+from .cancellation import RenderCancelled
+
+
+class RenderBusyMiddleware:
+    """
+    Answers requests whose render was refused by admission control with 503 Service Unavailable, telling the client
+    when to try again. Requests whose render was superseded by a newer render of the same user are answered with 409
+    Conflict, the newer request shows the result.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        return self.get_response(request)
+
+    def process_exception(self, request, exception):
+        if isinstance(exception, RenderCancelled):
+            return HttpResponse('The render was replaced by a newer render of the same document.',
+                                content_type='text/plain', status=409)
+        if not isinstance(exception, RenderBusy):
+            return None
+        metrics.increment('examgenerator_render_busy_total')
+        response = HttpResponse('The server is busy rendering other documents, please try again in a few seconds.',
+                                content_type='text/plain', status=503)
+        response['Retry-After'] = str(settings.RENDER_RETRY_AFTER)
+        return response
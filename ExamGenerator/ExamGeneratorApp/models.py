@@ -1,7 +1,15 @@
+import json
+import os
+
+from django.conf import settings
 from django.contrib.auth import get_user_model
-from django.db import models
+from django.db import models, transaction
+from django.db.models.signals import post_delete
+from django.dispatch import receiver
 from django.urls import reverse
 
+from . import header_variants
+
 
 def get_sentinel_user():
     return get_user_model().objects.get_or_create(username='deleted')[0]
@@ -15,7 +23,38 @@ class Topic(models.Model):
 
 
 class FileDependency(models.Model):
+    """
+    A file that exercises and headers depend on, stored once by the SHA-256 of its content, see blob_store. Exercises
+    and headers refer to it through DependencyLink under the name their latex code uses, so the same logo in many
+    headers and every version of an exercise share one file. It is deleted with its last link.
+    """
     file = models.FileField(upload_to='dependencies/')
+    sha256 = models.CharField(max_length=64, unique=True)
+    size = models.BigIntegerField(default=0)
+
+    def path(self):
+        return os.path.join(settings.MEDIA_ROOT, self.file.name)
+
+    def release(self):
+        """
+        Deletes the file unless an exercise or header still refers to it. Its content is removed once the transaction
+        commits, so a rollback keeps both.
+        """
+        if self.links.exists():
+            return
+        self.delete()
+        sha256, path = self.sha256, self.path()
+
+        def remove_content():
+            # stored again in the meantime
+            if FileDependency.objects.filter(sha256=sha256).exists():
+                return
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+
+        transaction.on_commit(remove_content)
 
 
 class LatexSnippet(models.Model):
@@ -65,6 +104,60 @@ class LatexSnippet(models.Model):
 
 class Header(LatexSnippet):
     name = models.TextField(max_length=150, verbose_name='name', default='', unique=True)
+    # the TeX engine documents with this header are compiled with, see compilers.py. Empty uses RENDER_COMPILER
+    compilerChoices = (
+        ('', 'Default compiler'),
+        ('pdflatex', 'pdflatex'),
+        ('lualatex', 'lualatex'),
+        ('xelatex', 'xelatex'),
+        ('latexmk', 'latexmk')
+    )
+    compiler = models.TextField(choices=compilerChoices, default='', blank=True)
+    # JSON encoded variants of the latex code with the location of their score tabular, see
+    # header_variants.HeaderStructure.variants. Put together on save, so renders use them as they are
+    variants = models.TextField(default='{}', editable=False)
+    # whether the files of the header's old dependency directory were imported, see blob_store.import_legacy_dir
+    legacy_imported = models.BooleanField(default=False, editable=False)
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # what the stored variants were put together from
+        instance._variants_source = (instance.__dict__.get('latex_code'), instance.__dict__.get('language'))
+        return instance
+
+    def save(self, *args, **kwargs):
+        self.variants = json.dumps(header_variants.HeaderStructure(self.latex_code, self.language).variants())
+        self._variants_source = (self.latex_code, self.language)
+        super().save(*args, **kwargs)
+
+    def get_variants(self):
+        """
+        The variants of the header, the stored ones unless the latex code or language changed since it was saved.
+        :return: dictionary variant key -> {'latex_code': code, 'scoreTable': [start, end] or None}
+        """
+        source = (self.latex_code, self.language)
+        cached = getattr(self, '_variants_cache', None)
+        if cached is not None and cached[0] == source:
+            return cached[1]
+        variants = {}
+        if getattr(self, '_variants_source', None) == source:
+            variants = json.loads(self.variants)
+        if len(variants) != len(header_variants.VARIANTS):
+            # changed, or saved before the variants were stored
+            variants = header_variants.HeaderStructure(self.latex_code, self.language).variants()
+        self._variants_cache = (source, variants)
+        return variants
+
+    def variant(self, include_solutions, include_disclaimer):
+        """
+        A variant of the header, the way it is put in front of the exercises.
+        :param include_solutions: whether or not the solutions are to be included
+        :param include_disclaimer: whether or not to include the disclaimer
+        :return: tuple (latex code, (start, end) of the score tabular in it or None), see score_table.locate
+        """
+        variant = self.get_variants()[header_variants.variant_key(include_solutions, include_disclaimer)]
+        return variant['latex_code'], variant['scoreTable'] and tuple(variant['scoreTable'])
 
     def __str__(self):
         return self.name
@@ -100,6 +193,8 @@ class Exercise(models.Model):
     topic = models.ForeignKey(Topic,
                               on_delete=models.SET_NULL,
                               null=True)
+    # whether the files of the exercise's old dependency directory were imported, see blob_store.import_legacy_dir
+    legacy_imported = models.BooleanField(default=False, editable=False)
 
     def get_absolute_url(self):
         return reverse('exercise detail', kwargs={'pk': self.pk})
@@ -137,3 +232,58 @@ class Content(models.Model):
     exam = models.ForeignKey(Exam, on_delete=models.CASCADE)
     exercise = models.ForeignKey(Exercise, on_delete=models.CASCADE)
     position = models.IntegerField()
+
+
+class RenderJob(models.Model):
+    """
+    A render that is handed to the render worker pool instead of blocking the request. The page that started the job
+    polls its status and reloads once it is finished. The result is the JSON encoded context the page needs to display
+    the outcome of the render.
+    """
+    statusChoices = (
+        ('queued', 'Queued'),
+        ('running', 'Running'),
+        ('done', 'Done'),
+        ('failed', 'Failed')
+    )
+    owner = models.ForeignKey(get_user_model(), on_delete=models.CASCADE)
+    kind = models.TextField()
+    status = models.TextField(choices=statusChoices, default='queued')
+    creationDate = models.DateTimeField(auto_now_add=True)
+    finishDate = models.DateTimeField(null=True, blank=True)
+    result = models.TextField(default='{}')
+
+    def is_finished(self):
+        return self.status in ('done', 'failed')
+
+    def get_result(self):
+        return json.loads(self.result)
+
+
+class DependencyLink(models.Model):
+    """
+    The manifest entry making a stored file available to an exercise or a header under a file name. Exactly one of
+    exercise and header is set.
+    """
+    dependency = models.ForeignKey(FileDependency, on_delete=models.PROTECT, related_name='links')
+    exercise = models.ForeignKey(Exercise, on_delete=models.CASCADE, null=True, blank=True)
+    header = models.ForeignKey(Header, on_delete=models.CASCADE, null=True, blank=True)
+    name = models.TextField()
+
+    class Meta:
+        # a name refers to one file per exercise or header, even if two renders import the same legacy directory
+        constraints = [
+            models.UniqueConstraint(fields=['exercise', 'name'], condition=models.Q(exercise__isnull=False),
+                                    name='unique_exercise_dependency_name'),
+            models.UniqueConstraint(fields=['header', 'name'], condition=models.Q(header__isnull=False),
+                                    name='unique_header_dependency_name'),
+        ]
+
+
+@receiver(post_delete, sender=DependencyLink)
+def release_dependency(sender, instance, **kwargs):
+    # also runs for the links deleted along with their exercise or header
+    try:
+        instance.dependency.release()
+    except FileDependency.DoesNotExist:
+        pass
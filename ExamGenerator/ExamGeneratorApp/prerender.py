@@ -0,0 +1,107 @@
+import logging
+import os
+import tempfile
+import threading
+import uuid
+
+from django.conf import settings
+from django.db import connection, transaction
+
+from . import cancellation
+from . import render_jobs
+from .admission import RenderBusy
+from .cancellation import RenderCancelled
+
+logger = logging.getLogger(__name__)
+
+_lock = threading.Lock()
+# user pk -> the timer of the pre-render this process scheduled last
+_timers = {}
+
+
+def schedule(user, render):
+    """
+    Schedules a pre-render of the user's current exam, RENDER_PRERENDER_DELAY seconds after the last change. Every
+    change starts the delay again, so a burst of changes renders once. A pre-render that is running already when the
+    next change arrives is superseded and discards its result, its compiler is stopped right away by cancelling the
+    renders of the exam. The delay starts once the change is committed, so the render sees it. The pre-render scheduled
+    last is recorded in RENDER_SLOT_DIR, so changes arriving at different web processes are debounced together as well.
+    :param user: the user whose exam changed
+    :param render: callable rendering the exam, run by a render worker. It gets a callable returning True once the
+    render is superseded
+    :return: nothing
+    """
+    if settings.RENDER_PRERENDER_DELAY is None:
+        return
+    # the exam renders running now render the exam as it was before the change
+    cancellation.cancel_target(user, 'exam')
+    transaction.on_commit(lambda: debounce(user.pk, render, settings.RENDER_PRERENDER_DELAY))
+
+
+def generation_path(user_pk):
+    return os.path.join(settings.RENDER_SLOT_DIR, 'prerender', '%d' % user_pk)
+
+
+def record_generation(user_pk, generation):
+    path = generation_path(user_pk)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    handle, temp_path = tempfile.mkstemp(prefix='.prerender-', dir=os.path.dirname(path))
+    with os.fdopen(handle, 'w') as f:
+        f.write(generation)
+    os.replace(temp_path, path)
+
+
+def debounce(user_pk, render, delay):
+    """
+    Supersedes the pre-render scheduled last for the user, in any process, and submits render to the render workers
+    after delay seconds, unless it is superseded by then as well.
+    """
+    generation = uuid.uuid4().hex
+    with _lock:
+        record_generation(user_pk, generation)
+        timer = _timers.get(user_pk)
+        if timer is not None:
+            timer.cancel()
+        timer = threading.Timer(delay, submit, (user_pk, generation, render))
+        timer.daemon = True
+        _timers[user_pk] = timer
+        timer.start()
+
+
+def is_superseded(user_pk, generation):
+    try:
+        with open(generation_path(user_pk)) as f:
+            return f.read() != generation
+    except FileNotFoundError:
+        return True
+
+
+def submit(user_pk, generation, render):
+    with _lock:
+        # submit runs in the timer thread
+        if _timers.get(user_pk) is threading.current_thread():
+            del _timers[user_pk]
+        if is_superseded(user_pk, generation):
+            return
+    render_jobs.get_executor().submit(run, user_pk, generation, render)
+
+
+def run(user_pk, generation, render):
+    """
+    Runs a pre-render in a render worker, unless a newer one was scheduled while it was waiting for the worker.
+    """
+    if is_superseded(user_pk, generation):
+        return
+    try:
+        render(lambda: is_superseded(user_pk, generation))
+    except RenderCancelled:
+        # a newer render of the exam is on its way
+        pass
+    except RenderBusy:
+        # pre-renders are a convenience, the render starts again when the user opens the exam
+        logger.info('Skipped the pre-render of the exam of user %d, all render slots are taken', user_pk)
+    except Exception:
+        logger.exception('Pre-render of the exam of user %d failed', user_pk)
+    finally:
+        # worker threads get their own database connection, which would otherwise stay open forever
+        connection.close()
@@ -0,0 +1,238 @@
+import fcntl
+import hashlib
+import os
+import shutil
+import tempfile
+import time
+
+from django.conf import settings
+
+from .admission import POLL_INTERVAL
+
+# bump this whenever the way documents are compiled changes, so old entries are no longer hit
+CACHE_VERSION = 'pdflatex-nonstopmode-1'
+
+# files pdflatex and the log summary create next to a document. These are never treated as dependencies of a render
+LATEX_OUTPUT_EXTENSIONS = ('.pdf', '.log', '.aux', '.out', '.toc', '.log.json')
+
+# the outputs that are stored in the cache and restored on a hit
+CACHED_EXTENSIONS = ('.pdf', '.log', '.log.json')
+
+# files written by render_pdf itself that are not dependencies either
+IGNORED_FILES = ('err_log.txt',)
+
+# directory in the cache holding the locks of the renders running right now, see Flight
+FLIGHT_DIR = '.flights'
+
+
+def file_digest(path):
+    """
+    Computes the sha256 hex digest of a file without loading it into memory at once.
+    :param path: path of the file
+    :return: the hex digest
+    """
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(64 * 1024), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def dependency_files(work_dir, document_name):
+    """
+    Lists the files in a work directory that a render depends on, i.e. everything that was staged there except the
+    document itself and the outputs of previous pdflatex runs.
+    :param work_dir: the directory the document is rendered in
+    :param document_name: file name of the document
+    :return: sorted list of file names
+    """
+    documents = {os.path.splitext(document_name)[0]}
+    for name in os.listdir(work_dir):
+        stem, extension = os.path.splitext(name)
+        if extension == '.tex':
+            documents.add(stem)
+
+    outputs = {stem + extension for stem in documents for extension in LATEX_OUTPUT_EXTENSIONS}
+    files = []
+    for name in os.listdir(work_dir):
+        if name == document_name or name in IGNORED_FILES or name in outputs:
+            continue
+        if not os.path.isfile(os.path.join(work_dir, name)):
+            continue
+        files.append(name)
+    return sorted(files)
+
+
+def render_key(document, work_dir, document_name, compiler_name='pdflatex'):
+    """
+    Computes the cache key of a render. The key covers the compiler, the assembled document and the name and content
+    of every dependency staged in the work directory, so two renders with the same key produce the same output.
+    :param document: the complete latex document as a string
+    :param work_dir: the directory the document is rendered in
+    :param document_name: file name of the document
+    :param compiler_name: name of the compiler, see compilers.COMPILERS
+    :return: the key as hex string
+    """
+    digest = hashlib.sha256()
+    digest.update(CACHE_VERSION.encode('utf-8'))
+    digest.update(b'\0')
+    digest.update(compiler_name.encode('utf-8'))
+    digest.update(b'\0')
+    digest.update(document.encode('utf-8'))
+    for name in dependency_files(work_dir, document_name):
+        digest.update(b'\0')
+        digest.update(name.encode('utf-8'))
+        digest.update(b'\0')
+        digest.update(file_digest(os.path.join(work_dir, name)).encode('utf-8'))
+    return digest.hexdigest()
+
+
+def entry_path(key):
+    return os.path.join(settings.RENDER_CACHE_DIR, key)
+
+
+def lookup(key, work_dir, document_stem):
+    """
+    Restores the cached outputs of a render into the work directory, named after the document.
+    :param key: the key computed by render_key
+    :param work_dir: the directory the document is rendered in
+    :param document_stem: the document name without extension
+    :return: True if the render was cached and the outputs were restored, False otherwise
+    """
+    entry = entry_path(key)
+    if not os.path.isdir(entry):
+        return False
+    try:
+        for extension in CACHED_EXTENSIONS:
+            cached_file = os.path.join(entry, 'output' + extension)
+            if os.path.exists(cached_file):
+                shutil.copy(cached_file, os.path.join(work_dir, document_stem + extension))
+        # the modification time of an entry is its last use, which is what eviction sorts by
+        os.utime(entry)
+    except FileNotFoundError:
+        # the entry was evicted while we were reading it
+        return False
+    return True
+
+
+def store(key, work_dir, document_stem):
+    """
+    Stores the outputs of a finished render in the cache and evicts old entries if the cache grew too large.
+    :param key: the key computed by render_key
+    :param work_dir: the directory the document was rendered in
+    :param document_stem: the document name without extension
+    :return: nothing
+    """
+    cache_dir = settings.RENDER_CACHE_DIR
+    if not os.path.isdir(cache_dir):
+        os.makedirs(cache_dir, exist_ok=True)
+    if os.path.isdir(entry_path(key)):
+        return
+
+    # build the entry in a temporary directory and move it in place, so readers never see a partial entry
+    tmp_entry = tempfile.mkdtemp(prefix='.tmp-', dir=cache_dir)
+    for extension in CACHED_EXTENSIONS:
+        output = os.path.join(work_dir, document_stem + extension)
+        if os.path.exists(output):
+            shutil.copy(output, os.path.join(tmp_entry, 'output' + extension))
+    try:
+        os.rename(tmp_entry, entry_path(key))
+    except OSError:
+        # someone else stored the same render in the meantime
+        shutil.rmtree(tmp_entry, ignore_errors=True)
+    evict(settings.RENDER_CACHE_MAX_SIZE)
+
+
+class Flight:
+    """
+    Coalesces identical renders. The first render of a key takes a lock in the cache directory, renders and stores
+    the result. Renders of the same key starting meanwhile, in this or another process, wait for the lock and then
+    find the result in the cache instead of running the compiler on the same input again.
+
+        flight = Flight(key)
+        if flight.join(timeout) and lookup(key, ...):
+            # an identical render finished while we waited
+        try:
+            ... render and store ...
+        finally:
+            flight.release()
+    """
+
+    def __init__(self, key):
+        self.path = os.path.join(settings.RENDER_CACHE_DIR, FLIGHT_DIR, key + '.lock')
+        self.lock_file = None
+
+    def join(self, timeout):
+        """
+        Takes the lock of the key, waiting at most timeout seconds for a render holding it. If the wait times out the
+        render goes ahead without the lock.
+        :param timeout: the longest wait in seconds
+        :return: True if another render of the key held the lock, so its result may be in the cache now
+        """
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        deadline = time.monotonic() + timeout
+        waited = False
+        while True:
+            lock_file = open(self.path, 'a')
+            try:
+                fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except OSError:
+                lock_file.close()
+                if time.monotonic() > deadline:
+                    return waited
+                waited = True
+                time.sleep(POLL_INTERVAL)
+                continue
+            # the holder removes the file before it releases the lock, a lock on a removed file locks nothing
+            try:
+                if os.fstat(lock_file.fileno()).st_ino == os.stat(self.path).st_ino:
+                    self.lock_file = lock_file
+                    return waited
+            except FileNotFoundError:
+                pass
+            lock_file.close()
+
+    def release(self):
+        if self.lock_file is None:
+            return
+        try:
+            os.remove(self.path)
+        except FileNotFoundError:
+            pass
+        self.lock_file.close()
+        self.lock_file = None
+
+
+def entry_size(entry):
+    size = 0
+    for name in os.listdir(entry):
+        size += os.path.getsize(os.path.join(entry, name))
+    return size
+
+
+def evict(max_size):
+    """
+    Deletes the least recently used entries until the cache is at most max_size bytes large.
+    :param max_size: the size limit in bytes
+    :return: nothing
+    """
+    cache_dir = settings.RENDER_CACHE_DIR
+    entries = []
+    total_size = 0
+    for name in os.listdir(cache_dir):
+        entry = os.path.join(cache_dir, name)
+        if name.startswith('.') or not os.path.isdir(entry):
+            continue
+        try:
+            size = entry_size(entry)
+            entries.append((os.path.getmtime(entry), size, entry))
+        except FileNotFoundError:
+            continue
+        total_size += size
+
+    entries.sort()
+    for _, size, entry in entries:
+        if total_size <= max_size:
+            break
+        shutil.rmtree(entry, ignore_errors=True)
+        total_size -= size
@@ -0,0 +1,99 @@
+import datetime
+import json
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.db import connection
+from django.utils import timezone
+
+from .admission import RenderBusy
+from .cancellation import RenderCancelled
+from .models import RenderJob
+
+logger = logging.getLogger(__name__)
+
+_executor = None
+_executor_lock = threading.Lock()
+
+# finished jobs older than this are deleted when new jobs are enqueued
+JOB_RETENTION = datetime.timedelta(days=1)
+
+
+def get_executor():
+    """
+    Returns the render worker pool, creating it on first use. Every worker drives one pdflatex process at a time, so
+    RENDER_WORKERS is the number of renders this process runs in parallel. Every web process has a pool of its own,
+    the renders of all of them together are limited by the render slots, see admission.render_slot.
+    """
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=settings.RENDER_WORKERS, thread_name_prefix='render-worker')
+        return _executor
+
+
+def fail_lost_jobs(owner):
+    """
+    Marks the user's jobs as failed that are queued or running for longer than RENDER_JOB_LOST_AFTER seconds. The
+    worker pools live in the web processes, so a restart loses their jobs, and pages waiting for them would poll
+    forever otherwise.
+    :param owner: the user whose jobs are checked
+    :return: nothing
+    """
+    cutoff = timezone.now() - datetime.timedelta(seconds=settings.RENDER_JOB_LOST_AFTER)
+    RenderJob.objects.filter(owner=owner, status__in=('queued', 'running'), creationDate__lt=cutoff) \
+        .update(status='failed', finishDate=timezone.now())
+
+
+def enqueue(owner, kind, task):
+    """
+    Creates a render job and hands it to the worker pool. If RENDER_ASYNC is False the task is run right away and the
+    returned job is already finished.
+    :param owner: the user the job belongs to, only they can see its status
+    :param kind: short description of what is rendered, e.g. 'exam'
+    :param task: callable doing the actual rendering. It returns a JSON serializable dictionary which is stored as the
+    job's result
+    :return: the RenderJob
+    """
+    RenderJob.objects.filter(finishDate__lt=timezone.now() - JOB_RETENTION).delete()
+    job = RenderJob.objects.create(owner=owner, kind=kind)
+    if settings.RENDER_ASYNC:
+        get_executor().submit(run_job, job.pk, task)
+    else:
+        run_job(job.pk, task)
+        job.refresh_from_db()
+    return job
+
+
+def run_job(job_pk, task):
+    """
+    Executes a job's task and stores its result.
+    :param job_pk: primary key of the RenderJob
+    :param task: the callable given to enqueue
+    :return: nothing
+    """
+    RenderJob.objects.filter(pk=job_pk).update(status='running')
+    try:
+        result = task()
+        status = 'done'
+    except Exception as e:
+        if not settings.RENDER_ASYNC:
+            RenderJob.objects.filter(pk=job_pk).update(status='failed', finishDate=timezone.now())
+            raise
+        if isinstance(e, RenderBusy):
+            # the page showing the job result answers with 503 then, like a synchronous render would
+            result = {'render_busy': True}
+        elif isinstance(e, RenderCancelled):
+            # a newer job of the same user replaced this one
+            result = {'render_cancelled': True}
+        else:
+            logger.exception('Render job %d failed', job_pk)
+            result = None
+        status = 'failed'
+    RenderJob.objects.filter(pk=job_pk).update(status=status, finishDate=timezone.now(),
+                                               result=json.dumps(result or {}))
+    if settings.RENDER_ASYNC:
+        # worker threads get their own database connection, which would otherwise stay open forever
+        connection.close()
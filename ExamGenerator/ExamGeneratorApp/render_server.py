@@ -0,0 +1,207 @@
+import json
+import logging
+import multiprocessing
+import os
+import socket
+import socketserver
+import subprocess
+
+from django.conf import settings
+
+from . import cancellation
+from . import compile_driver
+from . import latex_format
+from . import metrics
+from .admission import RenderBusy
+from .compilers import COMPILERS
+
+logger = logging.getLogger(__name__)
+
+# seconds a client waits for the server on top of the render timeout, e.g. for a free worker or render slot
+REPLY_GRACE = 5
+
+
+def check_request(request):
+    """
+    Checks a request before it is compiled. The compiler command is built from it, so only the registered compilers,
+    the header format option and a plain file name as the document are accepted.
+    :param request: the request dictionary, see compile_job
+    :return: nothing
+    :raises ValueError: if the request asks for anything else
+    """
+    if not isinstance(request, dict):
+        raise ValueError('The request is not a dictionary')
+    compiler = COMPILERS.get(request.get('compiler'))
+    if compiler is None:
+        raise ValueError('Unknown compiler %r' % request.get('compiler'))
+    for option in request.get('options', []):
+        if option != latex_format.FORMAT_OPTION or not compiler.supports_formats:
+            raise ValueError('Option %r is not allowed for %s' % (option, compiler.name))
+    document_name = request.get('document_name')
+    if not isinstance(document_name, str) or os.path.basename(document_name) != document_name \
+            or document_name.startswith('-'):
+        raise ValueError('Invalid document name %r' % document_name)
+
+
+def compile_job(request):
+    """
+    Compiles a document for a client. Runs in the worker processes of the render server.
+    :param request: dictionary with the arguments of compile_driver.compile_document, the compiler by name, checked
+    by check_request
+    :return: reply dictionary with the passes run and the phases timed, or 'timeout' with the compiler output,
+    'busy' if no render slot became free or 'cancelled' if a newer render of the same target superseded it
+    """
+    render_trace = metrics.RenderTrace('server')
+    reply = {'pid': os.getpid()}
+    # the render of the client, so the compiler stops once a newer render of the same target supersedes it
+    ticket = request.get('ticket') and cancellation.RenderTicket.restore(request['ticket'])
+    try:
+        with metrics.attach(render_trace), cancellation.attach(ticket):
+            reply['passes'] = compile_driver.compile_document(
+                COMPILERS[request['compiler']], request['work_dir'], request['document_name'],
+                options=request['options'], store_dir=request['store_dir'], timeout=request['timeout'])
+    except cancellation.RenderCancelled as e:
+        reply['cancelled'] = str(e)
+    except subprocess.TimeoutExpired as e:
+        reply['timeout'] = (e.stdout or b'').decode('utf8', errors='replace')
+    except RenderBusy as e:
+        reply['busy'] = str(e)
+    reply['phases'] = render_trace.phases
+    return reply
+
+
+class RenderRequestHandler(socketserver.StreamRequestHandler):
+    """
+    Reads one request as a JSON line, has a worker compile the document and answers with the reply as a JSON line.
+    """
+
+    def handle(self):
+        line = self.rfile.readline()
+        if not line:
+            return
+        try:
+            request = json.loads(line)
+            check_request(request)
+        except ValueError as e:
+            logger.warning('Render server rejected a request: %s', e)
+            reply = {'error': 'Rejected: %s' % e}
+        else:
+            try:
+                reply = self.server.pool.apply(compile_job, (request,))
+            except Exception as e:
+                logger.exception('Render server job failed')
+                reply = {'error': '%s: %s' % (type(e).__name__, e)}
+        self.wfile.write(json.dumps(reply).encode('utf-8') + b'\n')
+
+
+class RenderServer(socketserver.ThreadingUnixStreamServer):
+    """
+    Compiles documents for the web processes of this machine, see the render_server command. The documents are
+    compiled by a pool of worker processes that are started once, so a job doesn't pay for starting python and
+    importing Django. Every worker is replaced after max_jobs jobs, which bounds what a leaking worker can hold on to.
+    """
+    daemon_threads = True
+
+    def __init__(self, socket_path, workers, max_jobs):
+        if os.path.exists(socket_path):
+            if is_listening(socket_path):
+                raise OSError('A render server is listening on %s already' % socket_path)
+            # left over by a server that was killed
+            os.remove(socket_path)
+        os.makedirs(os.path.dirname(os.path.abspath(socket_path)), exist_ok=True)
+        # start the workers before the server starts any threads
+        self.pool = multiprocessing.Pool(workers, maxtasksperchild=max_jobs)
+        try:
+            super().__init__(socket_path, RenderRequestHandler)
+        except OSError:
+            self.pool.terminate()
+            raise
+
+    def server_bind(self):
+        super().server_bind()
+        # only processes of the user running the server may connect, whatever the umask is
+        os.chmod(self.server_address, 0o600)
+
+    def server_close(self):
+        super().server_close()
+        self.pool.terminate()
+        self.pool.join()
+        try:
+            os.remove(self.server_address)
+        except FileNotFoundError:
+            pass
+
+
+def is_listening(socket_path):
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as client:
+        try:
+            client.connect(socket_path)
+            return True
+        except OSError:
+            return False
+
+
+def request_compile(request):
+    """
+    Sends a request to the render server and waits for the reply.
+    :param request: the request dictionary, see compile_job
+    :return: the reply dictionary
+    :raises socket.timeout: if the server didn't answer in time
+    :raises OSError: if there is no server or the connection broke
+    """
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as client:
+        client.settimeout(request['timeout'] + settings.RENDER_QUEUE_TIMEOUT + REPLY_GRACE)
+        client.connect(settings.RENDER_SERVER_SOCKET)
+        client.sendall(json.dumps(request).encode('utf-8') + b'\n')
+        with client.makefile('rb') as reply_file:
+            line = reply_file.readline()
+    if not line:
+        raise ConnectionError('The render server closed the connection')
+    return json.loads(line)
+
+
+def compile_document(compiler, work_dir, document_name, options=(), store_dir=None, timeout=25):
+    """
+    Like compile_driver.compile_document, but the document is compiled by the render server if RENDER_SERVER_SOCKET
+    is set. If the server isn't running the document is compiled in this process.
+    :param compiler: the Compiler, see compilers.get_compiler
+    :param work_dir: the directory the document is rendered in
+    :param document_name: file name of the document
+    :param options: additional command line options for the compiler
+    :param store_dir: directory to keep the auxiliary files in between renders
+    :param timeout: timeout for all passes together
+    :return: the number of passes run
+    :raises subprocess.TimeoutExpired: if the passes took longer than timeout
+    :raises admission.RenderBusy: if no render slot became free
+    :raises cancellation.RenderCancelled: if a newer render of the same target superseded this one
+    """
+    if not settings.RENDER_SERVER_SOCKET:
+        return compile_driver.compile_document(compiler, work_dir, document_name, options=options,
+                                               store_dir=store_dir, timeout=timeout)
+    # the server has a working directory of its own
+    ticket = cancellation.current()
+    request = {'compiler': compiler.name, 'work_dir': os.path.abspath(work_dir), 'document_name': document_name,
+               'options': list(options), 'store_dir': store_dir and os.path.abspath(store_dir), 'timeout': timeout,
+               'ticket': ticket and ticket.state()}
+    try:
+        reply = request_compile(request)
+    except socket.timeout:
+        raise subprocess.TimeoutExpired(compiler.command(document_name, options), timeout, output=b'')
+    except OSError as e:
+        logger.warning('Render server unavailable, compiling in process: %s', e)
+        return compile_driver.compile_document(compiler, work_dir, document_name, options=options,
+                                               store_dir=store_dir, timeout=timeout)
+
+    for phase, seconds in reply.get('phases', {}).items():
+        metrics.record(phase, seconds)
+    cancellation.check()
+    if 'cancelled' in reply:
+        raise cancellation.RenderCancelled(reply['cancelled'])
+    if 'timeout' in reply:
+        raise subprocess.TimeoutExpired(compiler.command(document_name, options), timeout,
+                                        output=reply['timeout'].encode('utf8'))
+    if 'busy' in reply:
+        raise RenderBusy(reply['busy'])
+    if 'error' in reply:
+        raise RuntimeError('The render server failed: %s' % reply['error'])
+    return reply['passes']
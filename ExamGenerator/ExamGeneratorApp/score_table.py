@@ -0,0 +1,95 @@
+class ScoreTable:
+    """
+    (Customer specific)
+    The score tabular of an exam in one language: a column for every exercise and one for the sum, with a row for the
+    exercise numbers, one for the points of the exercises and one for the points achieved. The tabular of a header is
+    found by a keyphrase between its "\\begin{tabular}" and "\\end{tabular}", which has to be unique in the header.
+    """
+
+    def __init__(self, keyphrase, first_column, exercise_label, points_label, achieved_label, show_points=True,
+                 blank=''):
+        """
+        :param keyphrase: phrase identifying the tabular to replace
+        :param first_column: column specification of the column with the row labels
+        :param exercise_label: label of the row with the exercise numbers
+        :param points_label: label of the row with the points of the exercises
+        :param achieved_label: label of the row the achieved points are written in
+        :param show_points: whether the points of the exercises and their sum are filled in
+        :param blank: content of the empty cells of the achieved points
+        """
+        self.keyphrase = keyphrase
+        self.first_column = first_column
+        self.exercise_label = exercise_label
+        self.points_label = points_label
+        self.achieved_label = achieved_label
+        self.show_points = show_points
+        self.blank = blank
+
+    def locate(self, tex_code):
+        """
+        Finds the tabular to replace, from the "tabular" of its "\\begin{tabular}" up to the "tabular" of its
+        "\\end{tabular}".
+        :param tex_code: the latex code of a header
+        :return: (start, end) of the tabular in tex_code, or None if there is none
+        """
+        index_keyphrase = tex_code.find(self.keyphrase)
+        if index_keyphrase < 0:
+            return None
+        start = tex_code.rfind('tabular', 0, index_keyphrase)
+        end = tex_code.find('tabular', index_keyphrase + 1)
+        if start <= 0 or end < 0:
+            return None
+        return start, end
+
+    def generate(self, exercises):
+        """
+        Yields the pieces of the tabular for the exercises of an exam, to be joined in place of the located one.
+        :param exercises: the exercises which are part of the exam
+        """
+        count_exercises = len(exercises)
+        yield 'tabular}{%s%s| |c|}\n\t\\hline\n\t\\textbf{%s}' % (self.first_column, '|c' * count_exercises,
+                                                                 self.exercise_label)
+        for number in range(1, count_exercises + 1):
+            yield ' & \\textbf{%d}' % number
+        yield ' & \\textbf{$\\sum$} \\\\ \\hline\n\t\\textbf{%s} ' % self.points_label
+        sum_of_all_points = 0
+        for exercise in exercises:
+            yield ' & %s' % exercise.points if self.show_points else ' & '
+            sum_of_all_points += exercise.points
+        yield ' & %s \\\\ \\hline\n\t\\textbf{%s}' % (sum_of_all_points if self.show_points else '',
+                                                     self.achieved_label)
+        for i in range(count_exercises + 1):
+            yield ' & ' + self.blank
+        yield '  \\\\ \\hline\n  \\end{'
+
+
+GERMAN = ScoreTable('Maximale Punkte', '|c| ', 'Aufgabe', 'Maximale Punkte', 'Erreichte Punkte', blank='\\quad')
+ENGLISH = ScoreTable('Final Points', ' | l | ', 'Question', 'Points in 1st Round', 'Final Points', show_points=False)
+
+# language of a header -> its ScoreTable, add an entry to support another language
+SCORE_TABLES = {
+    'German': GERMAN,
+    'DE': GERMAN,
+    'English': ENGLISH,
+    'EN': ENGLISH,
+}
+
+
+def locate(tex_code, language):
+    """
+    Finds the score tabular of a header, see ScoreTable.locate.
+    :param tex_code: the latex code of the header
+    :param language: the language of the header
+    :return: (start, end) of the tabular, or None if the language has no score tabular or the header none
+    """
+    score_table = SCORE_TABLES.get(language)
+    if score_table is None:
+        return None
+    return score_table.locate(tex_code)
+
+
+def generate(language, exercises):
+    """
+    Yields the pieces of the score tabular for the exercises of an exam, see ScoreTable.generate.
+    """
+    return SCORE_TABLES[language].generate(exercises)
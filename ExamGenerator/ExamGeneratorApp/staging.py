@@ -0,0 +1,98 @@
+import errno
+import fcntl
+import filecmp
+import os
+import shutil
+import threading
+
+# ioctl cloning a file on file systems with copy on write, e.g. btrfs and xfs
+FICLONE = 0x40049409
+
+# the ways a file can be staged, cheapest first
+STAGING_METHODS = ('hardlink', 'reflink', 'symlink', 'copy')
+
+# the first method that worked, per pair of source and target device
+_methods = {}
+_methods_lock = threading.Lock()
+
+
+def reflink(source, target):
+    with open(source, 'rb') as source_file, open(target, 'wb') as target_file:
+        try:
+            fcntl.ioctl(target_file.fileno(), FICLONE, source_file.fileno())
+        except OSError:
+            target_file.close()
+            os.remove(target)
+            raise
+
+
+def link_file(method, source, target):
+    if method == 'hardlink':
+        os.link(source, target)
+    elif method == 'reflink':
+        reflink(source, target)
+    elif method == 'symlink':
+        os.symlink(os.path.abspath(source), target)
+    else:
+        shutil.copy(source, target)
+
+
+def is_staged(source, target):
+    """
+    Checks whether target already has the content of source, so it doesn't have to be staged again.
+    """
+    try:
+        if os.path.samefile(source, target):
+            return True
+        if os.path.getsize(source) != os.path.getsize(target):
+            return False
+    except FileNotFoundError:
+        return False
+    return filecmp.cmp(source, target, shallow=False)
+
+
+def stage_file(source, target_dir, name=None):
+    """
+    Makes a file available in a work directory without copying its content if possible. The file is hard linked,
+    reflinked or symlinked, depending on what the file systems support, and only copied if none of these works. The
+    method that worked is remembered for the pair of file systems. Files must not be modified after staging, since
+    they may share their content with the source.
+    :param source: path of the file to stage
+    :param target_dir: the work directory
+    :param name: file name in the work directory, defaults to the name of the source
+    :return: the method used, or None if the work directory already had the file
+    """
+    target = os.path.join(target_dir, name or os.path.basename(source))
+    if os.path.lexists(target):
+        if is_staged(source, target):
+            return None
+        os.remove(target)
+
+    devices = (os.stat(source).st_dev, os.stat(target_dir).st_dev)
+    with _methods_lock:
+        known_method = _methods.get(devices)
+    methods = STAGING_METHODS if known_method is None else STAGING_METHODS[STAGING_METHODS.index(known_method):]
+    for method in methods:
+        try:
+            link_file(method, source, target)
+        except OSError as e:
+            if method == 'copy' or e.errno == errno.ENOENT:
+                raise
+            continue
+        if known_method != method:
+            with _methods_lock:
+                _methods[devices] = method
+        return method
+
+
+def stage_directory(source_dir, target_dir):
+    """
+    Stages every file of a directory, see stage_file. Nothing happens if the directory doesn't exist.
+    :param source_dir: directory holding e.g. the file dependencies of an exercise
+    :param target_dir: the work directory
+    :return: nothing
+    """
+    if not os.path.isdir(source_dir):
+        return
+    for name in os.listdir(source_dir):
+        stage_file(os.path.join(source_dir, name), target_dir)
@@ -0,0 +1,30 @@
+import os
+import shutil
+import tempfile
+
+from django.test import override_settings
+
+
+class RenderDirsMixin:
+    '''
+    setUp before each test: all render directories in a temporary location self.root, removed after the test
+    '''
+
+    def render_settings(self):
+        """
+        Settings overridden along with the render directories, to be extended by the test case.
+        :return: dictionary setting name -> value
+        """
+        return {}
+
+    def setUp(self):
+        super().setUp()
+        self.root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.root)
+        settings_override = override_settings(
+            MEDIA_ROOT=os.path.join(self.root, 'media'), RENDER_WORK_DIR=os.path.join(self.root, 'work'),
+            RENDER_CACHE_DIR=os.path.join(self.root, 'cache'), RENDER_AUX_DIR=os.path.join(self.root, 'aux'),
+            RENDER_SLOT_DIR=os.path.join(self.root, 'slots'), RENDER_FORMAT_DIR=os.path.join(self.root, 'formats'),
+            **self.render_settings())
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
@@ -0,0 +1,60 @@
+import subprocess
+from unittest import mock
+
+from django.contrib.auth.models import User, Group
+from django.test import TestCase, override_settings
+from django.test.client import Client
+
+from . import RenderDirsMixin
+from .. import admission
+
+
+@override_settings(RENDER_MAX_CONCURRENT=1, RENDER_MAX_WAITING=1, RENDER_QUEUE_TIMEOUT=0.1, RENDER_RETRY_AFTER=7)
+class AdmissionTest(RenderDirsMixin, TestCase):
+    '''
+    setUp before each test: one render slot and one wait slot
+    '''
+
+    def setUp(self):
+        super().setUp()
+
+    def test_slot_is_released(self):
+        with admission.render_slot():
+            pass
+        with admission.render_slot():
+            pass
+
+    def test_waiting_render_times_out(self):
+        with admission.render_slot():
+            with self.assertRaises(admission.RenderBusy):
+                with admission.render_slot():
+                    pass
+
+    def test_full_queue_is_refused(self):
+        waiting = admission.try_lock_slot('wait', 1)
+        with admission.render_slot():
+            with mock.patch('time.sleep') as sleep:
+                with self.assertRaises(admission.RenderBusy):
+                    with admission.render_slot():
+                        pass
+                sleep.assert_not_called()
+        waiting.close()
+
+    def test_busy_response(self):
+        user = User.objects.create_user(username='tester', password='test')
+        user.groups.add(Group.objects.create(name='Employee'))
+        client = Client()
+        client.login(username='tester', password='test')
+        with mock.patch('ExamGeneratorApp.render_jobs.enqueue', side_effect=admission.RenderBusy()):
+            response = client.get('/examScreen?render=True')
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(response['Retry-After'], '7')
+
+    @override_settings(RENDER_CPU_LIMIT=1, RENDER_MEMORY_LIMIT=512 * 1024 * 1024)
+    def test_limits_are_applied(self):
+        result = admission.run_limited(['sh', '-c', 'ulimit -t; ulimit -v'], cwd=self.root, timeout=5)
+        self.assertEqual(result.stdout.split(), [b'1', b'524288'])
+
+    def test_timeout(self):
+        with self.assertRaises(subprocess.TimeoutExpired):
+            admission.run_limited(['sleep', '5'], cwd=self.root, timeout=0.1)
@@ -0,0 +1,57 @@
+import io
+import json
+import os
+
+from django.conf import settings
+from django.core.management import call_command
+from django.test import TestCase
+
+from . import RenderDirsMixin
+from ..management.commands.benchmark_render import synthetic_png
+from ..models import Exercise
+
+
+class BenchmarkRenderTest(RenderDirsMixin, TestCase):
+    '''
+    setUp before each test: a temporary directory for the results
+    '''
+
+    def setUp(self):
+        super().setUp()
+        self.output = os.path.join(self.root, 'results.json')
+
+    def benchmark(self, *args):
+        out = io.StringIO()
+        call_command('benchmark_render', '--stand-in', '--sizes', '1,3', '--repeat', '1', '--output', self.output,
+                     *args, stdout=out, stderr=io.StringIO())
+        with open(self.output, encoding='utf-8') as f:
+            return json.load(f), out.getvalue()
+
+    def test_results(self):
+        report, _ = self.benchmark()
+        self.assertEqual(report['compiler'], 'pdflatex')
+        self.assertTrue(report['stand_in'])
+        benchmarks = [(entry['benchmark'], entry.get('exercises')) for entry in report['results']]
+        self.assertEqual(benchmarks.count(('render_pdf', 3)), 2)
+        self.assertIn(('download_page_view', 1), benchmarks)
+        self.assertIn(('staging', 3), benchmarks)
+        self.assertIn(('build_document', 3), benchmarks)
+        self.assertIn(('header_variants', None), benchmarks)
+        # the synthetic data is rolled back, the render directories of the installation aren't used
+        self.assertFalse(Exercise.objects.exists())
+        self.assertFalse(os.path.exists(settings.RENDER_SLOT_DIR))
+
+    def test_baseline(self):
+        self.benchmark()
+        baseline = os.path.join(self.root, 'baseline.json')
+        os.rename(self.output, baseline)
+        _, output = self.benchmark('--baseline', baseline)
+        self.assertIn('%', output)
+
+    def test_fake_compiler(self):
+        report, _ = self.benchmark('--compiler', 'fake')
+        self.assertEqual(report['compiler'], 'fake')
+        self.assertFalse(report['stand_in'])
+
+    def test_synthetic_png(self):
+        self.assertTrue(synthetic_png(8).startswith(b'\x89PNG'))
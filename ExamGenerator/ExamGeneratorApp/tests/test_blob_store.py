@@ -0,0 +1,106 @@
+import os
+import shutil
+from unittest import mock
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.db import IntegrityError, transaction
+from django.test import TestCase, TransactionTestCase
+
+from . import RenderDirsMixin
+from .. import blob_store
+from ..models import DependencyLink, Exercise, ExerciseText, FileDependency, Header, Topic
+
+
+def create_owners():
+    user = User.objects.create_user(username='tester', password='test')
+    header = Header.objects.create(name='Header', author=user, latex_code='')
+    topic = Topic.objects.create(name='Topic')
+    exercises = [Exercise.objects.create(
+        documentHead=header, modifiable=True, points=1, topic=topic,
+        exerciseText=ExerciseText.objects.create(latex_code='Exercise text', author=user)) for _ in range(2)]
+    return header, exercises
+
+
+class BlobStoreTest(RenderDirsMixin, TestCase):
+    '''
+    setUp before each test: a header and two exercises, files are stored in a temporary media root
+    '''
+
+    def setUp(self):
+        super().setUp()
+        self.media_root = settings.MEDIA_ROOT
+        self.header, self.exercises = create_owners()
+
+    def test_same_content_is_stored_once(self):
+        blob_store.add(SimpleUploadedFile('logo.png', b'logo'), 'header-1-logo.png', header=self.header)
+        blob_store.add(SimpleUploadedFile('logo.png', b'logo'), 'exer-1-logo.png', exercise=self.exercises[0])
+        self.assertEqual(FileDependency.objects.count(), 1)
+        dependency = FileDependency.objects.get()
+        self.assertEqual(dependency.size, 4)
+        with open(dependency.path(), 'rb') as f:
+            self.assertEqual(f.read(), b'logo')
+        self.assertEqual(blob_store.linked_files(self.exercises[:1], self.header),
+                         [('exer-1-logo.png', dependency.path(), dependency.sha256),
+                          ('header-1-logo.png', dependency.path(), dependency.sha256)])
+
+    def test_legacy_directory_is_imported(self):
+        directory = blob_store.legacy_dir(exercise=self.exercises[0])
+        os.makedirs(directory)
+        with open(os.path.join(directory, 'image.png'), 'wb') as f:
+            f.write(b'image')
+        files = blob_store.linked_files(self.exercises)
+        self.assertEqual([name for name, _, _ in files], ['image.png'])
+        # every directory is only looked at once
+        self.assertTrue(Exercise.objects.get(pk=self.exercises[1].pk).legacy_imported)
+        with mock.patch('os.path.isdir') as isdir:
+            blob_store.linked_files(self.exercises)
+        self.assertFalse(isdir.called)
+        # afterwards the manifest is used, even if the directory is gone
+        shutil.rmtree(directory)
+        self.assertEqual(blob_store.linked_files(self.exercises), files)
+
+    def test_concurrent_legacy_import(self):
+        directory = blob_store.legacy_dir(header=self.header)
+        os.makedirs(directory)
+        with open(os.path.join(directory, 'logo.png'), 'wb') as f:
+            f.write(b'logo')
+        # another render imported the directory while this one was storing the files
+        link = blob_store.add(os.path.join(directory, 'logo.png'), 'logo.png', header=self.header)
+        with mock.patch('ExamGeneratorApp.blob_store.add', side_effect=IntegrityError):
+            self.assertEqual(blob_store.import_legacy_dir(header=self.header), [link])
+
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            DependencyLink.objects.create(header=self.header, name='logo.png', dependency=link.dependency)
+
+
+class BlobReleaseTest(RenderDirsMixin, TransactionTestCase):
+    '''
+    setUp before each test: a header and two exercises, committed so the content of released files is removed
+    '''
+
+    def setUp(self):
+        super().setUp()
+        self.header, self.exercises = create_owners()
+
+    def test_last_link_releases_content(self):
+        blob_store.add(SimpleUploadedFile('a.png', b'old'), 'a.png', exercise=self.exercises[0])
+        old_path = FileDependency.objects.get().path()
+        blob_store.copy_links(self.exercises[0], self.exercises[1])
+        self.assertEqual(DependencyLink.objects.count(), 2)
+
+        # replacing the file of one exercise keeps the content the other exercise refers to
+        blob_store.add(SimpleUploadedFile('a.png', b'new'), 'a.png', exercise=self.exercises[0])
+        self.assertTrue(os.path.exists(old_path))
+        self.exercises[1].delete()
+        self.assertFalse(os.path.exists(old_path))
+        self.assertEqual(FileDependency.objects.count(), 1)
+
+        # a rollback keeps the content along with its file
+        new_path = FileDependency.objects.get().path()
+        with self.assertRaises(RuntimeError), transaction.atomic():
+            self.exercises[0].delete()
+            raise RuntimeError('rolled back')
+        self.assertTrue(os.path.exists(new_path))
+        self.assertEqual(FileDependency.objects.count(), 1)
@@ -0,0 +1,85 @@
+import threading
+import time
+
+from django.contrib.auth.models import User
+from django.test import TestCase, override_settings
+
+from . import RenderDirsMixin
+from .. import admission
+from .. import cancellation
+from ..views import render_pdf
+from ..workdirs import RenderWorkDir
+
+
+@override_settings(RENDER_COMPILER='fake')
+class CancellationTest(RenderDirsMixin, TestCase):
+    '''
+    setUp before each test: a user, all render directories in a temporary location
+    '''
+
+    def setUp(self):
+        super().setUp()
+        self.user = User.objects.create_user(username='tester', password='test')
+
+    def test_newer_render_stops_process(self):
+        errors = []
+        started = threading.Event()
+
+        def older_render():
+            with cancellation.render_target(self.user, 'exam') as ticket:
+                ticket.claim('old document')
+                started.set()
+                try:
+                    admission.run_limited(['sleep', '30'], cwd=self.root, timeout=30)
+                except cancellation.RenderCancelled as e:
+                    errors.append(e)
+
+        thread = threading.Thread(target=older_render)
+        start = time.monotonic()
+        thread.start()
+        self.assertTrue(started.wait(5))
+        time.sleep(0.1)
+        with cancellation.render_target(self.user, 'exam'):
+            cancellation.claim('new document')
+            thread.join()
+        self.assertEqual(len(errors), 1)
+        self.assertLess(time.monotonic() - start, 10)
+
+    def test_render_in_other_process_stops_process(self):
+        with cancellation.render_target(self.user, 'exam') as ticket:
+            ticket.claim('old document')
+            # a newer render of the exam in another web process
+            cancellation.publish(cancellation.RenderTicket(ticket.key, None), 'new document')
+            start = time.monotonic()
+            with self.assertRaises(cancellation.RenderCancelled):
+                admission.run_limited(['sleep', '30'], cwd=self.root, timeout=30)
+            self.assertLess(time.monotonic() - start, 10)
+
+    def test_cancel_target(self):
+        with cancellation.render_target(self.user, 'exam') as ticket:
+            ticket.claim('old document')
+            # a render of the exam in another process, e.g. the render server
+            other = cancellation.RenderTicket.restore(ticket.state())
+            cancellation.cancel_target(self.user, 'exam')
+            self.assertTrue(ticket.cancelled)
+            self.assertTrue(other.is_superseded())
+        # later renders of the target aren't affected
+        with cancellation.render_target(self.user, 'exam') as ticket:
+            ticket.claim('new document')
+            self.assertFalse(ticket.is_superseded())
+
+    def test_same_document_is_not_cancelled(self):
+        with cancellation.render_target(self.user, 'download') as older:
+            older.claim('document')
+            with cancellation.render_target(self.user, 'download'):
+                cancellation.claim('document')
+            with cancellation.render_target(self.user, 'exam'):
+                cancellation.claim('other document')
+            self.assertFalse(older.cancelled)
+
+    def test_cancelled_render_raises(self):
+        with cancellation.render_target(self.user, 'upload') as ticket, RenderWorkDir.create(self.user) as work_dir:
+            ticket.cancel()
+            self.assertRaises(cancellation.RenderCancelled, render_pdf, self.user, None, [('Exercise', 'Solution')],
+                              work_dir=work_dir)
+            self.assertFalse(work_dir.exists('document.pdf'))
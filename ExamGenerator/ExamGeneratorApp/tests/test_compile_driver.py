@@ -0,0 +1,72 @@
+import os
+import shutil
+import tempfile
+from types import SimpleNamespace
+from unittest import mock
+
+from django.test import TestCase, override_settings
+
+from .. import cancellation
+from .. import compile_driver
+from ..compilers import COMPILERS
+
+
+class FakePdflatex:
+    """
+    Writes the aux file like a document whose references need settle_after passes to be resolved.
+    """
+
+    def __init__(self, settle_after):
+        self.settle_after = settle_after
+        self.calls = 0
+
+    def __call__(self, command, cwd, **kwargs):
+        self.calls += 1
+        with open(os.path.join(cwd, 'document.aux'), 'w') as f:
+            f.write('\\newlabel{LastPage}{%d}' % min(self.calls, self.settle_after))
+
+
+class CompileDriverTest(TestCase):
+    '''
+    setUp before each test: work, aux and render slot directories in a temporary location
+    '''
+
+    def setUp(self):
+        self.work_dir = tempfile.mkdtemp()
+        self.store_dir = os.path.join(tempfile.mkdtemp(), 'document')
+        self.settings_override = override_settings(RENDER_MAX_PASSES=4,
+                                                   RENDER_SLOT_DIR=os.path.join(self.work_dir, 'slots'))
+        self.settings_override.enable()
+
+    def tearDown(self):
+        self.settings_override.disable()
+        shutil.rmtree(self.work_dir)
+        shutil.rmtree(os.path.dirname(self.store_dir))
+
+    def compile(self, pdflatex, store_dir=None):
+        with mock.patch('ExamGeneratorApp.admission.run_limited', side_effect=pdflatex):
+            return compile_driver.compile_document(COMPILERS['pdflatex'], self.work_dir, 'document.tex',
+                                                   store_dir=store_dir)
+
+    def test_reruns_until_aux_is_stable(self):
+        self.assertEqual(self.compile(FakePdflatex(settle_after=2)), 3)
+
+    def test_pass_limit(self):
+        self.assertEqual(self.compile(FakePdflatex(settle_after=10)), 4)
+
+    def test_kept_aux_files_save_passes(self):
+        self.compile(FakePdflatex(settle_after=1), store_dir=self.store_dir)
+        os.remove(os.path.join(self.work_dir, 'document.aux'))
+        self.assertEqual(self.compile(FakePdflatex(settle_after=1), store_dir=self.store_dir), 1)
+
+    def test_aux_store_per_document(self):
+        user = SimpleNamespace(pk=1, username='tester')
+        exercise = SimpleNamespace(pk=12)
+        with cancellation.render_target(user, 'exam'):
+            exam = compile_driver.aux_store_dir(user, [exercise], 'document')
+        with cancellation.render_target(user, 'upload'):
+            upload = compile_driver.aux_store_dir(user, None, 'document')
+        stored = compile_driver.aux_store_dir(user, [exercise], 'document')
+        other = compile_driver.aux_store_dir(user, [SimpleNamespace(pk=13)], 'document')
+        self.assertEqual(len({exam, upload, stored, other}), 4)
+        self.assertTrue(stored.endswith(os.path.join('tester', 'exercise-12', 'document')))
@@ -0,0 +1,70 @@
+import os
+import threading
+from unittest import mock
+
+from django.contrib.auth.models import User
+from django.core.exceptions import ImproperlyConfigured
+from django.test import TestCase, override_settings
+
+from . import RenderDirsMixin
+from .. import compile_driver
+from ..compilers import COMPILERS, FakeCompiler, get_compiler
+from ..models import Header
+from ..views import render_pdf
+from ..workdirs import RenderWorkDir
+
+
+@override_settings(RENDER_COMPILER='fake', RENDER_FAKE_DELAY=0, RENDER_FAKE_FAILURE=None)
+class CompilerTest(RenderDirsMixin, TestCase):
+    '''
+    setUp before each test: the fake compiler, all render directories in a temporary location
+    '''
+
+    def setUp(self):
+        super().setUp()
+        self.user = User.objects.create_user(username='tester', password='test')
+
+    def render(self, **kwargs):
+        with RenderWorkDir.create(self.user) as work_dir:
+            rendered = render_pdf(self.user, None, [('Exercise', 'Solution')], work_dir=work_dir, use_cache=False,
+                                  **kwargs)
+            return rendered, work_dir.exists('document.pdf'), work_dir.exists('err_log.txt')
+
+    def test_fake_compiler(self):
+        self.assertEqual(self.render(), (True, True, False))
+        with override_settings(RENDER_FAKE_FAILURE='error'):
+            self.assertEqual(self.render(), (True, False, False))
+        with override_settings(RENDER_FAKE_DELAY=0.2):
+            self.assertEqual(self.render(timeout=0.1), (False, False, True))
+
+    @override_settings(RENDER_FAKE_DELAY=0.3)
+    def test_identical_renders_coalesce(self):
+        results = []
+
+        def render():
+            with RenderWorkDir.create(self.user) as work_dir:
+                rendered = render_pdf(self.user, None, [('Exercise', 'Solution')], work_dir=work_dir)
+                results.append((rendered, work_dir.exists('document.pdf')))
+
+        with mock.patch.object(FakeCompiler, 'run', autospec=True, side_effect=FakeCompiler.run) as run:
+            threads = [threading.Thread(target=render) for _ in range(3)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+        self.assertEqual(results, [(True, True)] * 3)
+        self.assertEqual(run.call_count, 1)
+
+    def test_header_selects_compiler(self):
+        header = Header(name='Header', compiler='latexmk')
+        self.assertEqual(get_compiler(header).name, 'latexmk')
+        self.assertEqual(get_compiler(Header(name='Other')).name, 'fake')
+        with override_settings(RENDER_COMPILER='tex'):
+            self.assertRaises(ImproperlyConfigured, get_compiler)
+
+    @mock.patch('ExamGeneratorApp.admission.run_limited')
+    def test_latexmk_runs_once(self, run):
+        work_dir = os.path.join(self.root, 'latexmk')
+        os.makedirs(work_dir)
+        self.assertEqual(compile_driver.compile_document(COMPILERS['latexmk'], work_dir, 'document.tex'), 1)
+        self.assertEqual(run.call_args[0][0], ['latexmk', '-pdf', '-interaction=nonstopmode', 'document.tex'])
@@ -421,5 +421,5 @@ class Dynamic_import(My_selenium_tests):
 
         # push download button
         download_without_solution = selenium.find_element_by_xpath(
-            "//a[@href='/media/temp/super/ExamWithoutSolution.pdf']")
+            "//a[starts-with(@href,'/media/temp/super/ExamWithoutSolution.pdf')]")
         download_without_solution.click()
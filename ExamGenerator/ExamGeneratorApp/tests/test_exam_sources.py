@@ -0,0 +1,69 @@
+import io
+import os
+import zipfile
+
+from django.conf import settings
+from django.contrib.auth.models import User, Group
+from django.test import TestCase
+from django.test.client import Client
+from django.urls import reverse
+
+from . import RenderDirsMixin
+from ..models import Content, Exam, Exercise, ExerciseSolution, ExerciseText, Header, Topic
+from ..zipstream import stream_zip
+
+
+class ExamSourcesTest(RenderDirsMixin, TestCase):
+    '''
+    setUp before each test: an exam with one exercise, both with a file dependency
+    '''
+
+    def setUp(self):
+        super().setUp()
+        self.media_root = settings.MEDIA_ROOT
+        self.client = Client()
+        user = User.objects.create_user(username='tester', password='test')
+        user.groups.add(Group.objects.create(name='Employee'))
+        header = Header.objects.create(name='Header', author=user,
+                                       latex_code='\\documentclass{article}\n\\begin{document}\n')
+        exercise = Exercise.objects.create(
+            documentHead=header, modifiable=True, points=1, topic=Topic.objects.create(name='Topic'),
+            exerciseText=ExerciseText.objects.create(latex_code='Exercise text', author=user),
+            exerciseSolution=ExerciseSolution.objects.create(latex_code='Solution text', author=user))
+        exam = Exam.objects.create(author=user, documentHead=header)
+        Content.objects.create(exam=exam, exercise=exercise, position=1)
+        for directory, name in (('exercises/exercise%d/file_dependencies' % exercise.pk, 'image.png'),
+                                ('headers/header%d' % header.pk, 'logo.jpg')):
+            os.makedirs(os.path.join(self.media_root, directory))
+            with open(os.path.join(self.media_root, directory, name), 'wb') as f:
+                f.write(name.encode('utf-8'))
+        self.client.login(username='tester', password='test')
+
+    def download(self, name):
+        response = self.client.get(reverse('exam sources', kwargs={'name': name}))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Type'], 'application/zip')
+        return zipfile.ZipFile(io.BytesIO(b''.join(response.streaming_content)))
+
+    def test_with_solution(self):
+        archive = self.download('ExamWithSolution')
+        self.assertEqual(sorted(archive.namelist()), ['ExamWithSolution.tex', 'image.png', 'logo.jpg'])
+        self.assertIn('Solution text', archive.read('ExamWithSolution.tex').decode('utf-8'))
+        self.assertEqual(archive.read('logo.jpg'), b'logo.jpg')
+
+    def test_without_solution(self):
+        archive = self.download('ExamWithoutSolution')
+        document = archive.read('ExamWithoutSolution.tex').decode('utf-8')
+        self.assertIn('Exercise text', document)
+        self.assertNotIn('Solution text', document)
+
+    def test_unknown_variant(self):
+        response = self.client.get(reverse('exam sources', kwargs={'name': 'Other'}))
+        self.assertEqual(response.status_code, 404)
+
+    def test_stream_zip(self):
+        data = b''.join(stream_zip([('a.tex', b'a' * 100000), ('b.png', b'b')]))
+        archive = zipfile.ZipFile(io.BytesIO(data))
+        self.assertIsNone(archive.testzip())
+        self.assertEqual(archive.read('a.tex'), b'a' * 100000)
+        self.assertEqual(archive.getinfo('b.png').compress_type, zipfile.ZIP_STORED)
@@ -0,0 +1,62 @@
+import re
+
+from django.contrib.auth.models import User
+from django.test import TestCase
+
+from .. import header_variants
+from ..forms import HeaderForm
+from ..models import Header
+
+HEADERS = [
+    '\\documentclass{article}\n\\begin{document}\n',
+    '%\\withoutsolutions\n\\begin{document}\n%begin_disclaimer\nDisclaimer\n%end_disclaimer\nText\n',
+    '%\\withoutsolutions\n%\\withoutsolutions\n%begin_disclaimer\nA %\\withoutsolutions\n%end_disclaimer\n'
+    'B\n%end_disclaimer\n%\\withoutsolutions',
+    '%end_disclaimer\n%begin_disclaimer\nno end\n',
+    '%begin_disclaimer%end_disclaimer',
+]
+
+
+def regex_variant(latex_code, include_solutions, include_disclaimer):
+    # how variants used to be put together on every render
+    if not include_solutions:
+        latex_code = latex_code.replace('%\\withoutsolutions', '\\withoutsolutions')
+    if not include_disclaimer:
+        latex_code = re.sub(r'%begin_disclaimer.*%end_disclaimer', '%begin_disclaimer\n%end_disclaimer', latex_code,
+                            1, re.DOTALL | re.MULTILINE)
+    return latex_code
+
+
+class HeaderVariantsTest(TestCase):
+    '''
+    setUp before each test: a user
+    '''
+
+    def setUp(self):
+        self.user = User.objects.create_user(username='tester', password='secret')
+
+    def test_variants_match_regex(self):
+        for latex_code in HEADERS:
+            structure = header_variants.HeaderStructure(latex_code)
+            for include_solutions, include_disclaimer in header_variants.VARIANTS:
+                self.assertEqual(structure.variant(include_solutions, include_disclaimer),
+                                 regex_variant(latex_code, include_solutions, include_disclaimer))
+
+    def test_variants_stored_on_save(self):
+        header = Header.objects.create(name='Header', author=self.user, latex_code=HEADERS[1])
+        header = Header.objects.get(pk=header.pk)
+        self.assertEqual(header.variant(False, False)[0],
+                         '\\withoutsolutions\n\\begin{document}\n%begin_disclaimer\n%end_disclaimer\nText\n')
+
+        # a change that isn't saved yet is used as well
+        header.latex_code = 'Changed'
+        self.assertEqual(header.variant(True, True)[0], 'Changed')
+
+    def test_form_validation(self):
+        form = HeaderForm({'name': 'Header', 'latex_code': HEADERS[3], 'compiler': ''})
+        self.assertFalse(form.is_valid())
+        self.assertIn('%begin_disclaimer has no %end_disclaimer after it, the disclaimer cannot be left out.',
+                      form.errors['latex_code'])
+
+        form = HeaderForm({'name': 'Header', 'latex_code': HEADERS[1], 'compiler': ''})
+        self.assertTrue(form.is_valid())
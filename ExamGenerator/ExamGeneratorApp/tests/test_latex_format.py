@@ -0,0 +1,95 @@
+import os
+import subprocess
+from unittest import mock
+
+from django.test import TestCase, override_settings
+
+from . import RenderDirsMixin
+from .. import latex_format
+
+PREAMBLE = '\\documentclass{article}\n\\usepackage{amsmath}\n'
+
+
+def fake_pdflatex(command, cwd, **kwargs):
+    jobname = [argument for argument in command if argument.startswith('-jobname=')][0].partition('=')[2]
+    open(os.path.join(cwd, jobname + '.fmt'), 'w').close()
+
+
+@override_settings(RENDER_FORMAT_MAX_COUNT=10)
+class LatexFormatTest(RenderDirsMixin, TestCase):
+    '''
+    setUp before each test: formats and header dependencies in a temporary location
+    '''
+
+    def setUp(self):
+        super().setUp()
+        self.dependencies = []
+
+    def test_split_preamble(self):
+        self.assertEqual(latex_format.split_preamble(PREAMBLE + '\\begin{document}\nText'), PREAMBLE)
+        self.assertIsNone(latex_format.split_preamble(PREAMBLE))
+
+    def test_key_covers_dependencies(self):
+        key = latex_format.format_key(PREAMBLE, self.dependencies)
+        logo = ('logo.png', os.path.join(self.root, 'logo.png'), 'a' * 64)
+        self.assertNotEqual(key, latex_format.format_key(PREAMBLE, [logo]))
+        self.assertNotEqual(latex_format.format_key(PREAMBLE, [logo]),
+                            latex_format.format_key(PREAMBLE, [logo[:2] + ('b' * 64,)]))
+
+    @mock.patch('ExamGeneratorApp.admission.run_limited', side_effect=fake_pdflatex)
+    def test_build_and_find(self, run):
+        self.assertIsNone(latex_format.find(PREAMBLE, self.dependencies))
+        path = latex_format.build(PREAMBLE, self.dependencies)
+        self.assertTrue(os.path.exists(path))
+        self.assertEqual(latex_format.find(PREAMBLE, self.dependencies), path)
+        # an existing format is not built again
+        latex_format.build(PREAMBLE, self.dependencies)
+        self.assertEqual(run.call_count, 1)
+
+    @mock.patch('ExamGeneratorApp.admission.run_limited', side_effect=fake_pdflatex)
+    def test_build_with_dependencies(self, run):
+        logo_path = os.path.join(self.root, 'logo.png')
+        with open(logo_path, 'wb') as f:
+            f.write(b'logo')
+        dependencies = [('logo.png', logo_path, 'a' * 64)]
+        path = latex_format.build(PREAMBLE, dependencies)
+        self.assertEqual(path, latex_format.find(PREAMBLE, dependencies))
+        self.assertNotEqual(path, logo_path)
+        # the stored file is shared with other headers and exercises
+        with open(logo_path, 'rb') as f:
+            self.assertEqual(f.read(), b'logo')
+
+    @mock.patch('ExamGeneratorApp.admission.run_limited')
+    def test_failed_build_is_not_retried(self, run):
+        self.assertIsNone(latex_format.build(PREAMBLE, self.dependencies))
+        self.assertIsNone(latex_format.build(PREAMBLE, self.dependencies))
+        self.assertEqual(run.call_count, 1)
+
+    @mock.patch('ExamGeneratorApp.admission.run_limited')
+    def test_failed_build_is_retried_later(self, run):
+        self.assertIsNone(latex_format.build(PREAMBLE, self.dependencies))
+        key = latex_format.format_key(PREAMBLE, self.dependencies)
+        marker = latex_format.failed_marker_path(key)
+        os.utime(marker, (0, 0))
+        run.side_effect = fake_pdflatex
+        self.assertIsNotNone(latex_format.build(PREAMBLE, self.dependencies))
+        self.assertFalse(os.path.exists(marker))
+
+    @mock.patch('ExamGeneratorApp.admission.run_limited')
+    def test_timeout_and_missing_package_are_retried(self, run):
+        run.side_effect = subprocess.TimeoutExpired('pdflatex', 60)
+        self.assertIsNone(latex_format.build(PREAMBLE, self.dependencies))
+        run.side_effect = None
+        run.return_value = subprocess.CompletedProcess('pdflatex', 1, b"! LaTeX Error: File `mylatexformat.ltx' "
+                                                                      b"not found.", b'')
+        self.assertIsNone(latex_format.build(PREAMBLE, self.dependencies))
+        self.assertIsNone(latex_format.build(PREAMBLE, self.dependencies))
+        self.assertEqual(run.call_count, 3)
+
+    @mock.patch('ExamGeneratorApp.admission.run_limited', side_effect=fake_pdflatex)
+    def test_eviction(self, run):
+        paths = [latex_format.build(PREAMBLE + '%% %d\n' % i, self.dependencies) for i in range(3)]
+        os.utime(paths[0], (0, 0))
+        latex_format.evict(2)
+        self.assertFalse(os.path.exists(paths[0]))
+        self.assertTrue(os.path.exists(paths[2]))
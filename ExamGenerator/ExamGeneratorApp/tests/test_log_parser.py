@@ -0,0 +1,103 @@
+import io
+import os
+import shutil
+import tempfile
+
+from django.test import TestCase
+
+from .. import log_parser
+
+LOG = '''This is pdfTeX, Version 3.14159265-2.6-1.40.20 (TeX Live 2019) (preloaded format=pdflatex 2020.1.1)
+entering extended mode
+(./document.tex
+LaTeX2e <2020-02-02> patch level 2
+(/usr/share/texlive/texmf-dist/tex/latex/base/article.cls
+Document Class: article 2019/12/20 v1.4l Standard LaTeX document class
+(/usr/share/texlive/texmf-dist/tex/latex/base/size10.clo))
+
+! LaTeX Error: File `foo.sty' not found.
+
+Type X to quit or <RETURN> to proceed,
+or enter new name. (Default extension: sty)
+
+Enter file name:
+! Emergency stop.
+<read *>
+
+l.3 \\usepackage
+                {foo}^^M
+(./exercise.tex
+Package hyperref Warning: Token not allowed in a PDF string (PDFDocEncoding):
+(hyperref)                removing `math shift' on input line 12.
+
+
+LaTeX Warning: Reference `fig' on page 1 undefined on input line 14.
+
+LaTeX Font Warning: Font shape `OT1/cmr/bx/it' undefined
+(Font)              using `OT1/cmr/bx/n' instead on input line 16.
+
+Overfull \\hbox (15.0pt too wide) in paragraph at lines 20--21
+[]\\OT1/cmr/m/n/10 Some text|
+
+Underfull \\vbox (badness 10000) has occurred while \\output is active []
+
+)
+! Undefined control sequence.
+l.30 \\foo
+
+Here is how much of TeX's memory you used:
+'''
+
+
+class LogParserTest(TestCase):
+
+    def test_records(self):
+        records = list(log_parser.parse_log(io.StringIO(LOG)))
+        self.assertEqual([record['severity'] for record in records],
+                         ['error', 'error', 'warning', 'warning', 'warning', 'badbox', 'badbox', 'error'])
+
+        missing, emergency_stop, hyperref, reference, font, overfull, underfull, undefined = records
+        self.assertEqual(missing['missing_file'], 'foo.sty')
+        self.assertEqual(missing['package'], 'foo')
+        self.assertEqual(missing['file'], './document.tex')
+        self.assertEqual(emergency_stop['line'], 3)
+        self.assertEqual(hyperref['package'], 'hyperref')
+        self.assertEqual(hyperref['line'], 12)
+        self.assertEqual(hyperref['file'], './exercise.tex')
+        self.assertIn('removing', hyperref['message'])
+        self.assertEqual(reference['line'], 14)
+        self.assertIsNone(font['package'])
+        self.assertEqual(font['line'], 16)
+        self.assertEqual(font['message'], "Font shape `OT1/cmr/bx/it' undefined using `OT1/cmr/bx/n' instead on input "
+                                          "line 16.")
+        self.assertTrue(overfull['overfull'])
+        self.assertEqual(overfull['line'], 20)
+        self.assertFalse(underfull['overfull'])
+        self.assertEqual(undefined['file'], './document.tex')
+        self.assertEqual(undefined['line'], 30)
+        self.assertIn('l.30 \\foo', undefined['message'])
+
+    def test_wrapped_lines(self):
+        path = './' + 'x' * 80 + '.tex'
+        lines = list(log_parser.unwrap_lines(io.StringIO(path[:79] + '\n' + path[79:] + '\nnext\n')))
+        self.assertEqual(lines, [path, 'next'])
+
+    def test_summary(self):
+        summary = log_parser.summarize(log_parser.parse_log(io.StringIO(LOG)))
+        self.assertEqual(summary['error_count'], 3)
+        self.assertEqual(summary['warning_count'], 3)
+        self.assertEqual(summary['overfull_count'], 1)
+        self.assertEqual(summary['underfull_count'], 1)
+        self.assertEqual(summary['missing_files'], ['foo.sty'])
+
+    def test_stored_summary(self):
+        directory = tempfile.mkdtemp()
+        try:
+            log_path = os.path.join(directory, 'document.log')
+            self.assertIsNone(log_parser.load_summary(log_path))
+            with open(log_path, 'w') as f:
+                f.write(LOG)
+            self.assertEqual(log_parser.load_summary(log_path)['error_count'], 3)
+            self.assertTrue(os.path.exists(log_path + '.json'))
+        finally:
+            shutil.rmtree(directory)
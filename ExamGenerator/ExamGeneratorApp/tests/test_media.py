@@ -0,0 +1,112 @@
+import os
+
+from django.conf import settings
+from django.core.exceptions import SuspiciousFileOperation
+from django.http import Http404
+from django.test import RequestFactory, TestCase, override_settings
+
+from . import RenderDirsMixin
+from .. import media
+
+
+@override_settings(MEDIA_URL='/media/')
+class MediaTest(RenderDirsMixin, TestCase):
+    '''
+    setUp before each test: a media directory with one pdf
+    '''
+
+    def setUp(self):
+        super().setUp()
+        self.media_root = settings.MEDIA_ROOT
+        os.makedirs(os.path.join(self.media_root, 'temp', 'tester'))
+        self.write(b'%PDF first version')
+        self.factory = RequestFactory()
+
+    def write(self, content):
+        with open(os.path.join(self.media_root, 'temp', 'tester', 'exam.pdf'), 'wb') as f:
+            f.write(content)
+
+    def get(self, url, **headers):
+        path, _, query = url.partition('?')
+        request = self.factory.get(path, dict(item.split('=') for item in query.split('&') if item), **headers)
+        return media.serve_media(request, path[len('/media/'):], self.media_root)
+
+    def test_conditional_get(self):
+        url = media.versioned_url('temp/tester/exam.pdf')
+        response = self.get(url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(b''.join(response.streaming_content), b'%PDF first version')
+        self.assertEqual(response['Content-Type'], 'application/pdf')
+        self.assertIn('immutable', response['Cache-Control'])
+        etag = response['ETag']
+
+        response = self.get('/media/temp/tester/exam.pdf', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response['Cache-Control'], 'private, no-cache')
+
+        # the url only changes with the content
+        self.assertEqual(media.versioned_url('temp/tester/exam.pdf'), url)
+        self.write(b'%PDF second version')
+        self.assertNotEqual(media.versioned_url('temp/tester/exam.pdf'), url)
+        response = self.get('/media/temp/tester/exam.pdf', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+
+    def test_ranges(self):
+        # '%PDF first version'
+        response = self.get('/media/temp/tester/exam.pdf', HTTP_RANGE='bytes=1-3')
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(b''.join(response.streaming_content), b'PDF')
+        self.assertEqual(response['Content-Range'], 'bytes 1-3/18')
+        self.assertEqual(response['Content-Length'], '3')
+        self.assertEqual(response['Accept-Ranges'], 'bytes')
+
+        response = self.get('/media/temp/tester/exam.pdf', HTTP_RANGE='bytes=0-0,-7')
+        self.assertEqual(response.status_code, 206)
+        body = b''.join(response.streaming_content)
+        self.assertEqual(len(body), int(response['Content-Length']))
+        boundary = response['Content-Type'].partition('boundary=')[2]
+        parts = body.split(b'--' + boundary.encode())
+        self.assertEqual(len(parts), 4)
+        self.assertIn(b'Content-Range: bytes 0-0/18\r\n\r\n%\r\n', parts[1])
+        self.assertIn(b'Content-Range: bytes 11-17/18\r\n\r\nversion\r\n', parts[2])
+        self.assertEqual(parts[3], b'--\r\n')
+
+        response = self.get('/media/temp/tester/exam.pdf', HTTP_RANGE='bytes=100-')
+        self.assertEqual(response.status_code, 416)
+        self.assertEqual(response['Content-Range'], 'bytes */18')
+
+        # an invalid header or an outdated If-Range get the whole file
+        self.assertEqual(self.get('/media/temp/tester/exam.pdf', HTTP_RANGE='bytes=3-1').status_code, 200)
+        response = self.get('/media/temp/tester/exam.pdf', HTTP_RANGE='bytes=1-3', HTTP_IF_RANGE='"outdated"')
+        self.assertEqual(response.status_code, 200)
+
+    def test_range_of_overwritten_file(self):
+        response = self.get('/media/temp/tester/exam.pdf', HTTP_RANGE='bytes=1-3,11-17')
+        content = iter(response.streaming_content)
+        self.assertIn(b'Content-Range: bytes 1-3/18', next(content))
+        # the file is truncated in place while the response is sent, like shutil.copy does
+        with open(os.path.join(self.media_root, 'temp', 'tester', 'exam.pdf'), 'r+b') as f:
+            f.truncate(0)
+        self.assertEqual(b''.join(content), b'')
+
+    def test_sendfile(self):
+        with override_settings(MEDIA_SENDFILE='x-accel-redirect', MEDIA_SENDFILE_PREFIX='/protected-media/'):
+            response = self.get('/media/temp/tester/exam.pdf')
+        self.assertEqual(response['X-Accel-Redirect'], '/protected-media/temp/tester/exam.pdf')
+        self.assertEqual(response.content, b'')
+        self.assertEqual(response['Content-Type'], 'application/pdf')
+        self.assertIn('ETag', response)
+        with override_settings(MEDIA_SENDFILE='x-sendfile'):
+            response = self.get('/media/temp/tester/exam.pdf')
+        self.assertEqual(response['X-Sendfile'], os.path.join(self.media_root, 'temp', 'tester', 'exam.pdf'))
+
+        # unchanged files are still answered by Django
+        with override_settings(MEDIA_SENDFILE='x-sendfile'):
+            response = self.get('/media/temp/tester/exam.pdf', HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(response.status_code, 304)
+
+    def test_missing_files(self):
+        self.assertEqual(media.versioned_url('temp/tester/other.pdf'), '/media/temp/tester/other.pdf')
+        self.assertRaises(Http404, self.get, '/media/temp/tester/other.pdf')
+        self.assertRaises(SuspiciousFileOperation, self.get, '/media/../secret.txt')
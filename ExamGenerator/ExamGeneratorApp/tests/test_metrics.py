@@ -0,0 +1,70 @@
+import json
+import os
+from unittest import mock
+
+from django.contrib.auth.models import User
+from django.test import TestCase, override_settings
+from django.test.client import Client
+from django.urls import reverse
+
+from . import RenderDirsMixin
+from .. import metrics
+from ..views import render_pdf
+from ..workdirs import RenderWorkDir
+
+
+def fake_pdflatex(command, cwd, **kwargs):
+    for extension in ('.pdf', '.log'):
+        open(os.path.join(cwd, 'document' + extension), 'w').close()
+
+
+@override_settings(RENDER_FORMATS=False)
+class MetricsTest(RenderDirsMixin, TestCase):
+    '''
+    setUp before each test: empty metrics, all render directories in a temporary location
+    '''
+
+    def setUp(self):
+        metrics.reset()
+        super().setUp()
+        self.user = User.objects.create_user(username='tester', password='test')
+
+    def test_nested_traces(self):
+        with self.assertLogs('ExamGeneratorApp.metrics') as logs:
+            with metrics.trace('exam') as outer:
+                with metrics.trace('render') as inner:
+                    self.assertIs(inner, outer)
+                    with metrics.phase('build'):
+                        pass
+                    metrics.add('passes', 2)
+        line = json.loads(logs.records[0].getMessage())
+        self.assertEqual(line['kind'], 'exam')
+        self.assertEqual(line['counts'], {'passes': 2})
+        self.assertIn('build', line['phases'])
+        text = metrics.exposition()
+        self.assertIn('examgenerator_renders_total{kind="exam",outcome="ok"} 1', text)
+        self.assertIn('examgenerator_render_passes_total{kind="exam"} 2', text)
+        self.assertIn('examgenerator_render_phase_seconds_count{kind="exam",phase="build"} 1', text)
+        self.assertIn('examgenerator_render_seconds_bucket{kind="exam",le="+Inf"} 1', text)
+
+    @mock.patch('ExamGeneratorApp.admission.run_limited', side_effect=fake_pdflatex)
+    def test_render_is_traced(self, run):
+        for _ in range(2):
+            with self.assertLogs('ExamGeneratorApp.metrics'), RenderWorkDir.create(self.user) as work_dir:
+                self.assertTrue(render_pdf(self.user, None, [('Exercise', 'Solution')], work_dir=work_dir))
+        text = metrics.exposition()
+        self.assertIn('examgenerator_renders_total{kind="render",outcome="ok"} 2', text)
+        self.assertIn('examgenerator_render_cache_misses_total{kind="render"} 1', text)
+        self.assertIn('examgenerator_render_cache_hits_total{kind="render"} 1', text)
+        self.assertIn('examgenerator_render_passes_total{kind="render"} 1', text)
+        self.assertIn('examgenerator_render_phase_seconds_count{kind="render",phase="compile"} 1', text)
+
+    def test_staff_only(self):
+        client = Client()
+        client.login(username='tester', password='test')
+        self.assertEqual(client.get(reverse('metrics')).status_code, 302)
+        self.user.is_staff = True
+        self.user.save()
+        response = client.get(reverse('metrics'))
+        self.assertEqual(response.status_code, 200)
+        self.assertIn(b'# TYPE examgenerator_renders_total counter', response.content)
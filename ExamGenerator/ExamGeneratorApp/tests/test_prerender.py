@@ -0,0 +1,52 @@
+import threading
+
+from django.contrib.auth.models import User
+from django.test import TestCase
+
+from . import RenderDirsMixin
+from .. import cancellation
+from .. import prerender
+
+
+class PrerenderTest(RenderDirsMixin, TestCase):
+    '''
+    setUp before each test: a render callable recording its calls, render slots in a temporary location
+    '''
+
+    def setUp(self):
+        super().setUp()
+        self.calls = []
+        self.rendered = threading.Event()
+
+    def render(self, superseded):
+        self.calls.append(superseded)
+        self.rendered.set()
+
+    def test_changes_are_debounced(self):
+        for _ in range(3):
+            prerender.debounce(-1, self.render, 0.2)
+        self.assertTrue(self.rendered.wait(5))
+        self.assertEqual(len(self.calls), 1)
+        self.assertFalse(self.calls[0]())
+
+        # a newer change supersedes the render that already ran
+        prerender.debounce(-1, lambda superseded: None, 10)
+        self.assertTrue(self.calls[0]())
+        prerender._timers.pop(-1).cancel()
+
+    def test_change_in_other_process_supersedes(self):
+        prerender.debounce(-2, self.render, 0.2)
+        # a change that arrived at another web process
+        prerender.record_generation(-2, 'other process')
+        self.assertFalse(self.rendered.wait(0.5))
+        self.assertEqual(self.calls, [])
+
+    def test_schedule_waits_for_commit(self):
+        # the test transaction is never committed, so nothing is scheduled
+        user = User.objects.create_user(username='tester', password='test')
+        with cancellation.render_target(user, 'exam') as ticket:
+            ticket.claim('exam before the change')
+            prerender.schedule(user, self.render)
+            # the exam render running already is stopped right away though
+            self.assertTrue(ticket.cancelled)
+        self.assertNotIn(user.pk, prerender._timers)
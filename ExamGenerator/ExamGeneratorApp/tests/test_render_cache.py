@@ -0,0 +1,91 @@
+import os
+import tempfile
+import threading
+import time
+
+from django.test import TestCase, override_settings
+
+from . import RenderDirsMixin
+from .. import render_cache
+
+
+@override_settings(RENDER_CACHE_MAX_SIZE=1024 * 1024)
+class RenderCacheTest(RenderDirsMixin, TestCase):
+    '''
+    setUp before each test: an empty cache directory and a work directory with one dependency
+    '''
+
+    def setUp(self):
+        super().setUp()
+        self.work_dir = tempfile.mkdtemp(dir=self.root)
+        self.write('logo.png', 'image')
+        self.write('document.tex', 'document')
+
+    def write(self, name, content, directory=None):
+        with open(os.path.join(directory or self.work_dir, name), 'w') as f:
+            f.write(content)
+
+    def read(self, name):
+        with open(os.path.join(self.work_dir, name)) as f:
+            return f.read()
+
+    def test_key_depends_on_document_and_dependencies(self):
+        key = render_cache.render_key('document', self.work_dir, 'document.tex')
+        self.assertEqual(key, render_cache.render_key('document', self.work_dir, 'document.tex'))
+        self.assertNotEqual(key, render_cache.render_key('other document', self.work_dir, 'document.tex'))
+        self.write('logo.png', 'other image')
+        self.assertNotEqual(key, render_cache.render_key('document', self.work_dir, 'document.tex'))
+
+    def test_key_ignores_render_outputs(self):
+        key = render_cache.render_key('document', self.work_dir, 'document.tex')
+        self.write('document.pdf', 'pdf')
+        self.write('document.aux', 'aux')
+        self.write('err_log.txt', 'timeout')
+        os.makedirs(os.path.join(self.work_dir, 'ExamWithSolution'))
+        self.assertEqual(key, render_cache.render_key('document', self.work_dir, 'document.tex'))
+
+    def test_store_and_lookup(self):
+        key = render_cache.render_key('document', self.work_dir, 'document.tex')
+        self.assertFalse(render_cache.lookup(key, self.work_dir, 'document'))
+        self.write('document.pdf', 'pdf')
+        self.write('document.log', 'log')
+        render_cache.store(key, self.work_dir, 'document')
+
+        # restore the outputs under another document name
+        self.assertTrue(render_cache.lookup(key, self.work_dir, 'exam'))
+        self.assertEqual(self.read('exam.pdf'), 'pdf')
+        self.assertEqual(self.read('exam.log'), 'log')
+
+    def test_evicts_least_recently_used(self):
+        self.write('document.pdf', 'x' * 100)
+        for key in ('a', 'b', 'c'):
+            render_cache.store(key, self.work_dir, 'document')
+        old = time.time() - 100
+        os.utime(render_cache.entry_path('a'), (old, old))
+        os.utime(render_cache.entry_path('b'), (old + 10, old + 10))
+
+        # 'a' is used again, so 'b' is now the least recently used entry
+        self.assertTrue(render_cache.lookup('a', self.work_dir, 'document'))
+        render_cache.evict(250)
+        self.assertTrue(os.path.isdir(render_cache.entry_path('a')))
+        self.assertFalse(os.path.isdir(render_cache.entry_path('b')))
+        self.assertTrue(os.path.isdir(render_cache.entry_path('c')))
+
+    def test_flight_waits_for_holder(self):
+        holder = render_cache.Flight('key')
+        self.assertFalse(holder.join(1))
+        waiter = render_cache.Flight('key')
+        # the holder is still rendering, so a short wait runs out and the waiter goes ahead without the lock
+        self.assertTrue(waiter.join(0.1))
+        self.assertIsNone(waiter.lock_file)
+
+        joined = []
+        thread = threading.Thread(target=lambda: joined.append(waiter.join(5)))
+        thread.start()
+        time.sleep(0.2)
+        holder.release()
+        thread.join()
+        self.assertEqual(joined, [True])
+        self.assertIsNotNone(waiter.lock_file)
+        waiter.release()
+        self.assertFalse(os.path.exists(waiter.path))
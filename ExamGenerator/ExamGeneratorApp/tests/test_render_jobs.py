@@ -0,0 +1,69 @@
+import datetime
+
+from django.contrib.auth.models import User, Group
+from django.test import TestCase, override_settings
+from django.test.client import Client
+from django.urls import reverse
+from django.utils import timezone
+
+from .. import render_jobs
+from ..models import RenderJob
+
+
+@override_settings(RENDER_ASYNC=False)
+class RenderJobTest(TestCase):
+    '''
+    setUp before each test
+    '''
+
+    def setUp(self):
+        self.client = Client()
+        self.user = User.objects.create_user(username='tester', password='test')
+        self.other_user = User.objects.create_user(username='other', password='test')
+        group = Group.objects.create(name='Employee')
+        self.user.groups.add(group)
+        self.other_user.groups.add(group)
+
+    def test_enqueue_runs_task(self):
+        job = render_jobs.enqueue(self.user, 'exam', lambda: {'error_count': 2})
+        self.assertTrue(job.is_finished())
+        self.assertEqual(job.status, 'done')
+        self.assertEqual(job.get_result(), {'error_count': 2})
+
+    def test_failing_task(self):
+        def task():
+            raise ValueError('broken')
+
+        with self.assertRaises(ValueError):
+            render_jobs.enqueue(self.user, 'exam', task)
+        self.assertEqual(RenderJob.objects.get(owner=self.user).status, 'failed')
+
+    def test_status_view(self):
+        job = render_jobs.enqueue(self.user, 'exercise version', lambda: {'redirect': '/examScreen'})
+        self.client.login(username='tester', password='test')
+        response = self.client.get(reverse('render job', kwargs={'pk': job.pk}))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json(), {'status': 'done', 'finished': True, 'redirect': '/examScreen'})
+
+    def test_lost_job_fails(self):
+        # queued by a process that was restarted before running it
+        job = RenderJob.objects.create(owner=self.user, kind='exam')
+        RenderJob.objects.filter(pk=job.pk).update(creationDate=timezone.now() - datetime.timedelta(hours=1))
+        recent = RenderJob.objects.create(owner=self.user, kind='exam')
+        self.client.login(username='tester', password='test')
+        response = self.client.get(reverse('render job', kwargs={'pk': job.pk}))
+        self.assertEqual(response.json()['status'], 'failed')
+        self.assertTrue(response.json()['finished'])
+        recent.refresh_from_db()
+        self.assertEqual(recent.status, 'queued')
+
+    def test_status_view_other_user(self):
+        job = render_jobs.enqueue(self.user, 'exam', lambda: {})
+        self.client.login(username='other', password='test')
+        response = self.client.get(reverse('render job', kwargs={'pk': job.pk}))
+        self.assertEqual(response.status_code, 404)
+
+    def test_status_view_notlogin(self):
+        job = render_jobs.enqueue(self.user, 'exam', lambda: {})
+        response = self.client.get(reverse('render job', kwargs={'pk': job.pk}))
+        self.assertEqual(response.status_code, 302)
@@ -0,0 +1,98 @@
+import os
+import tempfile
+import threading
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.test import TestCase, override_settings
+
+from . import RenderDirsMixin
+from .. import cancellation
+from .. import latex_format
+from .. import render_server
+from ..views import render_pdf
+from ..workdirs import RenderWorkDir
+
+
+@override_settings(RENDER_COMPILER='fake', RENDER_FAKE_DELAY=0, RENDER_FAKE_FAILURE=None)
+class RenderServerTest(RenderDirsMixin, TestCase):
+    '''
+    setUp before each test: the fake compiler, all render directories in a temporary location
+    '''
+
+    def render_settings(self):
+        return {'RENDER_SERVER_SOCKET': os.path.join(self.root, 'render.sock')}
+
+    def setUp(self):
+        super().setUp()
+        self.socket_path = settings.RENDER_SERVER_SOCKET
+        self.user = User.objects.create_user(username='tester', password='test')
+
+    def start_server(self, max_jobs):
+        server = render_server.RenderServer(self.socket_path, 1, max_jobs)
+        thread = threading.Thread(target=server.serve_forever)
+        thread.start()
+        self.addCleanup(thread.join)
+        self.addCleanup(server.server_close)
+        self.addCleanup(server.shutdown)
+        return server
+
+    def compile(self):
+        work_dir = tempfile.mkdtemp(dir=self.root)
+        with open(os.path.join(work_dir, 'document.tex'), 'w') as f:
+            f.write('document')
+        return render_server.request_compile({'compiler': 'fake', 'work_dir': work_dir, 'document_name': 'document.tex',
+                                              'options': [], 'store_dir': None, 'timeout': 5})
+
+    def test_workers_are_recycled(self):
+        self.start_server(max_jobs=1)
+        first, second = self.compile(), self.compile()
+        self.assertEqual((first['passes'], second['passes']), (1, 1))
+        self.assertIn('compile', first['phases'])
+        self.assertNotEqual(first['pid'], second['pid'])
+        self.assertRaises(OSError, render_server.RenderServer, self.socket_path, 1, 1)
+
+    def test_unsafe_requests_are_rejected(self):
+        self.start_server(max_jobs=10)
+        self.assertEqual(os.stat(self.socket_path).st_mode & 0o777, 0o600)
+        request = {'compiler': 'pdflatex', 'work_dir': self.root, 'document_name': 'document.tex', 'options': [],
+                   'store_dir': None, 'timeout': 5}
+        for changes in ({'options': ['--shell-escape']}, {'options': ['-output-directory=/tmp']},
+                        {'compiler': 'fake', 'options': [latex_format.FORMAT_OPTION]}, {'compiler': 'sh'},
+                        {'document_name': '--shell-escape'}, {'document_name': '../document.tex'}):
+            with self.assertLogs('ExamGeneratorApp.render_server', 'WARNING'):
+                reply = render_server.request_compile(dict(request, **changes))
+            self.assertTrue(reply['error'].startswith('Rejected: '))
+        render_server.check_request(dict(request, options=[latex_format.FORMAT_OPTION]))
+
+    def test_render_through_server(self):
+        self.start_server(max_jobs=10)
+        with RenderWorkDir.create(self.user) as work_dir:
+            self.assertTrue(render_pdf(self.user, None, [('Exercise', 'Solution')], work_dir=work_dir))
+            self.assertTrue(work_dir.exists('document.pdf'))
+
+    def test_timeout_in_server(self):
+        # the workers are forked with the settings the server started with
+        with override_settings(RENDER_FAKE_FAILURE='timeout'):
+            self.start_server(max_jobs=10)
+        with RenderWorkDir.create(self.user) as work_dir:
+            self.assertFalse(render_pdf(self.user, None, [('Exercise', 'Solution')], work_dir=work_dir, timeout=0.1))
+            self.assertTrue(work_dir.exists('err_log.txt'))
+
+    def test_superseded_job_is_cancelled(self):
+        work_dir = tempfile.mkdtemp(dir=self.root)
+        with open(os.path.join(work_dir, 'document.tex'), 'w') as f:
+            f.write('document')
+        with cancellation.render_target(self.user, 'exam') as ticket:
+            ticket.claim('old document')
+            state = ticket.state()
+            cancellation.publish(cancellation.RenderTicket(ticket.key, None), 'new document')
+        reply = render_server.compile_job({'compiler': 'fake', 'work_dir': work_dir, 'document_name': 'document.tex',
+                                           'options': [], 'store_dir': None, 'timeout': 5, 'ticket': state})
+        self.assertIn('cancelled', reply)
+        self.assertNotIn('passes', reply)
+
+    def test_fallback_without_server(self):
+        with self.assertLogs('ExamGeneratorApp.render_server', 'WARNING'), RenderWorkDir.create(self.user) as work_dir:
+            self.assertTrue(render_pdf(self.user, None, [('Exercise', 'Solution')], work_dir=work_dir))
+            self.assertTrue(work_dir.exists('document.pdf'))
@@ -0,0 +1,69 @@
+import io
+import json
+import os
+from unittest import mock
+
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+
+from . import RenderDirsMixin
+from ..models import Exercise, ExerciseText, Header, Topic
+
+
+def fake_pdflatex(command, cwd, **kwargs):
+    with open(os.path.join(cwd, 'document.tex'), encoding='utf-8') as f:
+        broken = 'broken' in f.read()
+    if not broken:
+        open(os.path.join(cwd, 'document.pdf'), 'w').close()
+    with open(os.path.join(cwd, 'document.log'), 'w') as f:
+        f.write('! LaTeX Error: broken exercise.\n' if broken else 'Output written on document.pdf\n')
+
+
+@override_settings(RENDER_FORMATS=False)
+@mock.patch('ExamGeneratorApp.admission.run_limited', side_effect=fake_pdflatex)
+class RerenderExercisesTest(RenderDirsMixin, TestCase):
+    '''
+    setUp before each test: one working and one broken exercise, all render directories in a temporary location
+    '''
+
+    def setUp(self):
+        super().setUp()
+        self.state_file = os.path.join(self.root, 'state.json')
+        user = User.objects.create_user(username='tester', password='test')
+        topic = Topic.objects.create(name='Topic')
+        header = Header.objects.create(name='Header', author=user,
+                                       latex_code='\\documentclass{article}\n\\begin{document}\n')
+        self.exercises = []
+        for text in ('Exercise', 'broken Exercise'):
+            exercise_text = ExerciseText.objects.create(latex_code=text, author=user)
+            self.exercises.append(Exercise.objects.create(documentHead=header, modifiable=True, points=1,
+                                                          exerciseText=exercise_text, topic=topic))
+
+    def rerender(self, *args):
+        out = io.StringIO()
+        call_command('rerender_exercises', '--jobs', '1', '--state-file', self.state_file, *args, stdout=out)
+        return out.getvalue()
+
+    def test_renders_and_reports_failures(self, run):
+        output = self.rerender()
+        working, broken = self.exercises
+        self.assertTrue(os.path.exists(os.path.join(self.root, 'media', 'exercises', 'exercise%d' % working.pk,
+                                                    'document.pdf')))
+        self.assertIn('1 exercises rendered, 1 with problems', output)
+        self.assertIn('exercise %d: failed' % broken.pk, output)
+        self.assertIn('LaTeX Error: broken exercise.', output)
+        with open(self.state_file) as f:
+            self.assertEqual(json.load(f)['done'], [working.pk])
+
+    def test_resume_skips_done_exercises(self, run):
+        self.rerender()
+        run.reset_mock()
+        output = self.rerender('--resume', '--force')
+        self.assertIn('1 exercises to render, 1 already done', output)
+        self.assertEqual(run.call_count, 1)
+
+    def test_filter(self, run):
+        output = self.rerender(str(self.exercises[0].pk))
+        self.assertIn('1 exercises to render', output)
+        self.assertIn('1 exercises rendered, 0 with problems', output)
@@ -0,0 +1,74 @@
+import json
+from types import SimpleNamespace
+
+from django.contrib.auth.models import User
+from django.test import TestCase
+
+from .. import score_table
+from ..models import Header
+from ..views import build_document
+
+HEADER = ('\\documentclass{article}\n'
+          '%\\withoutsolutions\n'
+          '\\begin{document}\n'
+          '%begin_disclaimer\n'
+          'Disclaimer\n'
+          '%end_disclaimer\n'
+          '\\begin{tabular}{|c|c|}\n'
+          '\t\\textbf{Maximale Punkte} & 1 \\\\\n'
+          '\\end{tabular}\n')
+
+
+def exercise(points):
+    return SimpleNamespace(points=points, exerciseText=SimpleNamespace(latex_code='Exercise %d' % points),
+                           exerciseSolution=None)
+
+
+class ScoreTableTest(TestCase):
+    '''
+    setUp before each test: a German header with a score tabular
+    '''
+
+    def setUp(self):
+        self.user = User.objects.create_user(username='tester', password='secret')
+        self.header = Header.objects.create(name='Header', author=self.user, latex_code=HEADER, language='German')
+
+    def test_generate_german(self):
+        tabular = ''.join(score_table.generate('German', [exercise(2), exercise(3)]))
+        self.assertEqual(tabular, 'tabular}{|c| |c|c| |c|}\n\t\\hline\n\t\\textbf{Aufgabe} & \\textbf{1} & \\textbf{2} '
+                                  '& \\textbf{$\\sum$} \\\\ \\hline\n\t\\textbf{Maximale Punkte}  & 2 & 3 & 5 \\\\ '
+                                  '\\hline\n\t\\textbf{Erreichte Punkte} & \\quad & \\quad & \\quad  \\\\ \\hline\n'
+                                  '  \\end{')
+
+    def test_generate_english(self):
+        tabular = ''.join(score_table.generate('English', [exercise(2)]))
+        self.assertEqual(tabular, 'tabular}{ | l | |c| |c|}\n\t\\hline\n\t\\textbf{Question} & \\textbf{1} '
+                                  '& \\textbf{$\\sum$} \\\\ \\hline\n\t\\textbf{Points in 1st Round}  &  &  \\\\ '
+                                  '\\hline\n\t\\textbf{Final Points} &  &   \\\\ \\hline\n  \\end{')
+
+    def test_locations_stored_on_save(self):
+        variants = json.loads(self.header.variants)
+        self.assertEqual(set(variants), {'11', '10', '01', '00'})
+        # removing the disclaimer moves the tabular
+        self.assertLess(variants['10']['scoreTable'][0], variants['11']['scoreTable'][0])
+
+        self.header.language = 'Klingon'
+        self.header.save()
+        self.assertIsNone(self.header.variant(True, True)[1])
+
+    def test_build_document(self):
+        document = build_document([exercise(4)], header=self.header)
+        self.assertIn('\\begin{tabular}{|c| |c| |c|}', document)
+        self.assertIn('\\textbf{Maximale Punkte}  & 4 & 4 \\\\', document)
+        self.assertTrue(document.endswith('\\end{tabular}\n\n\nExercise 4\n\n\\end{document}'))
+
+        # previews have no exercises to count
+        preview = build_document(None, content_tuples=[('Preview', '')], header=self.header)
+        self.assertIn('\\begin{tabular}{|c|c|}', preview)
+
+    def test_stale_location(self):
+        # a header changed without being saved again
+        self.header.latex_code = '% a new first line\n' + HEADER
+        document = build_document([exercise(4)], header=self.header)
+        self.assertIn('\\begin{tabular}{|c| |c| |c|}', document)
+        self.assertTrue(document.startswith('% a new first line\n'))
@@ -0,0 +1,69 @@
+import os
+import shutil
+import tempfile
+from unittest import mock
+
+from django.test import TestCase
+
+from .. import staging
+
+
+class StagingTest(TestCase):
+    '''
+    setUp before each test: a source directory with one file and an empty work directory
+    '''
+
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        self.source_dir = os.path.join(self.root, 'file_dependencies')
+        self.work_dir = os.path.join(self.root, 'work')
+        os.makedirs(self.source_dir)
+        os.makedirs(self.work_dir)
+        self.source = os.path.join(self.source_dir, 'image.png')
+        with open(self.source, 'wb') as f:
+            f.write(b'image')
+        staging._methods.clear()
+
+    def tearDown(self):
+        shutil.rmtree(self.root)
+
+    def read_staged(self):
+        with open(os.path.join(self.work_dir, 'image.png'), 'rb') as f:
+            return f.read()
+
+    def test_hardlink(self):
+        self.assertEqual(staging.stage_file(self.source, self.work_dir), 'hardlink')
+        self.assertTrue(os.path.samefile(self.source, os.path.join(self.work_dir, 'image.png')))
+
+    def test_staged_file_is_skipped(self):
+        staging.stage_file(self.source, self.work_dir)
+        self.assertIsNone(staging.stage_file(self.source, self.work_dir))
+
+    def test_changed_file_is_replaced(self):
+        with open(os.path.join(self.work_dir, 'image.png'), 'wb') as f:
+            f.write(b'other')
+        staging.stage_file(self.source, self.work_dir)
+        self.assertEqual(self.read_staged(), b'image')
+
+    @mock.patch('os.link', side_effect=OSError('cross-device link'))
+    @mock.patch('ExamGeneratorApp.staging.reflink', side_effect=OSError('not supported'))
+    def test_fallback(self, reflink, link):
+        self.assertEqual(staging.stage_file(self.source, self.work_dir), 'symlink')
+        self.assertEqual(self.read_staged(), b'image')
+        # the next file goes straight to the method that worked
+        os.remove(os.path.join(self.work_dir, 'image.png'))
+        link.reset_mock()
+        staging.stage_file(self.source, self.work_dir)
+        link.assert_not_called()
+
+    @mock.patch('os.symlink', side_effect=OSError('not supported'))
+    @mock.patch('os.link', side_effect=OSError('cross-device link'))
+    @mock.patch('ExamGeneratorApp.staging.reflink', side_effect=OSError('not supported'))
+    def test_copy(self, reflink, link, symlink):
+        self.assertEqual(staging.stage_file(self.source, self.work_dir), 'copy')
+        self.assertEqual(self.read_staged(), b'image')
+
+    def test_stage_directory(self):
+        staging.stage_directory(self.source_dir, self.work_dir)
+        staging.stage_directory(os.path.join(self.root, 'missing'), self.work_dir)
+        self.assertEqual(os.listdir(self.work_dir), ['image.png'])
@@ -0,0 +1,63 @@
+import os
+from unittest import mock
+
+from django.conf import settings
+from django.contrib.auth.models import User, Group
+from django.test import TestCase
+from django.test.client import Client
+from django.urls import reverse
+
+from . import RenderDirsMixin
+from .. import thumbnails
+from ..models import Exercise, ExerciseText, Header, Topic
+
+
+def fake_pdftoppm(command, cwd, **kwargs):
+    with open(command[-1] + '.png', 'wb') as f:
+        f.write(b'png')
+
+
+class ThumbnailTest(RenderDirsMixin, TestCase):
+    '''
+    setUp before each test: an exercise with a rendered pdf in a temporary media root
+    '''
+
+    def setUp(self):
+        super().setUp()
+        self.media_root = settings.MEDIA_ROOT
+        user = User.objects.create_user(username='tester', password='test')
+        user.groups.add(Group.objects.create(name='Employee'))
+        self.topic = Topic.objects.create(name='Topic')
+        self.exercise = Exercise.objects.create(
+            documentHead=Header.objects.create(name='Header', author=user, latex_code=''), modifiable=True, points=1,
+            topic=self.topic, exerciseText=ExerciseText.objects.create(latex_code='Exercise text', author=user))
+        exercise_dir = os.path.join(self.media_root, 'exercises', 'exercise%d' % self.exercise.pk)
+        os.makedirs(exercise_dir)
+        self.pdf_path = os.path.join(exercise_dir, 'document.pdf')
+        open(self.pdf_path, 'wb').close()
+        self.client = Client()
+        self.client.login(username='tester', password='test')
+
+    @mock.patch('ExamGeneratorApp.admission.run_limited', side_effect=fake_pdftoppm)
+    def test_make_thumbnail(self, run):
+        path = thumbnails.make_thumbnail(self.pdf_path)
+        self.assertEqual(path, self.pdf_path[:-len('.pdf')] + '.png')
+        with open(path, 'rb') as f:
+            self.assertEqual(f.read(), b'png')
+        self.assertEqual(sorted(os.listdir(os.path.dirname(path))), ['document.pdf', 'document.png'])
+
+    @mock.patch('ExamGeneratorApp.admission.run_limited', side_effect=FileNotFoundError)
+    def test_failure_removes_old_thumbnail(self, run):
+        open(thumbnails.thumbnail_path(self.pdf_path), 'wb').close()
+        self.assertIsNone(thumbnails.make_thumbnail(self.pdf_path))
+        self.assertEqual(os.listdir(os.path.dirname(self.pdf_path)), ['document.pdf'])
+
+    @mock.patch('ExamGeneratorApp.thumbnails.make_in_background')
+    def test_exercise_list(self, make_in_background):
+        response = self.client.get(reverse('topic exercise list', args=[self.topic.pk]))
+        self.assertNotContains(response, 'document.png')
+        make_in_background.assert_called_once_with(self.pdf_path)
+
+        open(thumbnails.thumbnail_path(self.pdf_path), 'wb').close()
+        response = self.client.get(reverse('topic exercise list', args=[self.topic.pk]))
+        self.assertContains(response, 'document.png?v=')
@@ -1,9 +1,16 @@
+import os
+from unittest import mock
+
+from django.conf import settings
 from django.contrib.auth.models import User, Group
 from django.test import TestCase
 from django.test.client import Client
 from django.urls import reverse
 from django.utils import timezone
 
+from . import RenderDirsMixin
+from ..admission import RenderBusy
+
 from ..models import Content
 from ..models import Exam
 from ..models import Exercise
@@ -14,7 +21,7 @@ from ..models import Header
 from ..models import Topic
 
 
-class ViewTest(TestCase):
+class ViewTest(RenderDirsMixin, TestCase):
     key_exercise_1 = -1
     key_exercise_2 = -1
     '''
@@ -62,6 +69,7 @@ class ViewTest(TestCase):
     '''
 
     def setUp(self):
+        super().setUp()
         self.client = Client()
         self.user = User.objects.create_user(username='tester', password='test')
         self.group = Group(name="Employee")
@@ -201,6 +209,32 @@ class ViewTest(TestCase):
         response = self.client.get(f'/exercise/{self.key_exercise_1}')
         self.assertEqual(response.status_code, 200)
 
+    @mock.patch('ExamGeneratorApp.views.pdf_render_and_copy', side_effect=RenderBusy('All render slots are taken'))
+    def test_exercisedetail_new_version_render_busy(self, render):
+        self.user.groups.add(self.group)
+        self.client.login(username='tester', password='test')
+        exercise = Exercise.objects.get(pk=self.key_exercise_1)
+        counts = (Exercise.objects.count(), ExerciseText.objects.count())
+        response = self.client.post(reverse('exercise detail', args=[exercise.pk]), {
+            'header_choices': exercise.documentHead.pk, 'exerciseTex': 'Changed', 'solutionTex': 'Solution',
+            'save': 'Save'})
+        self.assertEqual(response.status_code, 503)
+        # the new version has no pdf, it is not kept
+        self.assertEqual((Exercise.objects.count(), ExerciseText.objects.count()), counts)
+
+    @mock.patch('ExamGeneratorApp.render_jobs.enqueue', side_effect=RenderBusy('All render slots are taken'))
+    def test_uploadExercise_render_not_enqueued(self, enqueue):
+        self.user.groups.add(self.group)
+        self.client.login(username='tester', password='test')
+        exercise = Exercise.objects.get(pk=self.key_exercise_1)
+        response = self.client.post(reverse('upload exercise'), {
+            'exerciseTex': 'Exercise', 'topic_choices': exercise.topic.pk, 'header_choices': exercise.documentHead.pk,
+            'points': '1', 'languages': 'DE', 'modifyable': 'Yes', 'render_exercise': 'Render'})
+        self.assertEqual(response.status_code, 503)
+        self.assertTrue(enqueue.called)
+        # the work directory the job would have removed is gone as well
+        self.assertEqual(os.listdir(settings.RENDER_WORK_DIR), [])
+
     def test_exercisedetail_notlogin(self):
         response = self.client.get(reverse('exercise detail', args=[1]))
         self.assertEquals(response.status_code, 302)
@@ -0,0 +1,50 @@
+import os
+
+from django.contrib.auth.models import User
+from django.test import TestCase
+
+from . import RenderDirsMixin
+from ..workdirs import RenderWorkDir, user_temp_dir
+
+
+class RenderWorkDirTest(RenderDirsMixin, TestCase):
+    '''
+    setUp before each test: media and work directories in a temporary location
+    '''
+
+    def setUp(self):
+        super().setUp()
+        self.user = User.objects.create_user(username='tester', password='test')
+
+    def test_unique_directories(self):
+        with RenderWorkDir.create(self.user) as first, RenderWorkDir.create(self.user) as second:
+            self.assertNotEqual(first.path, second.path)
+            self.assertTrue(os.path.isdir(first.path))
+            self.assertTrue(os.path.isdir(second.path))
+        self.assertFalse(os.path.exists(first.path))
+        self.assertFalse(os.path.exists(second.path))
+
+    def test_publish(self):
+        with RenderWorkDir.create(self.user) as work_dir:
+            with open(work_dir.file_path('document.pdf'), 'w') as f:
+                f.write('first')
+            self.assertTrue(work_dir.publish('document.pdf'))
+            self.assertTrue(work_dir.publish('document.pdf', 'exam.pdf'))
+        with open(os.path.join(user_temp_dir(self.user), 'exam.pdf')) as f:
+            self.assertEqual(f.read(), 'first')
+        self.assertEqual(sorted(os.listdir(user_temp_dir(self.user))), ['document.pdf', 'exam.pdf'])
+
+    def test_publish_missing_file_removes_old_version(self):
+        with RenderWorkDir.create(self.user) as work_dir:
+            with open(work_dir.file_path('document.log'), 'w') as f:
+                f.write('log')
+            work_dir.publish('document.log')
+        with RenderWorkDir.create(self.user) as work_dir:
+            self.assertFalse(work_dir.publish('document.log'))
+        self.assertFalse(os.path.exists(os.path.join(user_temp_dir(self.user), 'document.log')))
+
+    def test_stale_directories_are_removed(self):
+        stale = RenderWorkDir.create(self.user)
+        os.utime(stale.path, (0, 0))
+        with RenderWorkDir.create(self.user):
+            self.assertFalse(os.path.exists(stale.path))
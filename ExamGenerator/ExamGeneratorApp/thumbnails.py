@@ -0,0 +1,77 @@
+import os
+import subprocess
+import tempfile
+import threading
+
+from django.conf import settings
+
+from . import admission
+from .render_jobs import get_executor
+
+# pdfs whose thumbnail is made in the background right now, so each is only made once at a time, and pdfs whose
+# thumbnail could not be made, with their modification time, so they are not tried on every page view
+_making = set()
+_failed = set()
+_making_lock = threading.Lock()
+
+
+def thumbnail_path(pdf_path):
+    return os.path.splitext(pdf_path)[0] + '.png'
+
+
+def make_thumbnail(pdf_path):
+    """
+    Renders the first page of a pdf to a png next to it with pdftoppm, e.g. document.png for document.pdf. An old
+    thumbnail is removed first, so a failure never leaves one of a different pdf behind.
+    :param pdf_path: path of the pdf
+    :return: path of the thumbnail, or None if it could not be made
+    """
+    target = thumbnail_path(pdf_path)
+    if os.path.exists(target):
+        os.remove(target)
+    handle, temp_path = tempfile.mkstemp(prefix='.thumbnail-', suffix='.png', dir=os.path.dirname(pdf_path))
+    os.close(handle)
+    try:
+        # with -singlefile pdftoppm writes to the given prefix plus .png
+        admission.run_limited(['pdftoppm', '-png', '-singlefile', '-f', '1', '-l', '1',
+                               '-scale-to-x', str(settings.RENDER_THUMBNAIL_WIDTH), '-scale-to-y', '-1',
+                               os.path.abspath(pdf_path), temp_path[:-len('.png')]],
+                              cwd=os.path.dirname(pdf_path), timeout=settings.RENDER_THUMBNAIL_TIMEOUT)
+        if os.path.getsize(temp_path) == 0:
+            return None
+        os.replace(temp_path, target)
+        return target
+    except (OSError, subprocess.TimeoutExpired):
+        # pdftoppm is not installed or the pdf is broken, the pdf itself is shown instead
+        return None
+    finally:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+
+
+def make_in_background(pdf_path):
+    """
+    Makes the missing thumbnail of a pdf in the render worker pool, e.g. for exercises rendered before thumbnails
+    existed.
+    :param pdf_path: path of the pdf
+    :return: nothing
+    """
+    try:
+        attempt = (pdf_path, os.path.getmtime(pdf_path))
+    except FileNotFoundError:
+        return
+    with _making_lock:
+        if pdf_path in _making or attempt in _failed:
+            return
+        _making.add(pdf_path)
+
+    def run():
+        try:
+            if make_thumbnail(pdf_path) is None:
+                with _making_lock:
+                    _failed.add(attempt)
+        finally:
+            with _making_lock:
+                _making.discard(pdf_path)
+
+    get_executor().submit(run)
@@ -4,8 +4,8 @@ from django.conf.urls.static import static
 from django.contrib.auth import views as auth_views
 from django.contrib.auth.decorators import login_required, user_passes_test
 from django.urls import path, include
-from django.views.static import serve
 
+from . import media
 from . import views
 from .forms import LoginForm
 
@@ -13,7 +13,7 @@ from .forms import LoginForm
 @login_required
 @user_passes_test(has_permission, login_url='/permissionDenied')
 def protected_serve(request, path, document_root=None, show_indexes=False):
-    return serve(request, path, document_root, show_indexes)
+    return media.serve_media(request, path, document_root, show_indexes)
 
 
 urlpatterns = [
@@ -21,6 +21,7 @@ urlpatterns = [
                   path('userPermissions', views.user_permissions_view, name='user permissions'),
                   path('topicOverview', views.topic_overview_view, name='topic overview'),
                   path('downloadPage', views.download_page_view, name='download page'),
+                  path('downloadPage/<str:name>.zip', views.exam_sources_view, name='exam sources'),
                   path('examScreen', views.exam_detail_view, name='exam detail view'),
                   path('removeExercise/<int:position>', views.remove_from_exam, name='delete exercise'),
                   path('signUp', views.sign_up_view, name='sign up'),
@@ -41,6 +42,8 @@ urlpatterns = [
                   path('headers', views.HeaderListView.as_view(), name='header list'),
                   path('header/<int:pk>/edit', views.HeaderUpdateView.as_view(), name='edit header'),
                   path('header/<int:pk>', views.HeaderDetailView.as_view(), name='header detail view'),
-                  path('renderLog', views.LogView.as_view(), name='render log')
+                  path('renderLog', views.LogView.as_view(), name='render log'),
+                  path('renderJob/<int:pk>', views.render_job_status_view, name='render job'),
+                  path('metrics', views.metrics_view, name='metrics')
 
               ] + static((settings.MEDIA_URL), protected_serve, document_root=settings.MEDIA_ROOT)
@@ -1,9 +1,8 @@
 import codecs
-import datetime
 import os
-import re
 import shutil
 import subprocess
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 
 from django.conf import settings
@@ -11,14 +10,34 @@ from django.contrib.auth.decorators import login_required, user_passes_test
 from django.contrib.auth.mixins import UserPassesTestMixin
 from django.contrib.auth.models import User, Group
 from django.core.files.storage import DefaultStorage
+from django.db import connection
 from django.db.models import Q
 from django.forms import modelformset_factory
+from django.http import FileResponse, Http404, HttpResponse, JsonResponse, StreamingHttpResponse
 from django.shortcuts import render, redirect, get_object_or_404
 from django.utils.decorators import method_decorator
 from django.views.decorators.clickjacking import xframe_options_exempt
 from django.views.decorators.csrf import csrf_protect
 from django.views.generic import UpdateView, ListView, DetailView, TemplateView
 
+from . import blob_store
+from . import cancellation
+from . import compile_driver
+from . import compilers
+from . import latex_format
+from . import log_parser
+from . import media
+from . import metrics
+from . import prerender
+from . import render_cache
+from . import render_jobs
+from . import render_server
+from . import score_table
+from . import staging
+from . import thumbnails
+from . import zipstream
+from .admission import RenderBusy
+from .workdirs import RenderWorkDir
 from .forms import SignUpForm, UploadForm, ExerciseDetailForm, LoginForm
 from .forms import TopicForm, HeaderForm, ExamForm
 from .models import *
@@ -75,56 +94,65 @@ def has_permission(user):
         return group in groups or user.is_superuser or user.is_staff
 
 
-def clear_user_temp(user):
+def save_uploaded_files(files, directory):
     """
-    Deletes all files in  a user's temp directory.
-    :param user:
-    :return:
+    Writes uploaded files to a directory, keeping their names.
+    :param files: iterable of uploaded files
+    :param directory: the target directory, has to exist
+    :return: nothing
     """
-    work_dir = Path("ExamGenerator/media/temp/%s" % user.username).absolute()
-    if os.path.isdir(work_dir):
-        files = os.listdir(work_dir)
-        shutil.rmtree(work_dir)
-        os.makedirs(work_dir)
+    for file in files:
+        path = os.path.join(directory, str(file.name))
+        # a staged file of the same name may share its content with a stored dependency, don't write into that
+        if os.path.lexists(path):
+            os.remove(path)
+        with open(path, 'wb') as destination:
+            for chunk in file.chunks():
+                destination.write(chunk)
 
 
-def render_pdf(user, exercises, content_tuples=None, header=None, include_disclaimer=False, files=None,
-               include_solutions=False,
-               document_name=None, clean_directory=True, timeout=25):
+def prepare_header_tex(header, include_solutions, include_disclaimer):
     """
-    Creates a PDF file based on arguments in the user's temp folder. To do this pdflatex command is executed.
-    Pdflatex has to be installed on the system to work. If the command times out, a file called err_log.txt is created,
-    containing the stdout of the process from the first "Error:" onwards
-    :param user: the user making the request
-    :param exercises: iterable of exercises. Always has priority over content_tuples
-    :param content_tuples: list of tuples (exerciseTex,solutionTex). Ignored if exercises is not None
-    :param header: a header object to be used as documenthead
-    :param include_disclaimer: whether or not to include the disclaimer. Only works if disclaimer is surrounded
-    by %begin_disclaimer %end_disclaimer
-    :param files: file iterable of additional file dependencies
-    :param include_solutions: whether or not the solutions are to be included in the pdf. Recommended to have a
-    withoutsolutions command in the latex header and comment it with %. Also works if exercise cleanly split exercise
-    text and solution on database level
-    :param document_name: output file name
-    :param clean_directory: deletes all files in the user's temp directory if True
-    :param timeout: timout for the pdflatex process
-    :return: True if pdlatex finished, False if timeout occurred
-     """
+    Returns the latex code of a header the way it is put in front of the exercises, see Header.variant.
+    :param header: the header object
+    :param include_solutions: whether or not the solutions are to be included
+    :param include_disclaimer: whether or not to include the disclaimer
+    :return: the latex code as string
+    """
+    return header.variant(include_solutions, include_disclaimer)[0]
 
-    # prepare temp directory
-    storage = DefaultStorage()
-    if clean_directory:
-        clear_user_temp(user)
-    work_dir = Path("ExamGenerator/media/temp/%s" % user.username)
-    if not document_name:
-        document_name = 'document.tex'
-    document_path = os.path.join(work_dir, document_name)
-    if not os.path.isdir(work_dir):
-        os.makedirs(work_dir)
-    if not os.path.exists(document_path):
-        open(document_path, 'w', encoding="utf-8").close()
 
+def build_header_formats(header):
+    """
+    Builds the precompiled formats of a header in the render worker pool, one for every distinct preamble the header
+    can be rendered with, see latex_format.build_in_background. Called whenever a header or its file dependencies
+    change. The builds never run in the request, even if RENDER_ASYNC is False, since each can take up to
+    RENDER_FORMAT_TIMEOUT seconds.
+    :param header: the header object
+    :return: list of the Futures of the builds that were started
+    """
+    if not settings.RENDER_FORMATS or not compilers.get_compiler(header).supports_formats:
+        return []
+    preambles = set()
+    for include_solutions in (True, False):
+        for include_disclaimer in (True, False):
+            preamble = latex_format.split_preamble(prepare_header_tex(header, include_solutions, include_disclaimer))
+            if preamble is not None:
+                preambles.add(preamble)
+    dependencies = blob_store.linked_files(header=header)
+    builds = (latex_format.build_in_background(preamble, dependencies) for preamble in preambles)
+    return [build for build in builds if build is not None]
+
+
+def build_document(exercises, content_tuples=None, header=None, include_disclaimer=False, include_solutions=False):
+    """
+    Puts together the latex document of a render: the header followed by the exercises and possibly their solutions.
+    The arguments are the ones of render_pdf.
+    :return: the document as string
+    """
     # load header
+    header_tex = ''
+    location = None
     if not header:
         # this should open a backup header stored as a file on the server. File not included in repository.
 
@@ -135,31 +163,7 @@ def render_pdf(user, exercises, content_tuples=None, header=None, include_discla
         # shutil.copy(os.path.join(settings.MEDIA_ROOT, "CS-UdS-logo.jpg"), work_dir)
         pass
     else:
-        # copy header dependencies to temp folder
-        header_dependencies_dir = settings.MEDIA_ROOT + '/headers/header' + str(header.id)
-        if os.path.exists(header_dependencies_dir):
-            header_files = os.listdir(header_dependencies_dir)
-            for f in header_files:
-                shutil.copy(os.path.join(header_dependencies_dir, f),
-                            work_dir)
-        header_tex = header.latex_code
-
-    # try to use a comment like this to exclude solutions
-    if not include_solutions:
-        header_tex = header_tex.replace('%\\withoutsolutions', '\\withoutsolutions')
-
-    # exclude disclaimer using the comment 'tags' it's supposed to have
-    if not include_disclaimer:
-        header_tex = re.sub(r'%begin_disclaimer.*%end_disclaimer', '%begin_disclaimer\n%end_disclaimer', header_tex,
-                            1,
-                            re.DOTALL | re.MULTILINE)
-
-    # put files from argument in temp
-    if files:
-        for file in files:
-            storage.save(
-                settings.MEDIA_ROOT + '/temp/' + user.username + '/' + str(
-                    file.name), file)
+        header_tex, location = header.variant(include_solutions, include_disclaimer)
 
     # create content, i.e. string together exercise latex
     content = ''
@@ -167,15 +171,7 @@ def render_pdf(user, exercises, content_tuples=None, header=None, include_discla
         content_tuples = []
     if exercises:
         for exercise in exercises:
-            # copy dependencies
-            exercise_dependencies_dir = settings.MEDIA_ROOT + '/exercises/exercise' + str(
-                exercise.id) + '/file_dependencies'
-            if os.path.exists(exercise_dependencies_dir):
-                files = os.listdir(exercise_dependencies_dir)
-                for f in files:
-                    shutil.copy(os.path.join(exercise_dependencies_dir, f),
-                                work_dir)
-                    # create tuples of text and solution
+            # create tuples of text and solution
             exercise_tex = ''
             solution_tex = ''
             if exercise.exerciseText is not None:
@@ -193,216 +189,264 @@ def render_pdf(user, exercises, content_tuples=None, header=None, include_discla
     if 0 == len(content):
         content = content + "\nNo exercises"
 
-    # put together the latex document
-    document = header_tex + "\n\n" + content + "\n\\end{document}"
+    # put together the latex document, with the score tabular adjusted to the exercises (Customer specific)
+    if exercises is None:
+        # previews have no exercises to count
+        location = None
+    if location:
+        start, end = location
+        return ''.join([header_tex[:start], *score_table.generate(header.language, exercises), header_tex[end:],
+                        "\n\n", content, "\n\\end{document}"])
+    return header_tex + "\n\n" + content + "\n\\end{document}"
 
-    # try to adjust the score tabular (Customer specific)
-    try:
-        document = adjust_header(document, header.language, exercises)
-    except AttributeError:
-        pass
-
-    # create the actual file and write the content
-    file = codecs.open(document_path, "w", "utf-8")
-    file.write(document)
-    file.close()
-
-    # run pdflatex. nonstopmode hits enter on every input request pdflatex has on the terminal
-    try:
-        subprocess.run(['pdflatex', '-interaction=nonstopmode', document_name],
-                       cwd=str(
-                           work_dir.absolute()), timeout=timeout, stdout=subprocess.PIPE,
-                       stderr=subprocess.PIPE)
-        return True
-    except subprocess.TimeoutExpired as e:
-        # if a timeout is encountered we write the output into our own log. Otherwise we'll always use the log file
-        # created by a properly finishing pdflatex process
-        err = e.stdout.decode('utf8').partition('Error:')[2]
-        err_log_path = os.path.join(work_dir, 'err_log.txt')
-        err_log = open(err_log_path, 'w', encoding="utf-8")
-        err_log.write(err)
-        err_log.close()
-        return False
 
+def render_pdf(user, exercises, content_tuples=None, header=None, include_disclaimer=False, files=None,
+               include_solutions=False,
+               document_name=None, clean_directory=True, timeout=25, *, work_dir, use_cache=True):
+    """
+    Creates a PDF file based on arguments in a work directory. To do this the
+    compiler of the header is run, pdflatex unless the header or RENDER_COMPILER select another one, see compilers.py.
+    The compiler has to be installed on the system to work. If the command times out, a file called err_log.txt is
+    created, containing the stdout of the process from the first "Error:" onwards
+    :param user: the user making the request
+    :param exercises: iterable of exercises. Always has priority over content_tuples
+    :param content_tuples: list of tuples (exerciseTex,solutionTex). Ignored if exercises is not None
+    :param header: a header object to be used as documenthead
+    :param include_disclaimer: whether or not to include the disclaimer. Only works if disclaimer is surrounded
+    by %begin_disclaimer %end_disclaimer
+    :param files: file iterable of additional file dependencies
+    :param include_solutions: whether or not the solutions are to be included in the pdf. Recommended to have a
+    withoutsolutions command in the latex header and comment it with %. Also works if exercise cleanly split exercise
+    text and solution on database level
+    :param document_name: output file name
+    :param clean_directory: deletes all files in the work directory if True
+    :param timeout: timout for all pdflatex passes together
+    :param work_dir: the RenderWorkDir to render in. Every render uses one of its own and publishes the results, so
+    it doesn't interfere with other renders of the same user
+    :param use_cache: if False, pdflatex is run even if the render cache has the document. The result is still stored
+    :return: True if pdlatex finished, False if timeout occurred
+    Finished renders are stored in the render cache. If the same document was rendered before with the same
+    dependencies, the cached pdf and log are copied to the work directory instead of running pdflatex again. If
+    RENDER_FORMATS is set and the header's preamble was precompiled into a format, pdflatex is run with that format.
+    Dependencies are staged with links where the file system allows it, see staging.stage_file.
+    The log is summarized with log_parser and the summary stored next to it as <name>.log.json.
+    The compiler is rerun until the .aux, .toc and .out files stop changing, at most RENDER_MAX_PASSES times. These
+    files are kept between renders of the same document, so a document that didn't change its references needs one
+    pass only.
+    The time spent in each phase and what the render did are recorded with metrics.trace.
+    Identical renders running at the same time are coalesced with render_cache.Flight: only the first one runs the
+    compiler, the others wait for it and restore its result from the cache.
+    If RENDER_SERVER_SOCKET is set, the compiler is run by the render server, see render_server.py.
+    Inside cancellation.render_target, a newer render of the same target stops the compiler and render_pdf raises
+    cancellation.RenderCancelled instead of returning.
+     """
 
-def find_right_tabular(keyphrase, tex_code):
+    with metrics.trace('render') as render_trace:
+        # prepare temp directory
+        with metrics.phase('prepare'):
+            work_dir = Path(work_dir)
+            if clean_directory and os.path.isdir(work_dir):
+                shutil.rmtree(work_dir)
+            if not document_name:
+                document_name = 'document.tex'
+            document_path = os.path.join(work_dir, document_name)
+            if not os.path.isdir(work_dir):
+                os.makedirs(work_dir)
+            if not os.path.exists(document_path):
+                open(document_path, 'w', encoding="utf-8").close()
+
+        # stage exercise and header dependencies in the work directory
+        with metrics.phase('stage'):
+            header_dependencies = blob_store.linked_files(header=header) if header else []
+            for name, path, _ in blob_store.linked_files(exercises or ()) + header_dependencies:
+                if staging.stage_file(path, work_dir, name):
+                    render_trace.add('staged_files')
+                    render_trace.add('staged_bytes', os.path.getsize(path))
+
+            # put files from argument in temp
+            if files:
+                save_uploaded_files(files, work_dir)
+
+        with metrics.phase('build'):
+            document = build_document(exercises, content_tuples, header, include_disclaimer, include_solutions)
+
+        # create the actual file and write the content
+        with metrics.phase('write'):
+            file = codecs.open(document_path, "w", "utf-8")
+            file.write(document)
+            file.close()
+
+        # identical input renders to the same output, so reuse an earlier pdf and log if there is one
+        compiler = compilers.get_compiler(header)
+        render_trace.details['compiler'] = compiler.name
+        document_stem = os.path.splitext(document_name)[0]
+        log_path = os.path.join(work_dir, document_stem + '.log')
+        with metrics.phase('cache'):
+            cache_key = render_cache.render_key(document, work_dir, document_name, compiler.name)
+            cached = use_cache and render_cache.lookup(cache_key, work_dir, document_stem)
+        if cached:
+            render_trace.add('cache_hits')
+        # a newer render of the same target stops older ones, unless they render the same document
+        cancellation.claim(cache_key)
+        flight = render_cache.Flight(cache_key)
+        if not cached and use_cache:
+            # if the same document is being rendered right now, wait for that render and share its result
+            with metrics.phase('flight'):
+                cached = flight.join(timeout) and render_cache.lookup(cache_key, work_dir, document_stem)
+            if cached:
+                flight.release()
+                render_trace.add('coalesced')
+        if cached:
+            # entries stored before logs were summarized only have the log
+            if not os.path.exists(log_parser.summary_path(log_path)):
+                log_parser.write_summary(log_path)
+            return True
+        render_trace.add('cache_misses')
+
+        format_file = None
+        try:
+            # compile against the header's precompiled format if there is one, so the preamble isn't parsed again
+            options = []
+            if settings.RENDER_FORMATS and header and compiler.supports_formats:
+                preamble = latex_format.split_preamble(document)
+                if preamble is not None:
+                    format_file = latex_format.find(preamble, header_dependencies)
+                    if format_file is None:
+                        latex_format.build_in_background(preamble, header_dependencies)
+            if format_file:
+                options.append(latex_format.install(format_file, work_dir))
+
+            # run the compiler until references are resolved
+            cancellation.check()
+            store_dir = compile_driver.aux_store_dir(user, exercises, document_stem)
+            passes = render_server.compile_document(compiler, work_dir.absolute(), document_name, options=options,
+                                                    store_dir=store_dir, timeout=timeout)
+            render_trace.add('passes', passes)
+            with metrics.phase('summary'):
+                log_parser.write_summary(log_path)
+            with metrics.phase('cache'):
+                render_cache.store(cache_key, work_dir, document_stem)
+            return True
+        except subprocess.TimeoutExpired as e:
+            render_trace.outcome = 'timeout'
+            render_trace.add('timeouts')
+            # if a timeout is encountered we write the output into our own log. Otherwise we'll always use the log
+            # file created by a properly finishing pdflatex process
+            err = e.stdout.decode('utf8').partition('Error:')[2]
+            err_log_path = os.path.join(work_dir, 'err_log.txt')
+            err_log = open(err_log_path, 'w', encoding="utf-8")
+            err_log.write(err)
+            err_log.close()
+            return False
+        except cancellation.RenderCancelled:
+            render_trace.outcome = 'cancelled'
+            raise
+        finally:
+            flight.release()
+            if format_file:
+                latex_format.uninstall(work_dir)
+
+
+def context_add_err_log(context, user, context_key, work_dir=None):
     """
-    (Customer specific)
-    Searches for the tabular to replace.
-    :param keyphrase: The keyphrase is used to find the right tabular to replace. Keyphrase should be a phrase which is
-                      somewhere between "\begin{tabular}" and "\end{tabular}" and furthermore the keyphrase should be
-                      unique.
-    :param tex_code: The tex code of the created exam.
-    :return: Tuple(the tabular to be replaced as a String,True) or Tuple("",False) #the second value of the tuple
-             indicates, whether the search was successful or not.
+    Adds the contents of err_log.txt to the context if the file exists
+    :param context: The context to modify
+    :param user: The user making the request
+    :param context_key: Key for the entry in context dict
+    :param work_dir: the directory the render ran in, if it wasn't the user's temp folder
+    :return: nothing
     """
-    index_max_points = tex_code.find(keyphrase)
-    if index_max_points < 0:
-        return "", False
-
-    all_occurrences_of_tabular = [m.start() for m in re.finditer('tabular', tex_code)]
-
-    start_of_tabular = 0
-    end_of_tabular = float('inf')
-    for occurrence_index in range(len(all_occurrences_of_tabular)):
-        if index_max_points > all_occurrences_of_tabular[occurrence_index] > start_of_tabular:
-            start_of_tabular = all_occurrences_of_tabular[occurrence_index]
-
-        if index_max_points < all_occurrences_of_tabular[occurrence_index] < end_of_tabular:
-            end_of_tabular = all_occurrences_of_tabular[occurrence_index]
-
-    if start_of_tabular != 0 and end_of_tabular != float('inf'):
-        return tex_code[start_of_tabular:end_of_tabular], True
+    storage = DefaultStorage()
+    if work_dir is not None:
+        err_log_path = os.path.join(work_dir, 'err_log.txt')
     else:
-        return "", False
+        err_log_path = storage.path('temp/%s/err_log.txt' % user.username)
+    if os.path.exists(err_log_path):
+        err_log_file = open(err_log_path, encoding='utf-8')
+        err = err_log_file.read()
+        err_log_file.close()
+        context.update({context_key: err})
 
 
-def create_new_tabular(language, exercises):
+def render_log_info(user, filename, context=None):
     """
-    (Customer specific)
-    Creates the score tabular for the created exam.
-    :param language: The language flag of the created exam (English,German)
-    :param exercises: The exercises which are part of the created exam
-    :return: Tuple(the tex code of the adapted score tabular,True) or Tuple("",False) #the second value of the tuple
-             indicates, whether the creation was successful or not
+    Returns the summary of the .log file created by the pdflatex command, see log_parser.summarize. The summary is
+    stored next to the log when rendering, the log is only parsed if it is missing.
+    :param user: user making the request
+    :param filename: name of the .log file
+    :param context: If not None, context dictionary will be updated with the summary: error_count, warning_count,
+    overfull_count, underfull_count, errors and warnings (the first records of these), missing_files
+    :return: number of errors, number of warnings, list of error records
     """
-    count_exercises = len(exercises)
-
-    if language == 'German':
-        new_tabular = "tabular}{|c| "
-
-        for i in range(count_exercises):
-            new_tabular += "|c"
-
-        new_tabular += "| |c|}\n\t\hline\n\t" + "\\" + "textbf{Aufgabe}"
-
-        for i in range(count_exercises):
-            new_tabular += (" & " + "\\" + "textbf{" + str(i + 1) + "}")
-
-        new_tabular += (" & \\textbf{$\sum$} " + "\\" + "\\ " + "\hline\n\t\\textbf{Maximale Punkte} ")
-
-        sum_of_all_points = 0
-        for i in range(count_exercises):
-            new_tabular += f" & {exercises[i].points}"
-            sum_of_all_points += exercises[i].points
-
-        new_tabular += f" & {sum_of_all_points} \\\\ \\hline\n\t"
-        new_tabular += "\\textbf{Erreichte Punkte}"
-
-        for i in range(count_exercises + 1):
-            new_tabular += " & \\quad"
-
-        new_tabular += "  \\\\ \\hline\n  \\end{"
-
-        return new_tabular, True
-
-    elif language == 'English':
-        new_tabular = "tabular}{ | l | "
-
-        for i in range(count_exercises):
-            new_tabular += "|c"
-
-        new_tabular += "| |c|}\n\t\hline\n\t" + "\\" + "textbf{Question}"
-
-        for i in range(count_exercises):
-            new_tabular += (" & " + "\\" + "textbf{" + str(i + 1) + "}")
-
-        new_tabular += (" & \\textbf{$\sum$} " + "\\" + "\\ " + "\hline\n\t\\textbf{Points in 1st Round} ")
-
-        for i in range(count_exercises):
-            new_tabular += " & "
-
-        new_tabular += " &  \\\\ \\hline\n\t"
-        new_tabular += "\\textbf{Final Points}"
-
-        for i in range(count_exercises + 1):
-            new_tabular += " & "
-
-        new_tabular += "  \\\\ \\hline\n  \\end{"
-
-        return new_tabular, True
-
-    else:
-        return "", False
+    storage = DefaultStorage()
+    summary = log_parser.load_summary(storage.path('temp/%s/%s' % (user.username, filename)))
+    if summary is None:
+        return None, None, None
+    if context is not None:
+        context.update(summary)
+    return summary['error_count'], summary['warning_count'], summary['errors']
 
 
-def adjust_header(tex_code, language, exercises):
+def get_render_job(request):
     """
-    (Customer specific)
-    Adapts the score tabular of the created exam, if possible.
-    :param tex_code: The tex code of the created exam
-    :param language: The language flag of the created exam (English,German)
-    :param exercises: The exercises which are part of the created exam
-    :return: the tex code of the exam with the adapted score tabular
+    Returns the render job given by the ?job= query parameter of a request.
+    :param request: current request
+    :return: the RenderJob or None if the request does not refer to a job. Raises Http404 if the job does not belong to
+    the user.
     """
-    if language == 'German':
-        tabular_to_replace, found = find_right_tabular("Maximale Punkte", tex_code)
-
-        if not found:
-            return tex_code
-
-        new_tabular, worked = create_new_tabular(language, exercises)
-        if worked:
-            return tex_code.replace(tabular_to_replace, new_tabular)
-
-    elif language == 'English':
-        tabular_to_replace, found = find_right_tabular("Final Points", tex_code)
-
-        if not found:
-            return tex_code
-
-        new_tabular, worked = create_new_tabular(language, exercises)
-        if worked:
-            return tex_code.replace(tabular_to_replace, new_tabular)
+    job_pk = request.GET.get('job', '')
+    if not job_pk.isdigit():
+        return None
+    render_jobs.fail_lost_jobs(request.user)
+    return get_object_or_404(RenderJob, pk=job_pk, owner=request.user)
 
-    # always return old code if something didn't work
-    return tex_code
 
-
-def context_add_err_log(context, user, context_key):
+def add_render_job_context(context, job, url):
     """
-    Adds the contents of err_log.txt to the context if the file exists
+    Adds the result of a finished render job to the context. If the job is still running, the job itself is added
+    instead, so the page can poll its status and reload once it is done.
     :param context: The context to modify
-    :param user: The user making the request
-    :param context_key: Key for the entry in context dict
+    :param job: the RenderJob
+    :param url: the url of the page, which is reloaded with ?job= once the job is finished
     :return: nothing
+    :raises RenderBusy: if the job was refused by admission control
+    :raises RenderCancelled: if the job was superseded by a newer render
     """
-    storage = DefaultStorage()
-    if storage.exists('temp/%s/err_log.txt' % user.username):
-        err_log_file = open(storage.path('temp/%s/err_log.txt' % user.username), encoding='utf-8')
-        err = err_log_file.read()
-        err_log_file.close()
-        context.update({context_key: err})
+    if job.is_finished():
+        result = job.get_result()
+        if result.get('render_busy'):
+            raise RenderBusy('The render job was refused')
+        if result.get('render_cancelled'):
+            raise cancellation.RenderCancelled('The render job was superseded')
+        context.update(result)
+    else:
+        context.update({'render_job': job,
+                        'render_job_url': '%s?job=%d' % (url, job.pk)})
 
 
-def render_log_info(user, filename, context=None):
+@login_required
+@user_passes_test(has_permission, login_url='/permissionDenied')
+def render_job_status_view(request, pk):
     """
-    Returns selected data from the .log file created by the pdflatex command.
-    :param user: user making the request
-    :param filename: name of the .log file
-    :param context: If not None, context dictionary will be updated with the three values the function returns
-    :return: number of occurrences of "Error:", number of occurrences of "Warning:", the part of the log after the first
-     "Error:"
+    Returns the status of one of the user's render jobs as JSON. Polled by pages waiting for a render.
+    :param request:
+    :param pk: the primary key of the job
     """
-    storage = DefaultStorage()
-    if storage.exists('temp/%s/%s' % (user.username, filename)):
-        log_file = open(storage.path('temp/%s/%s' % (user.username, filename)), encoding='utf-8')
-        log = log_file.read()
-        log_file.close()
-        error_count = log.count('Error:')
-        warning_count = log.count('Warning:')
-        _, e, rest = log.partition('Error:')
-        errors = e + rest
-        errors, _, _ = errors.rpartition('Here is how much of TeX\'s memory you used:')
-        if context is not None:
-            if error_count is not None:
-                context.update({'error_count': error_count})
-            if warning_count is not None:
-                context.update({'warning_count': warning_count})
-            if errors is not None:
-                context.update({'errors': errors})
-        return error_count, warning_count, errors
-    return None, None, None
+    render_jobs.fail_lost_jobs(request.user)
+    job = get_object_or_404(RenderJob, pk=pk, owner=request.user)
+    return JsonResponse({'status': job.status,
+                         'finished': job.is_finished(),
+                         'redirect': job.get_result().get('redirect')})
+
+
+@login_required
+@user_passes_test(can_change_rights, login_url='/permissionDenied')
+def metrics_view(request):
+    """
+    Render metrics of this process for prometheus, see metrics.py. Staff only.
+    :param request:
+    """
+    return HttpResponse(metrics.exposition(), content_type='text/plain; version=0.0.4; charset=utf-8')
 
 
 @login_required
@@ -445,61 +489,58 @@ def next_version_view(request, pk):
     return redirect('exercise detail', pk=next_exercise.pk)
 
 
-def pdf_render_and_copy(user, exercise, clean_temp=True):
+def pdf_render_and_copy(user, exercise, work_dir=None, use_cache=True, timeout=25):
     """
     Renders a PDF of the exercise and copies the pdf file to the exercises directory.
-    :param user: the user is needed to user the appropriate temp folder
+    :param user: the user making the request
     :param exercise: the exercise to render
-    :param clean_temp: deletes all files in user's temp if True
+    :param work_dir: RenderWorkDir to render in. It may already contain file dependencies. If None, a new one is used
+    :param use_cache: passed on to render_pdf
+    :param timeout: passed on to render_pdf
     :return: returns True if the exercise was rendered, False otherwise
     """
-    rendered = render_pdf(user, [exercise], include_solutions=True, header=exercise.documentHead,
-                          clean_directory=clean_temp)
-    if not rendered:
-        return False
-    else:
-        work_dir = Path("ExamGenerator/media/temp/%s" % user.username)
-        pdf_path = os.path.join(work_dir, 'document.pdf')
-
-        exercise_path = settings.MEDIA_ROOT + '/exercises/exercise' + str(
-            exercise.id)
-        if not os.path.exists(exercise_path):
-            os.makedirs(exercise_path)
-        shutil.copy(pdf_path, exercise_path)
-        return True
-
-
-def copy_dependencies_to_workdir(user, exercise):
+    if work_dir is None:
+        with RenderWorkDir.create(user) as work_dir:
+            return pdf_render_and_copy(user, exercise, work_dir, use_cache, timeout)
+    with metrics.trace('exercise'):
+        rendered = render_pdf(user, [exercise], include_solutions=True, header=exercise.documentHead,
+                              clean_directory=False, work_dir=work_dir, use_cache=use_cache, timeout=timeout)
+        if not rendered:
+            return False
+        else:
+            pdf_path = os.path.join(work_dir, 'document.pdf')
+
+            exercise_path = settings.MEDIA_ROOT + '/exercises/exercise' + str(
+                exercise.id)
+            if not os.path.exists(exercise_path):
+                os.makedirs(exercise_path)
+            # pdflatex doesn't create a pdf if the document has fatal errors
+            if os.path.exists(pdf_path):
+                with metrics.phase('publish'):
+                    shutil.copy(pdf_path, exercise_path)
+                with metrics.phase('thumbnail'):
+                    thumbnails.make_thumbnail(os.path.join(exercise_path, 'document.pdf'))
+            return True
+
+
+def copy_dependencies_to_workdir(user, exercise, work_dir):
     """
-    Copies the dependencies of an exercise to the user's temp folder.
+    Stages the dependencies of an exercise in a work directory.
     """
 
-    work_dir = Path("ExamGenerator/media/temp/%s" % user.username)
     if not os.path.isdir(work_dir):
         os.makedirs(work_dir)
-    exercise_dependencies_dir = settings.MEDIA_ROOT + '/exercises/exercise' + str(
-        exercise.id) + '/file_dependencies'
-    if os.path.exists(exercise_dependencies_dir):
-        files = os.listdir(exercise_dependencies_dir)
-        for f in files:
-            shutil.copy(os.path.join(exercise_dependencies_dir, f),
-                        work_dir)
+    for name, path, _ in blob_store.linked_files([exercise]):
+        staging.stage_file(path, work_dir, name)
 
 
 def copy_dependencies(source_exercise, target_exercise):
     """
-    Copies the dependencies of one exercise to the folder of the other exercise
+    Gives the other exercise the dependencies of one exercise. Both refer to the same stored files, nothing is copied
     """
-    source_exercise_dependencies_dir = settings.MEDIA_ROOT + '/exercises/exercise' + str(
-        source_exercise.id) + '/file_dependencies'
-    target_exercise_dependencies_dir = settings.MEDIA_ROOT + '/exercises/exercise' + str(
-        target_exercise.id) + '/file_dependencies'
-    if not os.path.exists(source_exercise_dependencies_dir):
-        return
-    if not os.path.exists(target_exercise_dependencies_dir):
-        os.makedirs(target_exercise_dependencies_dir)
-    for file in os.listdir(source_exercise_dependencies_dir):
-        shutil.copy(os.path.join(source_exercise_dependencies_dir, file), target_exercise_dependencies_dir)
+    # make sure dependencies from before the manifest are in it
+    blob_store.linked_files([source_exercise])
+    blob_store.copy_links(source_exercise, target_exercise)
 
 
 @login_required
@@ -539,8 +580,7 @@ def exercise_detail_view(request, pk):
         'exerciseText': exercise_text_snippet,
         'solutionText': solution_snippet,
         'exercise': exercise,
-        'pdfPath': '%sexercises/exercise%s/document.pdf?time=%s' % (
-            settings.MEDIA_URL, exercise.pk, datetime.datetime.now())
+        'pdfPath': media.versioned_url('exercises/exercise%s/document.pdf' % exercise.pk)
     }
     context.update(create_template_context(request))
 
@@ -561,23 +601,35 @@ def exercise_detail_view(request, pk):
                 exercise_tex = form.cleaned_data.get('exerciseTex')
                 solution_tex = form.cleaned_data.get('solutionTex')
                 document_head = form.cleaned_data.get('header_choices')
-                clear_user_temp(request.user)
-                copy_dependencies_to_workdir(request.user, exercise)
-                uploaded = render_pdf(request.user, None, [(exercise_tex, solution_tex)], header=document_head,
-                                      include_solutions=True, clean_directory=False)
-                if not uploaded:
-                    context_add_err_log(context, request.user, 'timeout_error')
-                else:
-                    # set initial data for form to input used for rendering, set pdf path to temp folder and render page
-                    data = {
-                        'header_choices': document_head,
-                        'exerciseTex': exercise_tex,
-                        'solutionTex': solution_tex,
-                    }
-                    form = ExerciseDetailForm(initial=data)
-                    context.update({'pdfPath': '%stemp/%s/document.pdf' % (settings.MEDIA_URL, request.user.username),
-                                    'form': form})
-                    render_log_info(request.user, 'document.log', context)
+                user = request.user
+
+                def render_preview():
+                    result = {}
+                    with cancellation.render_target(user, 'exercise-%d' % exercise.pk), \
+                            RenderWorkDir.create(user) as work_dir:
+                        copy_dependencies_to_workdir(user, exercise, work_dir)
+                        uploaded = render_pdf(user, None, [(exercise_tex, solution_tex)], header=document_head,
+                                              include_solutions=True, clean_directory=False, work_dir=work_dir)
+                        work_dir.publish('document.pdf')
+                        work_dir.publish('document.log')
+                        work_dir.publish('document.log.json')
+                        if not uploaded:
+                            context_add_err_log(result, user, 'timeout_error', work_dir=work_dir)
+                    if uploaded:
+                        # set initial data for form to input used for rendering and pdf path to temp folder
+                        result.update({'pdfPath': media.versioned_url('temp/%s/document.pdf' % user.username),
+                                       'form_data': {
+                                           'header_choices': document_head.pk,
+                                           'exerciseTex': exercise_tex,
+                                           'solutionTex': solution_tex,
+                                       }})
+                        render_log_info(user, 'document.log', result)
+                    return result
+
+                job = render_jobs.enqueue(user, 'exercise preview', render_preview)
+                add_render_job_context(context, job, reverse('exercise detail', kwargs={'pk': pk}))
+                if 'form_data' in context:
+                    context.update({'form': ExerciseDetailForm(initial=context.pop('form_data'))})
                 return render(request, 'exerciseDetail.html', context)
             # we get here when the user clicked on one of the 'save' buttons
             new_exercise_text = None
@@ -615,49 +667,62 @@ def exercise_detail_view(request, pk):
                     new_solution = None
                 new_exercise.exerciseSolution = new_solution
 
-            # set  redirect target to new exercise
             new_exercise.save()
-            redirect_to = new_exercise.pk
-
-            # render pdf
-            clear_user_temp(request.user)
-            copy_dependencies_to_workdir(request.user, exercise)
-            uploaded = pdf_render_and_copy(request.user, new_exercise, clean_temp=False)
-            if not uploaded:
-                # delete created objects from database if process timed out
+            user = request.user
+            save_and_replace = request.POST.get('save_and_replace')
+
+            def delete_new_version():
                 new_exercise.delete()
-                new_exercise = None
                 if new_solution:
                     new_solution.delete()
                 if new_exercise_text:
                     new_exercise_text.delete()
-                redirect_to = pk
-            else:
+
+            def render_new_version():
+                # render pdf, the new version still needs the file dependencies of the current one
+                try:
+                    with RenderWorkDir.create(user) as work_dir:
+                        copy_dependencies_to_workdir(user, exercise, work_dir)
+                        uploaded = pdf_render_and_copy(user, new_exercise, work_dir)
+                except Exception:
+                    # e.g. RenderBusy or RenderCancelled, a version without pdf must not stay the newest one
+                    delete_new_version()
+                    raise
+                if not uploaded:
+                    # delete created objects from database if process timed out
+                    delete_new_version()
+                    return {'redirect': reverse('exercise detail', kwargs={'pk': pk})}
                 # copy file dependencies for newly created exercise
                 if exercise != new_exercise:
                     copy_dependencies(exercise, new_exercise)
                 # if save and replace, find old exercise in exam and replace with new one
-                if request.POST.get('save_and_replace'):
-                    exam_qs = Exam.objects.filter(author=request.user)
-                    exam = None
-                    if (len(exam_qs) > 0) & (new_exercise is not None):
+                if save_and_replace:
+                    exam_qs = Exam.objects.filter(author=user)
+                    if exam_qs.exists():
                         exam = exam_qs.latest('creationDate')
-                    else:
-                        redirect('add exercise to exam', pk=redirect_to)
-                    contains_exercise = exercise in exam.exercises.all()
-                    if contains_exercise:
-                        content_obj = Content.objects.filter(exam=exam, exercise=exercise)[0]
-                        content_obj.exercise = new_exercise
-                        content_obj.save()
-                        return redirect('exam detail view')
-
-            return redirect('exercise detail', pk=redirect_to)
+                        if exercise in exam.exercises.all():
+                            content_obj = Content.objects.filter(exam=exam, exercise=exercise)[0]
+                            content_obj.exercise = new_exercise
+                            content_obj.save()
+                            return {'redirect': reverse('exam detail view')}
+                # set redirect target to new exercise
+                return {'redirect': reverse('exercise detail', kwargs={'pk': new_exercise.pk})}
+
+            job = render_jobs.enqueue(user, 'exercise version', render_new_version)
+            if not job.is_finished():
+                # wait on the current exercise's page, which follows the job's redirect once it is done
+                return redirect(reverse('exercise detail', kwargs={'pk': pk}) + '?job=%d' % job.pk)
+            return redirect(job.get_result().get('redirect', reverse('exercise detail', kwargs={'pk': pk})))
 
         else:
             return redirect('exercise detail', pk=redirect_to)
 
     else:
-
+        job = get_render_job(request)
+        if job is not None:
+            add_render_job_context(context, job, reverse('exercise detail', kwargs={'pk': pk}))
+            if 'form_data' in context:
+                context.update({'form': ExerciseDetailForm(initial=context.pop('form_data'))})
         return render(request, 'exerciseDetail.html', context)
 
 
@@ -682,15 +747,26 @@ def add_exercise_to_exam_view(request, pk):
         exercise_count = Content.objects.filter(exam=exam).count()
         Content.objects.create(exam=exam, exercise=exercise, position=exercise_count)
 
+    prerender_exam(author)
     return redirect('exam detail view')
 
 
 class LogView(TemplateView):
     """
-    Displays the render log currently in the user's temp folder
+    Displays the summary of the render log currently in the user's temp folder and the beginning of the log. With
+    ?raw=True the complete log is sent as plain text, without reading it into memory.
     """
     template_name = 'renderLog.html'
 
+    def get(self, request, *args, **kwargs):
+        if request.GET.get('raw'):
+            storage = DefaultStorage()
+            log_name = 'temp/%s/document.log' % request.user.username
+            if not storage.exists(log_name):
+                raise Http404('Could not find log')
+            return FileResponse(storage.open(log_name, 'rb'), content_type='text/plain; charset=utf-8')
+        return super().get(request, *args, **kwargs)
+
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
         context.update(create_template_context(self.request))
@@ -698,10 +774,11 @@ class LogView(TemplateView):
         user = self.request.user
         filename = 'document.log'
         if storage.exists('temp/%s/%s' % (user.username, filename)):
-            log_file = open(storage.path('temp/%s/%s' % (user.username, filename)), encoding='utf-8')
-            log = log_file.read()
-            log_file.close()
-            context.update({'log': log})
+            render_log_info(user, filename, context)
+            with storage.open('temp/%s/%s' % (user.username, filename), 'rb') as log_file:
+                log = log_file.read(settings.RENDER_LOG_DISPLAY_SIZE + 1)
+            context.update({'log': log[:settings.RENDER_LOG_DISPLAY_SIZE].decode('utf-8', errors='replace'),
+                            'log_truncated': len(log) > settings.RENDER_LOG_DISPLAY_SIZE})
         else:
             context.update({'log': 'Could not find log'})
         return context
@@ -724,6 +801,15 @@ class TopicExerciseListView(UserPassesTestMixin, ListView):
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
         context.update(create_template_context(self.request))
+        # exercises are shown as thumbnail, those that don't have one yet get it for the next time
+        for exercise in context['exercises']:
+            pdf_path = os.path.join(settings.MEDIA_ROOT, 'exercises', 'exercise%d' % exercise.pk, 'document.pdf')
+            try:
+                # the modification time keeps browsers from showing the thumbnail of an earlier render
+                exercise.thumbnail_version = int(os.path.getmtime(thumbnails.thumbnail_path(pdf_path)))
+            except FileNotFoundError:
+                exercise.thumbnail_version = None
+                thumbnails.make_in_background(pdf_path)
         return context
 
     def test_func(self):
@@ -773,7 +859,12 @@ class HeaderUpdateView(UserPassesTestMixin, UpdateView):
         return context
 
     def form_valid(self, form):
-        return super().form_valid(form)
+        response = super().form_valid(form)
+        build_header_formats(self.object)
+        exam = Exam.objects.filter(author=self.request.user).order_by('-creationDate').first()
+        if exam is not None and exam.documentHead_id == self.object.pk:
+            prerender_exam(self.request.user)
+        return response
 
     def test_func(self):
         user = self.request.user
@@ -848,11 +939,85 @@ def user_permissions_view(request):
     return render(request, 'userPermissions.html', context)
 
 
+def exam_dependency_files(exercises, header):
+    """
+    Lists the file dependencies of all exercises of an exam and of its header where they are stored. If files of
+    different exercises have the same name, the later one wins, the header's files win over all of them.
+    :param exercises: the exercises of the exam
+    :param header: the header of the exam
+    :return: dictionary mapping file names to their paths
+    """
+    return {name: path for name, path, _ in blob_store.linked_files(exercises, header)}
+
+
+def prepare_exam_variant(user, exercises, header, include_solutions):
+    """
+    Renders the exam with or without solutions for the download page in a work directory of its own and publishes the
+    pdf to the user's temp folder. Since nothing is shared between the two variants, both can be prepared at the same
+    time.
+    :param user: the user making the request
+    :param exercises: the exercises of the exam
+    :param header: the header of the exam
+    :param include_solutions: which of the two variants to prepare
+    :return: dictionary containing the timeout error under 'err_with_solution' or 'err_without_solution' if one
+    occurred
+    """
+    result = {}
+    if include_solutions:
+        name = 'ExamWithSolution'
+        context_key = 'err_with_solution'
+    else:
+        name = 'ExamWithoutSolution'
+        context_key = 'err_without_solution'
+
+    with RenderWorkDir.create(user) as work_dir:
+        rendered = render_pdf(user, exercises, header=header, include_disclaimer=True,
+                              include_solutions=include_solutions, document_name=name + '.tex', work_dir=work_dir)
+        with metrics.phase('publish'):
+            work_dir.publish(name + '.pdf')
+        if not rendered:
+            context_add_err_log(result, user, context_key, work_dir=work_dir)
+    return result
+
+
+@login_required
+@user_passes_test(has_permission, login_url='/permissionDenied')
+def exam_sources_view(request, name):
+    """
+    Sends the LaTeX sources of the user's current exam as zip archive: the document and all file dependencies. The
+    archive is built while it is sent, the dependencies are read from where they are stored.
+    :param request:
+    :param name: 'ExamWithSolution' or 'ExamWithoutSolution'
+    :return:
+    """
+    if name not in ('ExamWithSolution', 'ExamWithoutSolution'):
+        raise Http404('Unknown exam variant')
+    exam_qs = Exam.objects.filter(author=request.user)
+    if not exam_qs.exists():
+        return redirect('exam detail view')
+    exam = exam_qs.latest('creationDate')
+    exercises = list(Exercise.objects.filter(exam=exam).order_by('content__position')
+                     .select_related('exerciseText', 'exerciseSolution'))
+    header = exam.documentHead
+
+    document = build_document(exercises, header=header, include_disclaimer=True,
+                              include_solutions=name == 'ExamWithSolution')
+    entries = [(name + '.tex', document.encode('utf-8'))]
+    entries.extend(sorted(exam_dependency_files(exercises, header).items()))
+
+    response = StreamingHttpResponse(metrics.traced_stream('sources', zipstream.stream_zip(entries)),
+                                     content_type='application/zip')
+    response['Content-Disposition'] = 'attachment; filename="%s.zip"' % name
+    return response
+
+
 @login_required
 @user_passes_test(has_permission, login_url='/permissionDenied')
 def download_page_view(request):
     """
     The download page. Users can download PDFs and a zip Folder containing LaTeX and fileDependencies of their created exam.
+    If DOWNLOAD_PARALLEL_RENDER is set, the exam with and without solutions are rendered in parallel. The zip archives
+    are created by exam_sources_view when they are downloaded.
     :param request:
     :return:
     """
@@ -863,75 +1028,100 @@ def download_page_view(request):
         exam = exam_qs.latest('creationDate')
     else:
         return redirect('exam detail view')
-    # Get associated data
-    exercises = Exercise.objects.filter(exam=exam).order_by('content__position')
+    # Get associated data. Texts and solutions are fetched right away, since the exam may be rendered in other threads
+    exercises = list(Exercise.objects.filter(exam=exam).order_by('content__position')
+                     .select_related('exerciseText', 'exerciseSolution'))
 
     header = exam.documentHead
     context = create_template_context(request)
-    # Render
-    rendered = render_pdf(request.user, exercises, header=header, include_disclaimer=True, include_solutions=True,
-                          document_name='ExamWithSolution.tex')
-    if not rendered:
-        context_add_err_log(context, request.user, 'err_with_solution')
-    else:
-        # Only render without solutions if rendering with solutions didn't throw time out exception
-        rendered = render_pdf(request.user, exercises, header=header, include_disclaimer=True,
-                              document_name='ExamWithoutSolution.tex', clean_directory=False)
-        if not rendered:
-            context_add_err_log(context, request.user, 'err_without_solution')
-
-    directory_without_solution = Path(
-        '%s/temp/%s/ExamWithoutSolution/' % (settings.MEDIA_ROOT, request.user.username)).absolute()
-    directory_with_solution = Path(
-        '%s/temp/%s/ExamWithSolution/' % (settings.MEDIA_ROOT, request.user.username)).absolute()
-
-    if not os.path.exists(str(directory_without_solution)):
-        os.makedirs(str(directory_without_solution))
-
-    if not os.path.exists(str(directory_with_solution)):
-        os.makedirs(str(directory_with_solution))
-
-    for exercise in exercises:
-        dependency_path = str(
-            Path('%s/exercises/exercise%s/file_dependencies' % (settings.MEDIA_ROOT, str(exercise.id))))
-
-        if os.path.exists(dependency_path):
-            for file in os.listdir(dependency_path):
-                copyPath = str(Path(str(dependency_path) + "/" + file))
-                shutil.copy(copyPath, str(directory_without_solution))
-                shutil.copy(copyPath, str(directory_with_solution))
-
-    header_dependencies = '%s/headers/header%s' % (settings.MEDIA_ROOT, str(header.id))
+    user = request.user
 
-    if os.path.exists(header_dependencies):
-        for file in os.listdir(header_dependencies):
-            copyPath = str(Path(str(header_dependencies) + "/" + file))
-            shutil.copy(copyPath, str(directory_without_solution))
-            shutil.copy(copyPath, str(directory_with_solution))
+    def prepare_variant(render_trace, ticket, include_solutions):
+        try:
+            with metrics.attach(render_trace), cancellation.attach(ticket):
+                return prepare_exam_variant(user, exercises, header, include_solutions)
+        finally:
+            connection.close()
+
+    def prepare_downloads():
+        # both variants are one render in the metrics, and a newer download render replaces both
+        with metrics.trace('download') as render_trace, cancellation.render_target(user, 'download') as ticket:
+            if settings.DOWNLOAD_PARALLEL_RENDER:
+                result = {}
+                with ThreadPoolExecutor(max_workers=2) as executor:
+                    for variant_result in executor.map(prepare_variant, (render_trace, render_trace),
+                                                       (ticket, ticket), (True, False)):
+                        result.update(variant_result)
+                return result
+
+            result = prepare_exam_variant(user, exercises, header, True)
+            # Only render without solutions if rendering with solutions didn't throw time out exception
+            if 'err_with_solution' not in result:
+                result = prepare_exam_variant(user, exercises, header, False)
+            return result
+
+    # the page is reloaded with ?job= once a render started by an earlier request finished
+    job = get_render_job(request)
+    if job is None:
+        job = render_jobs.enqueue(user, 'download', prepare_downloads)
+    add_render_job_context(context, job, reverse('download page'))
+
+    # Link all created files. The LaTeX sources are zipped when they are downloaded
+    exam_without_solution = media.versioned_url('temp/%s/ExamWithoutSolution.pdf' % user.username)
+    exam_with_solution = media.versioned_url('temp/%s/ExamWithSolution.pdf' % user.username)
 
-    # Link all created files
-    exam_without_solution = '%stemp/%s/ExamWithoutSolution.pdf' % (settings.MEDIA_URL, request.user.username)
-    exam_with_solution = '%stemp/%s/ExamWithSolution.pdf' % (settings.MEDIA_URL, request.user.username)
-    latex_without_solution = Path(
-        'ExamGenerator%stemp/%s/ExamWithoutSolution.tex' % (settings.MEDIA_URL, request.user.username)).absolute()
-    latex_with_solution = Path(
-        'ExamGenerator%stemp/%s/ExamWithSolution.tex' % (settings.MEDIA_URL, request.user.username)).absolute()
+    context.update({'PDFWithSolution': exam_with_solution,
+                    'PDFWithoutSolution': exam_without_solution,
+                    'LatexWithSolution': reverse('exam sources', kwargs={'name': 'ExamWithSolution'}),
+                    'LatexWithoutSolution': reverse('exam sources', kwargs={'name': 'ExamWithoutSolution'})})
+    return render(request, 'downloadPage.html', context)
 
-    shutil.copy(latex_without_solution, directory_without_solution)
-    shutil.copy(latex_with_solution, directory_with_solution)
 
-    zip_without_solution = '%s/temp/%s/ExamWithoutSolution' % (settings.MEDIA_URL, request.user.username)
-    zip_with_solution = '%s/temp/%s/ExamWithSolution' % (settings.MEDIA_URL, request.user.username)
+def render_exam(user, exercises, header, kind='exam', superseded=None):
+    """
+    Renders an exam with solutions and publishes the pdf and the log to the user's temp folder as exam.pdf, where the
+    exam screen shows it.
+    :param user: the author of the exam
+    :param exercises: the exercises of the exam in order
+    :param header: the header of the exam or None
+    :param kind: kind of the render trace, 'exam' or 'prerender'
+    :param superseded: optional callable. If it returns True once the render finished, the result is discarded since
+    a newer render of the exam is on its way
+    :return: dictionary with the timeout error and the log summary for the exam screen
+    """
+    result = {}
+    with metrics.trace(kind) as render_trace, cancellation.render_target(user, 'exam'), \
+            RenderWorkDir.create(user) as work_dir:
+        rendered = render_pdf(user, exercises, include_solutions=True, header=header, document_name='exam',
+                              work_dir=work_dir)
+        if superseded is not None and superseded():
+            render_trace.outcome = 'superseded'
+            return result
+        with metrics.phase('publish'):
+            work_dir.publish('exam.pdf')
+            work_dir.publish('exam.log')
+            work_dir.publish('exam.log.json')
+        if not rendered:
+            context_add_err_log(result, user, 'timeout_error', work_dir=work_dir)
+    render_log_info(user, 'exam.log', result)
+    return result
 
-    shutil.make_archive(str(Path('ExamGenerator' + zip_without_solution).absolute()), 'zip', directory_without_solution)
 
-    shutil.make_archive(str(Path('ExamGenerator' + zip_with_solution).absolute()), 'zip', directory_with_solution)
+def prerender_exam(user):
+    """
+    Renders the user's current exam in the background after it changed, so the pdf is usually ready when the exam
+    screen is opened. Opening it with ?render=True finds the pdf in the render cache then. See prerender.schedule.
+    :param user: the user whose exam changed
+    :return: nothing
+    """
+    def render(superseded):
+        exam = Exam.objects.filter(author=user).order_by('-creationDate').first()
+        if exam is None:
+            return
+        exercises = list(Exercise.objects.filter(exam=exam).order_by('content__position'))
+        render_exam(user, exercises, exam.documentHead, kind='prerender', superseded=superseded)
 
-    context.update({'PDFWithSolution': exam_with_solution,
-                    'PDFWithoutSolution': exam_without_solution,
-                    'LatexWithSolution': zip_with_solution + '.zip',
-                    'LatexWithoutSolution': zip_without_solution + '.zip'})
-    return render(request, 'downloadPage.html', context)
+    prerender.schedule(user, render)
 
 
 @login_required
@@ -956,6 +1146,7 @@ def remove_from_exam(request, position):
     for exercise in following_exercises:
         exercise.position -= 1
         exercise.save()
+    prerender_exam(request.user)
     return redirect('exam detail view')
 
 
@@ -994,14 +1185,17 @@ def exam_detail_view(request):
             return redirect(url)
 
     if request.GET.get('render'):
-        exercises = Exercise.objects.filter(exam=exam).order_by('content__position')
+        exercises = list(Exercise.objects.filter(exam=exam).order_by('content__position'))
         exam_header = None
         if exam.documentHead:
             exam_header = exam.documentHead
-        rendered = render_pdf(request.user, exercises, include_solutions=True, header=exam_header, document_name='exam')
-        if not rendered:
-            context_add_err_log(context, request.user, 'timeout_error')
-        render_log_info(request.user, 'exam.log', context)
+
+        job = render_jobs.enqueue(author, 'exam', lambda: render_exam(author, exercises, exam_header))
+        add_render_job_context(context, job, reverse('exam detail view'))
+    else:
+        job = get_render_job(request)
+        if job is not None:
+            add_render_job_context(context, job, reverse('exam detail view'))
 
     context.update({
         'exercises': content_exercises,
@@ -1011,8 +1205,7 @@ def exam_detail_view(request):
     storage = DefaultStorage()
     rendered = storage.exists('%s/temp/%s/exam.pdf' % (settings.MEDIA_ROOT, request.user))
     if rendered:
-        context.update({'pdfPath': '%stemp/%s/%s?time=%s' % (
-            settings.MEDIA_URL, request.user.username, 'exam.pdf', datetime.datetime.now())})
+        context.update({'pdfPath': media.versioned_url('temp/%s/exam.pdf' % request.user.username)})
     return render(request, 'examScreen.html', context)
 
 
@@ -1161,7 +1354,6 @@ def upload_exercise_view(request):
                 header.save()
                 # get the file dependencies
                 files = request.FILES.getlist('header_files')
-                storage = DefaultStorage()
                 for file in files:
                     # rename them, checking for occurrences with and without file type (i.e. .jpg etc) specified in
                     # the latex
@@ -1173,13 +1365,13 @@ def upload_exercise_view(request):
                     header.latex_code = header.latex_code.replace(alt_file_name, new_file_name_no_type)
                     header.latex_code = header.latex_code.replace(file.name, new_file_name)
                     header.save()
-                    # store them in the corresponding header folder
-                    storage.save(
-                        settings.MEDIA_ROOT + '/headers/header' + str(header.id) + '/' + new_file_name
-                        , file)
+                    # store them once by content and link them to the header
+                    blob_store.add(file, new_file_name, header=header)
+                build_header_formats(header)
                 context.update({'imported_header': True})
             else:
-                context.update({'not_imported_header': True})
+                # show the errors along with the header as it was entered
+                context.update({'not_imported_header': True, 'header_form': header_form})
 
         else:
             # the remaining possible post requests are for importing or rendering an exercise
@@ -1234,9 +1426,7 @@ def upload_exercise_view(request):
                             os.makedirs(exercise_path)
                         # copy the pdf to the exercise's folder
                         shutil.copy(os.path.join(work_dir, 'document.pdf'), exercise_path)
-                        exercise_path = os.path.join(exercise_path, "file_dependencies/")
-                        if not os.path.exists(exercise_path):
-                            os.makedirs(exercise_path)
+                        thumbnails.make_thumbnail(os.path.join(exercise_path, 'document.pdf'))
                         paths, files = storage.listdir(storage_work_dir)
 
                         # copy and rename all files and their occurrences in the tex
@@ -1248,10 +1438,8 @@ def upload_exercise_view(request):
                                 new_file_name_no_type = '{' + new_file_name_no_type + '}'
                                 name_no_type, _, _ = tex_file_name.rpartition('.')
                                 alt_file_name = '{' + name_no_type + '}'
-                                dst_path = Path(settings.MEDIA_ROOT + '/exercises/exercise' + str(
-                                    exercise.id) + '/file_dependencies/' + new_file_name)
                                 src_path = os.path.join(work_dir, file)
-                                shutil.copy(src_path, dst_path)
+                                blob_store.add(src_path, new_file_name, exercise=exercise)
                                 exercise_text.latex_code = exercise_text.latex_code.replace(alt_file_name,
                                                                                             new_file_name_no_type)
                                 exercise_text.latex_code = exercise_text.latex_code.replace(tex_file_name,
@@ -1269,20 +1457,56 @@ def upload_exercise_view(request):
                 # render a pdf of the given latex and files
                 elif request.POST.get('render_exercise'):
                     files = request.FILES.getlist('fileDependencies')
-                    render_pdf(request.user, None, [(exercise_tex, solution_tex)], header=header,
-                               files=files, include_solutions=True)
+                    user = request.user
+                    # uploaded files only live as long as the request, so they are stored right away. The renamed
+                    # copies in the temp folder are used when importing after this
                     storage = DefaultStorage()
-                    # rename the files for easier recognition when importing after this
+                    user_temp = 'temp/%s' % user.username
+                    if storage.exists(user_temp):
+                        for file_name in storage.listdir(user_temp)[1]:
+                            if file_name.startswith('exer-'):
+                                storage.delete('%s/%s' % (user_temp, file_name))
                     for file in files:
+                        # rename the files for easier recognition when importing after this
                         file_name = "exer-" + file.name
                         storage.save(
-                            "%s/temp/%s/%s" % (settings.MEDIA_ROOT, request.user, file_name), file)
-                    render_log_info(request.user, 'document.log', context)
-                    context_add_err_log(context, request.user, 'error')
-                    context.update({'rendered': True})
-                    context.update({'not_imported': True})
-                    context.update({'pdf_path': "%stemp/%s/document.pdf?time=%s" % (
-                        settings.MEDIA_URL, request.user.username, datetime.datetime.now())})
+                            "%s/temp/%s/%s" % (settings.MEDIA_ROOT, user, file_name), file)
+                    work_dir = RenderWorkDir.create(user)
+                    # the form is restored from the job when the page is reloaded after an asynchronous render
+                    form_data = {key: request.POST.get(key) for key in form.fields if key != 'fileDependencies'}
+
+                    def render_upload_preview():
+                        result = {'form_data': form_data}
+                        with work_dir, metrics.trace('upload'), cancellation.render_target(user, 'upload'):
+                            render_pdf(user, None, [(exercise_tex, solution_tex)], header=header,
+                                       include_solutions=True, clean_directory=False, work_dir=work_dir)
+                            with metrics.phase('publish'):
+                                work_dir.publish('document.pdf')
+                                work_dir.publish('document.log')
+                                work_dir.publish('document.log.json')
+                            context_add_err_log(result, user, 'error', work_dir=work_dir)
+                        render_log_info(user, 'document.log', result)
+                        result.update({'rendered': True})
+                        result.update({'not_imported': True})
+                        result.update({'pdf_path': media.versioned_url('temp/%s/document.pdf' % user.username)})
+                        return result
+
+                    try:
+                        save_uploaded_files(files, work_dir)
+                        job = render_jobs.enqueue(user, 'exercise upload', render_upload_preview)
+                    except Exception:
+                        # the job never got to remove the work directory
+                        work_dir.cleanup()
+                        raise
+                    add_render_job_context(context, job, reverse('upload exercise'))
+                    context.pop('form_data', None)
+
+    else:
+        job = get_render_job(request)
+        if job is not None:
+            add_render_job_context(context, job, reverse('upload exercise'))
+            if 'form_data' in context:
+                form = UploadForm(context.pop('form_data'))
 
     context_base = {
         'upload': form,
@@ -1333,6 +1557,7 @@ def change_order_view(request):
             content_old_index.save()
             content_new_index.position = old_index
             content_new_index.save()
+            prerender_exam(request.user)
 
     return redirect('exam detail view')
 
@@ -1372,5 +1597,6 @@ def remove_exercise_by_topic(request, pk):
         for exercise in following_exercises:
             exercise.position -= 1
             exercise.save()
+        prerender_exam(user)
 
     return redirect(return_to)
@@ -0,0 +1,106 @@
+import os
+import shutil
+import tempfile
+import time
+import uuid
+
+from django.conf import settings
+
+# work directories older than this are left over from crashed renders and get deleted
+STALE_AGE = 24 * 60 * 60
+
+
+def user_temp_dir(user):
+    """
+    The user's temp folder. Finished renders are published here, this is where the pages link to.
+    """
+    return os.path.join(settings.MEDIA_ROOT, 'temp', user.username)
+
+
+def remove_stale_work_dirs():
+    """
+    Deletes work directories that were not cleaned up because the process rendering in them died.
+    :return: nothing
+    """
+    now = time.time()
+    for name in os.listdir(settings.RENDER_WORK_DIR):
+        path = os.path.join(settings.RENDER_WORK_DIR, name)
+        try:
+            if now - os.path.getmtime(path) > STALE_AGE:
+                shutil.rmtree(path, ignore_errors=True)
+        except FileNotFoundError:
+            continue
+
+
+class RenderWorkDir:
+    """
+    A directory of its own for a single render, so renders never overwrite each other's files, even if they belong to
+    the same user. Finished files are published to the user's temp folder with publish(). The directory is deleted by
+    cleanup(), or when leaving the with block if used as a context manager:
+
+        with RenderWorkDir.create(user) as work_dir:
+            render_pdf(user, exercises, header=header, work_dir=work_dir)
+            work_dir.publish('document.pdf')
+    """
+
+    def __init__(self, user, path):
+        self.user = user
+        self.path = path
+
+    @classmethod
+    def create(cls, user):
+        """
+        Creates a new, empty work directory for a render of the user.
+        :param user: the user the render belongs to
+        :return: the RenderWorkDir
+        """
+        os.makedirs(settings.RENDER_WORK_DIR, exist_ok=True)
+        remove_stale_work_dirs()
+        return cls(user, tempfile.mkdtemp(prefix='%s-' % user.username, dir=settings.RENDER_WORK_DIR))
+
+    def __fspath__(self):
+        return self.path
+
+    def __str__(self):
+        return self.path
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.cleanup()
+
+    def file_path(self, name):
+        return os.path.join(self.path, name)
+
+    def exists(self, name):
+        return os.path.exists(self.file_path(name))
+
+    def publish(self, name, published_name=None):
+        """
+        Puts a file from the work directory in the user's temp folder. The file is replaced atomically, so a page
+        loading it at the same time sees either the old or the new version, never a partial file. If the render did
+        not create the file, the published version of an earlier render is removed.
+        :param name: name of the file in the work directory
+        :param published_name: name in the user's temp folder, defaults to name
+        :return: True if the file existed and was published, False otherwise
+        """
+        source = self.file_path(name)
+        target_dir = user_temp_dir(self.user)
+        target = os.path.join(target_dir, published_name or name)
+        if not os.path.exists(source):
+            if os.path.exists(target):
+                os.remove(target)
+            return False
+        os.makedirs(target_dir, exist_ok=True)
+        tmp_target = os.path.join(target_dir, '.publish-%s' % uuid.uuid4().hex)
+        try:
+            os.link(source, tmp_target)
+        except OSError:
+            # hard links don't work across file systems
+            shutil.copy(source, tmp_target)
+        os.replace(tmp_target, target)
+        return True
+
+    def cleanup(self):
+        shutil.rmtree(self.path, ignore_errors=True)
@@ -0,0 +1,61 @@
+import io
+import os
+import time
+import zipfile
+
+# files in these formats are compressed already, deflating them again only costs time
+STORED_EXTENSIONS = ('.png', '.jpg', '.jpeg', '.gif', '.pdf', '.zip', '.gz')
+
+CHUNK_SIZE = 64 * 1024
+
+
+class StreamBuffer(io.RawIOBase):
+    """
+    Write-only file object collecting what zipfile writes, so it can be handed out in chunks. zipfile notices that
+    the buffer can't seek and writes the sizes after every file instead of going back to the file header.
+    """
+
+    def __init__(self):
+        super().__init__()
+        self.chunks = []
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self.chunks.append(bytes(data))
+        return len(data)
+
+    def take(self):
+        data = b''.join(self.chunks)
+        self.chunks = []
+        return data
+
+
+def stream_zip(entries):
+    """
+    Builds a zip archive while it is sent, without writing the archive or the files in it to disk.
+    :param entries: iterable of tuples (name in the archive, content). The content is either bytes or the path of a
+    file, which is read in chunks
+    :return: generator of byte strings, the archive in order
+    """
+    buffer = StreamBuffer()
+    date_time = time.localtime()[:6]
+    with zipfile.ZipFile(buffer, 'w') as archive:
+        for name, content in entries:
+            info = zipfile.ZipInfo(name, date_time=date_time)
+            info.external_attr = 0o644 << 16
+            if os.path.splitext(name)[1].lower() in STORED_EXTENSIONS:
+                info.compress_type = zipfile.ZIP_STORED
+            else:
+                info.compress_type = zipfile.ZIP_DEFLATED
+            with archive.open(info, 'w') as destination:
+                if isinstance(content, bytes):
+                    destination.write(content)
+                else:
+                    with open(content, 'rb') as source:
+                        for chunk in iter(lambda: source.read(CHUNK_SIZE), b''):
+                            destination.write(chunk)
+                            yield buffer.take()
+            yield buffer.take()
+    yield buffer.take()